@@ -1,51 +1,66 @@
 # 3_analysis.py
 # ------------------------------------------
-# 本脚本用于对清洗后的成都二手房数据进行可视化分析。
+# 本脚本用于对清洗后的二手房数据进行可视化分析（每次分析一个城市，城市配置见 cities.json）。
 # 主要功能：
 # 1. 加载数据
 # 2. 生成各类可视化图表（地图、柱状图、饼图、散点图、箱线图、词云等）
 # 3. 各函数均返回pyecharts图表对象，供Web端或Jupyter展示
-# 依赖库：pandas, pyecharts
+# 4. 分组统计类图表从预聚合立方体（cube.py）读取数据，可直接传入立方体或 DataFrame
+# 依赖库：pyecharts, cube.py, storage.py
 # ------------------------------------------
 
-import pandas as pd
+import json
 
 from pyecharts import options as opts
+from pyecharts.commons.utils import JsCode
 from pyecharts.charts import Map, Bar, Pie, Scatter, Boxplot, WordCloud, Line
 
+from city_config import get_city
+from cube import as_cube
+from storage import load_mapped_table, load_table
 
-def load_data(filepath='chengdu_cleaned_data.csv'):
+
+def load_data(filepath='chengdu_cleaned_data.parquet', columns=None, mapped=False, districts=None):
     """
     加载清洗后的数据
+    columns: 只读取指定的列（列裁剪读取），默认读取全部列
+    mapped: 为 True 时以内存映射方式读取（多进程服务共享内存，见 storage.load_mapped_table）
+    districts: 只读取这些行政区（标准区名）的数据，其余行组不会被读取
     """
     try:
-        return pd.read_csv(filepath)
+        if districts is not None:
+            return load_table(filepath, columns, districts)
+        return (load_mapped_table if mapped else load_table)(filepath, columns)
     except FileNotFoundError:
         print(f"错误: 未找到清洗后的数据文件 '{filepath}'。请先运行 2_data_cleaner.py。")
         return None
 
 
-def create_price_map(df):
+def create_price_map(data, city=None):
     """
-    生成成都各区平均单价地图
+    生成城市各区平均单价地图
+    data: AggregateCube 或清洗后的 DataFrame（下同）
+    city: 城市代码，决定地图和标题（默认城市见 cities.json）
     """
-    district_price = df.groupby('District')['UnitPrice'].mean().round(0).sort_values(ascending=False)
+    city = get_city(city)
+    district_price = as_cube(data).mean('District', 'UnitPrice').round(0).sort_values(ascending=False)
     c = (
         Map()
-        .add("平均单价(元/平米)", [list(z) for z in zip(district_price.index, district_price.values)], "成都")
+        .add("平均单价(元/平米)", [list(z) for z in zip(district_price.index, district_price.values)], city.map_name)
         .set_global_opts(
-            title_opts=opts.TitleOpts(title="成都各区二手房平均单价"),
+            title_opts=opts.TitleOpts(title=f"{city.name}各区二手房平均单价"),
             visualmap_opts=opts.VisualMapOpts(max_=district_price.max(), is_piecewise=True),
         )
     )
     return c
 
 
-def create_district_bar(df):
+def create_district_bar(data):
     """生成各区房源数量(柱状图)与平均总价(折线图)的混合图 (修正版)"""
-    district_count = df['District'].value_counts()
+    cube = as_cube(data)
+    district_count = cube.counts('District')
     # 确保价格数据与数量数据的顺序一致
-    district_total_price = df.groupby('District')['TotalPrice'].mean().round(2).loc[district_count.index]
+    district_total_price = cube.mean('District', 'TotalPrice').round(2).loc[district_count.index]
 
     bar = (
         Bar()
@@ -94,9 +109,9 @@ def create_district_bar(df):
     return bar
 
 
-def create_layout_pie(df):
+def create_layout_pie(data):
     """生成户型分布饼图 (简化版)"""
-    layout_count = df['Layout'].value_counts().head(10)
+    layout_count = as_cube(data).counts('Layout').head(10)
     
     # 显式地将数据转换为 (key, value) 元组的列表
     data_pair = [
@@ -116,53 +131,126 @@ def create_layout_pie(df):
     return c
 
 
-def create_area_price_scatter(df):
-    """生成面积与总价关系散点图"""
-    c = (
-        Scatter()
-        .add_xaxis(df['Area'].tolist())
-        .add_yaxis("总价(万)", df['TotalPrice'].tolist(), label_opts=opts.LabelOpts(is_show=False))
-        .set_global_opts(
-            title_opts=opts.TitleOpts(title="房屋面积与总价关系散点图"),
-            xaxis_opts=opts.AxisOpts(type_="value", name="面积(平米)"),
-            yaxis_opts=opts.AxisOpts(type_="value", name="总价(万元)"),
-            tooltip_opts=opts.TooltipOpts(formatter="{c0}平米, {c1}万元")
+# 远程加载散点数据的前端脚本：首次加载全视窗数据，缩放后按可见范围重新请求更精细的数据
+_REMOTE_SCATTER_JS = """
+(function (chart, url, maxPoints, seriesPrefix) {
+    var timer = null;
+    function load(view) {
+        var query = new URLSearchParams({max_points: maxPoints});
+        if (view) {
+            query.set('xmin', view[0]); query.set('xmax', view[1]);
+            query.set('ymin', view[2]); query.set('ymax', view[3]);
+        }
+        fetch(url + '?' + query.toString()).then(function (r) { return r.json(); }).then(function (data) {
+            var names = data.series.map(function (s) { return seriesPrefix + s.name; });
+            // 系列按组名固定 id，并整体替换系列：上一视窗的系列不会残留，各组的颜色和图例保持不变
+            chart.setOption({
+                legend: {data: names},
+                series: data.series.map(function (s, i) {
+                    return {id: 'series-' + s.name, name: names[i], type: 'scatter', symbolSize: 6, data: s.data};
+                })
+            }, {replaceMerge: ['series']});
+            if (view) {
+                // 新数据会重置缩放窗口，恢复到用户当前的可见范围（静默，不再触发请求）
+                chart.dispatchAction({type: 'dataZoom', dataZoomIndex: 0, startValue: view[0], endValue: view[1]}, {silent: true});
+                chart.dispatchAction({type: 'dataZoom', dataZoomIndex: 1, startValue: view[2], endValue: view[3]}, {silent: true});
+            }
+        });
+    }
+    chart.on('datazoom', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var model = chart.getModel();
+            var xe = model.getComponent('xAxis', 0).axis.scale.getExtent();
+            var ye = model.getComponent('yAxis', 0).axis.scale.getExtent();
+            load([xe[0], xe[1], ye[0], ye[1]]);
+        }, 250);
+    });
+    load(null);
+})(chart_%(chart_id)s, %(url)s, %(max_points)d, %(prefix)s);
+"""
+
+# 降采样散点的提示框：第三个值为该点聚合的房源数
+_SCATTER_TOOLTIP = JsCode(
+    "function (p) { return '面积: ' + p.value[0] + '平米<br/>总价: ' + p.value[1] + '万元'"
+    " + (p.value[2] > 1 ? '<br/>聚合房源: ' + p.value[2] + ' 套' : ''); }"
+)
+
+
+def _make_remote_scatter(chart, data_url, max_points, series_prefix=''):
+    """为散点图挂载远程数据加载脚本，并加入横纵两个方向的缩放"""
+    chart.add_js_funcs(_REMOTE_SCATTER_JS % {
+        'chart_id': chart.chart_id,
+        'url': json.dumps(data_url),
+        'max_points': max_points,
+        'prefix': json.dumps(series_prefix, ensure_ascii=False),
+    })
+    return [
+        opts.DataZoomOpts(type_="inside", xaxis_index=0, filter_mode="none"),
+        opts.DataZoomOpts(type_="inside", yaxis_index=0, orient="vertical", filter_mode="none"),
+    ]
+
+
+def create_area_price_scatter(df, data_url=None, max_points=2000):
+    """
+    生成面积与总价关系散点图
+    data_url 不为空时，图表不内嵌数据，而是从该接口按视窗加载降采样后的数据
+    """
+    if data_url is None:
+        c = (
+            Scatter()
+            .add_xaxis(df['Area'].tolist())
+            .add_yaxis("总价(万)", df['TotalPrice'].tolist(), label_opts=opts.LabelOpts(is_show=False))
+            .set_global_opts(
+                title_opts=opts.TitleOpts(title="房屋面积与总价关系散点图"),
+                xaxis_opts=opts.AxisOpts(type_="value", name="面积(平米)"),
+                yaxis_opts=opts.AxisOpts(type_="value", name="总价(万元)"),
+                tooltip_opts=opts.TooltipOpts(formatter="{c0}平米, {c1}万元")
+            )
         )
+        return c
+
+    c = Scatter().add_xaxis([]).add_yaxis("总价(万)", [], label_opts=opts.LabelOpts(is_show=False))
+    datazoom_opts = _make_remote_scatter(c, data_url, max_points)
+    c.set_global_opts(
+        title_opts=opts.TitleOpts(title="房屋面积与总价关系散点图"),
+        xaxis_opts=opts.AxisOpts(type_="value", name="面积(平米)"),
+        yaxis_opts=opts.AxisOpts(type_="value", name="总价(万元)"),
+        tooltip_opts=opts.TooltipOpts(formatter=_SCATTER_TOOLTIP),
+        datazoom_opts=datazoom_opts,
     )
     return c
 
 
-def create_decoration_boxplot(df):
-    """生成不同装修情况的房价箱线图 (修正版)"""
+def create_decoration_boxplot(data):
+    """
+    生成不同装修情况的房价箱线图 (修正版)
+    箱线数据 [最小值, Q1, 中位数, Q3, 最大值] 由立方体中的总价分布直方图直接得到
+    """
     # 1. 创建一个空的箱线图对象
     boxplot_chart = Boxplot()
     
-    # 2. 准备X轴数据
-    decorations = df['Decoration'].unique().tolist()
+    # 2. 从立方体读取各装修情况的总价分位数
+    quantiles = as_cube(data).price_quantiles('Decoration')
+    decorations = list(quantiles)
     boxplot_chart.add_xaxis(xaxis_data=decorations)
     
-    # 3. 准备Y轴数据
-    data_by_decoration = [df[df['Decoration'] == d]['TotalPrice'].tolist() for d in decorations]
-    
-    # 4. 使用箱线图对象自己的 prepare_data 方法处理数据
-    prepared_data = boxplot_chart.prepare_data(data_by_decoration)
+    # 3. 添加Y轴数据
+    boxplot_chart.add_yaxis(series_name="总价(万元)", y_axis=[quantiles[d] for d in decorations])
     
-    # 5. 添加Y轴数据
-    boxplot_chart.add_yaxis(series_name="总价(万元)", y_axis=prepared_data)
-    
-    # 6. 设置全局选项
+    # 4. 设置全局选项
     boxplot_chart.set_global_opts(
         title_opts=opts.TitleOpts(title="不同装修情况的房价分布"),
         tooltip_opts=opts.TooltipOpts(trigger="item", axis_pointer_type="shadow")
     )
     
-    # 7. 返回完整的图表对象
+    # 5. 返回完整的图表对象
     return boxplot_chart
 
 
-def create_community_wordcloud(df):
+def create_community_wordcloud(data):
     """生成热门小区词云 (修正版)"""
-    community_counts = df['Community'].value_counts().head(100)
+    community_counts = as_cube(data).top_communities(100)
     
     # 显式地将数据转换为 (key, value) 元组的列表
     data_pair = [
@@ -190,9 +278,26 @@ def create_community_wordcloud(df):
     return c
 
 
-def create_kmeans_scatter(df_clustered):
-    """创建K-Means聚类结果的散点图"""
+def create_kmeans_scatter(df_clustered, data_url=None, max_points=3000):
+    """
+    创建K-Means聚类结果的散点图
+    data_url 不为空时，图表不内嵌数据，而是从该接口按视窗加载各聚类降采样后的数据
+    """
     scatter = Scatter(init_opts=opts.InitOpts(width="100%", height="600px"))
+    global_opts = dict(
+        title_opts=opts.TitleOpts(title="K-Means聚类分析 (面积 vs 总价)"),
+        xaxis_opts=opts.AxisOpts(type_="value", name="面积 (平米)"),
+        yaxis_opts=opts.AxisOpts(type_="value", name="总价 (万元)"),
+        legend_opts=opts.LegendOpts(pos_left="center"),
+    )
+
+    if data_url is not None:
+        scatter.add_xaxis([])
+        global_opts['datazoom_opts'] = _make_remote_scatter(scatter, data_url, max_points, series_prefix='聚类 ')
+        global_opts['tooltip_opts'] = opts.TooltipOpts(formatter=_SCATTER_TOOLTIP)
+        scatter.set_global_opts(**global_opts)
+        return scatter
+
     scatter.add_xaxis(df_clustered['Area'].tolist())
     
     # 为每个聚类添加一个系列
@@ -205,11 +310,6 @@ def create_kmeans_scatter(df_clustered):
             label_opts=opts.LabelOpts(is_show=False),
         )
 
-    scatter.set_global_opts(
-        title_opts=opts.TitleOpts(title="K-Means聚类分析 (面积 vs 总价)"),
-        xaxis_opts=opts.AxisOpts(type_="value", name="面积 (平米)"),
-        yaxis_opts=opts.AxisOpts(type_="value", name="总价 (万元)"),
-        tooltip_opts=opts.TooltipOpts(formatter="面积: {b}平米 <br/> 总价: {c}万元"),
-        legend_opts=opts.LegendOpts(pos_left="center"),
-    )
-    return scatter
\ No newline at end of file
+    global_opts['tooltip_opts'] = opts.TooltipOpts(formatter="面积: {b}平米 <br/> 总价: {c}万元")
+    scatter.set_global_opts(**global_opts)
+    return scatter
@@ -2,12 +2,22 @@
 # ------------------------------------------
 # 本脚本为Flask Web应用入口，负责将分析和机器学习结果以网页形式展示。
 # 主要功能：
-# 1. 启动Web服务，加载数据和模型
+# 1. 启动Web服务，加载数据和缓存的模型结果（数据变化时在后台重新加载数据、重新训练模型，完成后整体切换）
 # 2. 首页展示各类可视化图表和聚类/回归结果
+# 3. /predict 接口：按房源属性预测总价，并发请求合并为小批量推理
+# 4. 多进程部署：配合 gunicorn.conf.py 在主进程预加载数据和模型，工作进程通过写时复制与内存映射共享
+# 5. /metrics 接口：以 Prometheus 文本格式导出请求耗时、图表构建耗时、模型推理耗时等指标
+# 6. /api/history/*: 基于快照历史的各区单价中位数变化、降价房源查询（见 price_history.py）
+# 7. 每个进程服务一个城市（环境变量 HOUSEPRICE_CITY，默认见 cities.json），只读取该城市的数据文件
 # 依赖库：flask, pyecharts, analysis.py, machine_learning.py
 # ------------------------------------------
 
-from flask import Flask, render_template
+import math
+import os
+import threading
+import time
+
+from flask import Flask, Response, g, jsonify, render_template, request, url_for
 from pyecharts.charts import Page
 
 # 导入所有需要的函数
@@ -16,52 +26,437 @@ from analysis import (
     create_area_price_scatter, create_decoration_boxplot, create_community_wordcloud,
     create_kmeans_scatter  # 新增
 )
-from machine_learning import (
-    run_kmeans_clustering, run_price_prediction_model # 新增
-)
+from machine_learning import clustered_frame, kmeans_key, price_model_key, serving_model_key
+from city_config import default_city_code, get_city
+from cube import load_or_build_cube
+from downsample import grid_downsample
+from instrumentation import count, observe, render_prometheus, timed
+from listing_index import LISTING_COLUMNS, ListingIndex
+from model_store import file_fingerprint, load_artifact
+from pipeline import REFRESH_STAGES, built_artifact_keys, run_pipeline
+from price_history import PriceHistory, to_records
+from price_predictor import MicroBatcher, PricePredictor, validate_record
+from response_cache import ResponseCache, cached_response
 
 app = Flask(__name__)
 
-# --- 一次性加载数据和运行模型 ---
-print("Web应用启动，正在加载数据和运行模型...")
-# 加载可视化数据
-df_viz = load_data('chengdu_cleaned_data.csv')
+# 散点图接口和房源查询接口用到的列，只加载这些列（分组统计类图表读取聚合立方体）
+VIZ_COLUMNS = LISTING_COLUMNS
+# 本进程服务的城市
+APP_CITY = os.environ.get('HOUSEPRICE_CITY') or default_city_code()
+CITY = get_city(APP_CITY)
+VIZ_DATA_PATH = CITY.viz_path
+# 散点图接口单次返回的点数上限
+MAX_SCATTER_POINTS = 5000
+# 房源查询接口每页条数上限
+MAX_PAGE_SIZE = 200
+# 预测接口微批处理：每批最多条数、凑批最长等待时间（秒）
+PREDICT_MAX_BATCH = 32
+PREDICT_MAX_WAIT = 0.002
+# 后台检查数据是否变化的间隔（秒）
+MODEL_REFRESH_INTERVAL = 300
+# 由 gunicorn.conf.py 设置：主进程预加载后 fork 出工作进程。此时后台线程在各工作进程 fork 之后启动，
+# 且工作进程不重新训练，只重新加载 pipeline.py 构建好的数据和模型（见 refresh_models 的 train 参数）
+PRELOAD_MODE = os.environ.get('HOUSEPRICE_PRELOAD') == '1'
+
+
+def _current_keys():
+    """根据当前数据文件计算各模型产物的缓存键"""
+    return {
+        'kmeans': kmeans_key(CITY.viz_path),
+        'price_model': price_model_key(CITY.ml_path, CITY.vocab_path),
+        'serving_model': serving_model_key(CITY.ml_path, CITY.vocab_path),
+    }
+
+
+def _load_model_state(keys=None):
+    """
+    从模型缓存加载提供服务所需的结果。
+    keys 为 None 时加载本城市流水线最近一次构建的版本（可能基于旧数据）；
+    没有构建记录时返回 None（由流水线训练），不会借用别的城市的模型。
+    """
+    if keys is None:
+        keys = built_artifact_keys(APP_CITY)
+        if keys is None:
+            return None
+    # 聚类结果包含逐行数据，以内存映射方式加载，多个工作进程共享
+    kmeans_cache_key, kmeans = load_artifact('kmeans', keys['kmeans'], mmap_mode='r')
+    price_cache_key, price = load_artifact('price_model', keys['price_model'])
+    serving_cache_key, serving = load_artifact('serving_model', keys['serving_model'])
+    if kmeans is None or price is None or serving is None:
+        return None
+    try:
+        df_clustered = clustered_frame(kmeans)
+    except FileNotFoundError:
+        # 流式训练的聚类数据文件被删除，等待流水线重建
+        return None
+    return {
+        'keys': {'kmeans': kmeans_cache_key, 'price_model': price_cache_key, 'serving_model': serving_cache_key},
+        'df_clustered': df_clustered,
+        'cluster_summary': kmeans['cluster_summary'],
+        'model_eval': price['evaluation'],
+        'feature_imp': price['feature_importances'],
+        'predictor': PricePredictor(serving, APP_CITY),
+    }
+
+
+def _data_version():
+    """可视化数据的版本：当前文件的内容指纹，文件不存在时为 None"""
+    return file_fingerprint(VIZ_DATA_PATH) if os.path.exists(VIZ_DATA_PATH) else None
+
+
+def _load_data_state():
+    """
+    加载可视化数据、聚合立方体和房源查询索引，三者与数据版本一起组成一个整体，随数据变化整体替换。
+    数据文件不存在时返回 None。
+    """
+    version = _data_version()
+    with timed('app_startup_seconds', stage='load_data'):
+        df_viz = load_data(VIZ_DATA_PATH, columns=VIZ_COLUMNS, mapped=True)
+    if df_viz is None:
+        return None
+    # 聚合立方体：每个数据版本只构建一次，所有分组统计类图表共用
+    with timed('app_startup_seconds', stage='load_cube'):
+        cube = load_or_build_cube(VIZ_DATA_PATH)
+    # 房源查询索引：每个数据版本构建一次，之后只读
+    with timed('app_startup_seconds', stage='build_listing_index'):
+        listing_index = ListingIndex(df_viz)
+    return {'version': version, 'df_viz': df_viz, 'cube': cube, 'listing_index': listing_index}
+
+
+_refresh_lock = threading.Lock()
+
+
+def refresh_models(train=True):
+    """
+    检查数据或超参数是否变化：数据文件变化时重新加载数据、立方体和查询索引；
+    模型产物过期时重新训练。全部准备好后一次性切换 app_state，期间继续使用上一版提供服务。
+    train 为 False 时不训练，只在流水线记录的产物键变化时加载新构建的模型（预加载模式的工作进程）。
+    """
+    global app_state
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        data, models = app_state['data'], app_state['models']
+        version = _data_version()
+        if version is not None and (data is None or data['version'] != version):
+            print("检测到数据文件变化，正在重新加载数据...")
+            data = _load_data_state()
+        if not train:
+            built = built_artifact_keys(APP_CITY)
+            if built is not None and (models is None or models['keys'] != built):
+                print("检测到流水线构建了新模型，正在重新加载...")
+                models = _load_model_state(built) or models
+            keys = None
+        else:
+            keys = _current_keys()
+        if keys is not None and (models is None or models['keys'] != keys):
+            print("检测到数据或参数变化，正在后台重新训练模型...")
+            # 经由流水线构建：先检查数据质量，再并行训练聚类与两个回归模型，未变化的环节直接跳过
+            status = run_pipeline(REFRESH_STAGES, upstream=False, city=APP_CITY)
+            failed = [name for name, s in status.items() if s not in ('built', 'skipped')]
+            if failed:
+                print(f"模型刷新失败（{', '.join(failed)}），继续使用上一版模型。")
+            else:
+                models = _load_model_state(keys)
+                print("模型已更新。")
+        if data is not app_state['data'] or models is not app_state['models']:
+            app_state = {'data': data, 'models': models}
+    except Exception as e:
+        print(f"刷新失败，继续使用上一版数据和模型: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def _refresh_loop(train):
+    while True:
+        refresh_models(train)
+        time.sleep(MODEL_REFRESH_INTERVAL)
+
+
+# --- 一次性加载数据和模型 ---
+print(f"Web应用启动（{CITY.name}），正在加载数据和模型...")
+# 当前提供服务的数据（data）与模型（models），刷新时整体替换；各请求开始时取一次引用，保证前后一致
+# 优先加载缓存的模型结果；没有任何缓存时（首次运行）同步训练
+app_state = {'data': _load_data_state(), 'models': _load_model_state()}
+if app_state['models'] is None:
+    refresh_models()
+# 渲染好的首页缓存，数据或模型版本变化时自动失效
+page_cache = ResponseCache()
+# 预测请求的微批处理器：每批使用当时最新的服务模型
+predict_batcher = MicroBatcher(lambda records: app_state['models']['predictor'].predict_records(records),
+                               max_batch=PREDICT_MAX_BATCH, max_wait=PREDICT_MAX_WAIT, start=False)
 
-# 执行K-Means聚类
-df_clustered, cluster_summary = run_kmeans_clustering()
 
-# 执行回归模型
-model_eval, feature_imp = run_price_prediction_model()
+def start_background_tasks(refresh=True, train=True):
+    """
+    启动后台线程：微批处理器，以及（refresh 为 True 时）定期检查数据变化的刷新线程。
+    train 为 False 时刷新线程只重新加载数据和流水线已构建的模型，不在本进程中训练。
+    """
+    predict_batcher.start()
+    if refresh:
+        threading.Thread(target=_refresh_loop, args=(train,), daemon=True).start()
+
+
+# 预加载模式下线程不能跨越 fork，由 gunicorn.conf.py 的 post_fork 在每个工作进程中启动
+if not PRELOAD_MODE:
+    start_background_tasks()
 print("数据和模型准备就绪！")
 # --- 结束 ---
 
+def render_index(data, state):
+    """渲染首页：生成所有可视化图表并填充模板（data 为数据状态，state 为模型状态）"""
+    cube = data['cube']
+    # 1. 创建可视化图表（逐个计时）
+    builders = [
+        ('price_map', lambda: create_price_map(cube, APP_CITY)),
+        ('district_bar', lambda: create_district_bar(cube)),
+        ('kmeans_scatter', lambda: create_kmeans_scatter(state['df_clustered'], data_url=url_for('kmeans_scatter_data'))),  # 按视窗加载降采样数据
+        ('layout_pie', lambda: create_layout_pie(cube)),
+        ('community_wordcloud', lambda: create_community_wordcloud(cube)),
+    ]
+    page = Page(layout=Page.SimplePageLayout)
+    for chart, build in builders:
+        with timed('chart_build_seconds', chart=chart):
+            page.add(build())
+
+    # 2. 将所有结果传递给模板
+    with timed('page_render_seconds', page='index'):
+        return render_template(
+            'index.html',
+            city_name=CITY.name,
+            chart_component=page.render_embed(),
+            # 传递机器学习结果
+            cluster_summary_html=state['cluster_summary'].to_html(classes='table table-striped text-center'),
+            model_eval=state['model_eval'],
+            feature_imp_html=state['feature_imp'].to_frame(name='Importance').to_html(classes='table table-striped text-center')
+        )
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    """记录每个请求的耗时和状态码（按路由端点分组）"""
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        observe('http_request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+    count('http_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标导出"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     """
     首页路由，展示所有可视化图表和分析结果。
+    渲染结果按数据与模型版本缓存，并支持 ETag/Last-Modified 条件请求和 gzip 压缩。
     """
-    if df_viz is None:
+    data, state = app_state['data'], app_state['models']
+    if data is None or data['cube'] is None or state is None:
         return "数据文件未找到，请先运行抓取和清洗脚本。"
 
-    # 1. 创建可视化图表
-    page = Page(layout=Page.SimplePageLayout)
-    page.add(
-        create_price_map(df_viz),
-        create_district_bar(df_viz),
-        create_kmeans_scatter(df_clustered),  # 使用新的聚类散点图
-        create_layout_pie(df_viz),
-        create_community_wordcloud(df_viz),
-    )
-    
-    # 2. 将所有结果传递给模板
-    return render_template(
-        'index.html',
-        chart_component=page.render_embed(),
-        # 传递机器学习结果
-        cluster_summary_html=cluster_summary.to_html(classes='table table-striped text-center'),
-        model_eval=model_eval,
-        feature_imp_html=feature_imp.to_frame(name='Importance').to_html(classes='table table-striped text-center')
-    )
+    version = (data['version'], state['keys']['kmeans'], state['keys']['price_model'])
+    rendered = page_cache.get('index', version, lambda: render_index(data, state))
+    return cached_response(rendered, request)
+
+def _number_arg(name, convert=float, default=None, minimum=None):
+    """
+    读取数值查询参数：缺省时返回 default，无法解析、不是有限数或小于 minimum 时抛出 ValueError（接口返回400）。
+    """
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return default
+    try:
+        value = convert(raw)
+    except ValueError:
+        raise ValueError(f'参数 {name} 必须是{"整数" if convert is int else "数字"}: {raw}') from None
+    if not math.isfinite(value):
+        raise ValueError(f'参数 {name} 必须是有限数字: {raw}')
+    if minimum is not None and value < minimum:
+        raise ValueError(f'参数 {name} 不能小于 {minimum}: {raw}')
+    return value
+
+
+def _scatter_args():
+    """解析散点图接口的视窗与点数参数（max_points 至少为1，超过 MAX_SCATTER_POINTS 时截断）"""
+    bounds = tuple(_number_arg(k) for k in ('xmin', 'xmax', 'ymin', 'ymax'))
+    max_points = min(_number_arg('max_points', int, default=2000, minimum=1), MAX_SCATTER_POINTS)
+    return bounds, max_points
+
+
+@app.route('/api/scatter/area-price')
+def area_price_scatter_data():
+    """面积-总价散点数据（按视窗网格降采样）"""
+    data = app_state['data']
+    if data is None:
+        return jsonify({'error': '数据文件未找到'}), 404
+    df_viz = data['df_viz']
+    try:
+        bounds, max_points = _scatter_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result = grid_downsample(df_viz['Area'].to_numpy(), df_viz['TotalPrice'].to_numpy(), max_points, bounds)
+    for series in result['series']:
+        series['name'] = '总价(万)'
+    return jsonify(result)
+
+
+@app.route('/api/scatter/kmeans')
+def kmeans_scatter_data():
+    """K-Means 聚类散点数据（各聚类分别按视窗网格降采样）"""
+    state = app_state['models']
+    if state is None:
+        return jsonify({'error': '模型结果未就绪'}), 404
+    df = state['df_clustered']
+    try:
+        bounds, max_points = _scatter_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result = grid_downsample(df['Area'].to_numpy(), df['TotalPrice'].to_numpy(), max_points, bounds,
+                             groups=df['Cluster'].to_numpy())
+    return jsonify(result)
+
+
+# 房源查询接口的参数名 -> 列名
+_CATEGORY_PARAMS = {
+    'district': 'District', 'sub_district': 'SubDistrict', 'decoration': 'Decoration',
+    'elevator': 'Elevator', 'rooms': 'RoomCount',
+}
+_INTEGER_PARAMS = {'rooms'}   # 取值必须为整数的类别参数
+_RANGE_PARAMS = {'price': 'TotalPrice', 'unit_price': 'UnitPrice', 'area': 'Area'}
+_SORT_PARAMS = {'id': 'id', 'price': 'TotalPrice', 'unit_price': 'UnitPrice', 'area': 'Area'}
+
+
+def _listing_query_args():
+    """
+    解析房源查询参数。类别参数可重复或以逗号分隔多个取值；
+    范围参数为 min_<名称> / max_<名称>；sort 前加 '-' 表示降序。
+    """
+    categories = {}
+    for param, col in _CATEGORY_PARAMS.items():
+        values = [v for raw in request.args.getlist(param) for v in raw.split(',') if v]
+        if param in _INTEGER_PARAMS:
+            for value in values:
+                if not value.lstrip('-').isdigit():
+                    raise ValueError(f'参数 {param} 必须是整数: {value}')
+        if values:
+            categories[col] = values
+    ranges = {}
+    for param, col in _RANGE_PARAMS.items():
+        low = _number_arg(f'min_{param}')
+        high = _number_arg(f'max_{param}')
+        if low is not None or high is not None:
+            ranges[col] = (low, high)
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    if sort.lstrip('-') not in _SORT_PARAMS:
+        raise ValueError(f'不支持的排序字段: {sort}')
+    limit = min(_number_arg('limit', int, default=20, minimum=1), MAX_PAGE_SIZE)
+    return {
+        'categories': categories, 'ranges': ranges, 'sort': _SORT_PARAMS[sort.lstrip('-')],
+        'descending': descending, 'limit': limit, 'cursor': request.args.get('cursor'),
+    }
+
+
+@app.route('/api/listings')
+def listings():
+    """
+    房源查询：按区、板块、价格/面积区间、室数、装修、电梯过滤，支持排序和游标分页。
+    例：/api/listings?district=武侯区&min_price=100&max_price=200&rooms=2,3&sort=-price&limit=20
+    """
+    data = app_state['data']
+    if data is None:
+        return jsonify({'error': '数据文件未找到'}), 404
+    try:
+        result = data['listing_index'].query(**_listing_query_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+
+def _history():
+    """读取本城市的快照历史（只读 index.json，新记录的快照即时可见）"""
+    history = PriceHistory(CITY.history_dir)
+    return history if history.snapshots else None
+
+
+def _history_args():
+    districts = [v for raw in request.args.getlist('district') for v in raw.split(',') if v] or None
+    last = request.args.get('last', type=int)
+    if last is not None and last < 2:
+        raise ValueError('last 至少为 2')
+    return districts, last
+
+
+@app.route('/api/history/district-change')
+def history_district_change():
+    """
+    近 N 个快照各区单价中位数的变化（读取预先计算的聚合值）。
+    例：/api/history/district-change?last=4&district=武侯区,锦江区
+    """
+    history = _history()
+    if history is None:
+        return jsonify({'error': '没有快照历史，请先运行 price_history.py'}), 404
+    try:
+        districts, last = _history_args()
+        result = history.district_median_change(last or 2, districts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': to_records(result)})
+
+
+@app.route('/api/history/price-drops')
+def history_price_drops():
+    """
+    近 N 个快照中总价累计下降超过 min_drop（百分比）的在售房源，按降幅排序。
+    例：/api/history/price-drops?min_drop=10&last=4&district=武侯区&limit=50
+    """
+    history = _history()
+    if history is None:
+        return jsonify({'error': '没有快照历史，请先运行 price_history.py'}), 404
+    try:
+        districts, last = _history_args()
+        min_drop = request.args.get('min_drop', 10, type=float)
+        result = history.price_drops(min_drop / 100, last, districts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
+    return jsonify({'total': len(result), 'items': to_records(result.head(limit))})
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    预测总价（万元）。请求体为 JSON 对象，字段：district, sub_district, area, layout,
+    decoration, orientation, elevator, year（district 与 area 必填）。
+    单条请求经微批处理器与其他并发请求合并推理；请求体为数组时整批直接推理。
+    """
+    state = app_state['models']
+    if state is None:
+        return jsonify({'error': '模型结果未就绪'}), 503
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list) and not payload:
+        return jsonify({'error': '请求体数组不能为空'}), 400
+    records = payload if isinstance(payload, list) else [payload]
+    for i, record in enumerate(records):
+        error = validate_record(record)
+        if error:
+            return jsonify({'error': error, 'index': i}), 400
+
+    if isinstance(payload, list):
+        prices = [round(float(p), 2) for p in state['predictor'].predict_records(records)]
+        return jsonify({'predicted_total_price': prices, 'unit': '万元'})
+    return jsonify({'predicted_total_price': round(predict_batcher.predict(payload), 2), 'unit': '万元'})
+
 
 if __name__ == '__main__':
     print("请在浏览器中打开 http://127.0.0.1:5000")
@@ -0,0 +1,291 @@
+# benchmark_suite.py
+# ------------------------------------------
+# 本脚本为整条数据流水线提供端到端基准测试。
+# 主要功能：
+# 1. 用 synthetic_data.py 生成指定规模（如 10k / 100k / 1M / 10M 行）的模拟原始数据
+# 2. 分别统计各环节的耗时和内存：页面解析（bs4 / lxml）、clean_data、analysis.py 中的每个
+#    create_* 图表、run_kmeans_clustering、run_price_prediction_model，以及通过 Flask 测试客户端
+#    请求首页
+# 3. 结果写入 JSON 文件；compare 子命令与保存的基线对比，超过阈值的环节标记为性能退化
+# 每个数据规模在独立的子进程和临时目录中运行，互不影响内存统计。
+# 用法：
+#   python benchmark_suite.py run [--sizes 10k,100k] [--output benchmark_results.json]
+#   python benchmark_suite.py compare 基线.json 本次结果.json [--threshold 0.2]
+# 依赖库：pandas, numpy, synthetic_data.py 及流水线各模块
+# ------------------------------------------
+
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# 页面解析环节最多解析的行数（bs4 解析千万行需要数小时，按此上限测量吞吐量）
+MAX_PARSE_ROWS = 100_000
+# 对比时忽略的小差异：耗时差不足 MIN_SECONDS_DELTA 秒、内存差不足 MIN_MEMORY_DELTA_MB 时不算退化
+MIN_SECONDS_DELTA = 0.05
+MIN_MEMORY_DELTA_MB = 20
+# 可选的测量环节（模拟数据总是先生成）
+DEFAULT_STAGES = [
+    'parse_page', 'clean_data', 'charts', 'run_kmeans_clustering',
+    'run_price_prediction_model', 'index',
+]
+
+
+def parse_size(text):
+    """'10k' / '1M' / '10000' -> 10000 / 1000000 / 10000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+# ==================== 测量 ====================
+
+def _current_rss_mb():
+    """当前进程常驻内存（MB），不支持 /proc 的平台返回历史峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageMeter:
+    """
+    测量一个环节的耗时与内存：后台线程每 10 毫秒采样一次常驻内存，
+    得到环节内的内存峰值以及相对环节开始时的增量。
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.results = []
+
+    def measure(self, size, stage, fn, rows=None):
+        gc.collect()
+        baseline = _current_rss_mb()
+        peak = [baseline]
+        running = threading.Event()
+        running.set()
+
+        def sample():
+            while running.is_set():
+                peak[0] = max(peak[0], _current_rss_mb())
+                time.sleep(self.interval)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            result = fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            running.clear()
+            sampler.join()
+        peak[0] = max(peak[0], _current_rss_mb())
+        entry = {
+            'size': size, 'stage': stage, 'rows': rows if rows is not None else size,
+            'seconds': round(elapsed, 4), 'peak_rss_mb': round(peak[0], 1),
+            'rss_delta_mb': round(peak[0] - baseline, 1),
+        }
+        self.results.append(entry)
+        print(f"  {stage:<36} {elapsed:9.3f} s  峰值 {peak[0]:8.1f} MB  增量 {peak[0] - baseline:8.1f} MB",
+              flush=True)
+        return result
+
+
+# ==================== 单个规模的基准测试（在子进程中运行） ====================
+
+def _bench_parse(meter, size, parse_rows):
+    from listing_parser import parse_page_lxml
+    from scraper import parse_page
+    from synthetic_data import generate_raw, iter_listing_pages
+
+    pages = list(iter_listing_pages(generate_raw(parse_rows, seed=7)))
+    meter.measure(size, 'parse_page (bs4)', lambda: [parse_page(h, d) for h, d in pages], parse_rows)
+    meter.measure(size, 'parse_page (lxml)', lambda: [parse_page_lxml(h, d) for h, d in pages], parse_rows)
+
+
+def _bench_charts(meter, size):
+    import analysis
+    from cube import CUBE_COLUMNS, AggregateCube
+    from downsample import grid_downsample
+    from storage import load_table
+
+    df = meter.measure(size, 'chart: load cube columns', lambda: load_table('chengdu_cleaned_data.parquet',
+                                                                         columns=CUBE_COLUMNS))
+    cube = meter.measure(size, 'chart: build cube', lambda: AggregateCube.from_frame(df))
+    del df
+    charts = {
+        'create_price_map': lambda: analysis.create_price_map(cube),
+        'create_district_bar': lambda: analysis.create_district_bar(cube),
+        'create_layout_pie': lambda: analysis.create_layout_pie(cube),
+        'create_decoration_boxplot': lambda: analysis.create_decoration_boxplot(cube),
+        'create_community_wordcloud': lambda: analysis.create_community_wordcloud(cube),
+        # 散点图与 app.py 一致：不内嵌数据，由接口按视窗返回降采样数据
+        'create_area_price_scatter': lambda: analysis.create_area_price_scatter(None, data_url='/api/scatter/area-price'),
+        'create_kmeans_scatter': lambda: analysis.create_kmeans_scatter(None, data_url='/api/scatter/kmeans'),
+    }
+    for name, build in charts.items():
+        meter.measure(size, f'chart: {name}', lambda build=build: build().dump_options())
+
+    points = load_table('chengdu_cleaned_data.parquet', columns=['Area', 'TotalPrice'])
+    meter.measure(size, 'chart: grid_downsample', lambda: grid_downsample(points['Area'].to_numpy(),
+                                                                          points['TotalPrice'].to_numpy()))
+
+
+def _bench_index(meter, size):
+    from machine_learning import run_serving_model
+
+    # 首页依赖的服务模型先训练好，避免计入应用启动时间
+    meter.measure(size, 'run_serving_model', lambda: run_serving_model(use_cache=False))
+    app_module = meter.measure(size, 'app startup', lambda: __import__('app'))
+    client = app_module.app.test_client()
+    cold = meter.measure(size, 'index (首次渲染)', lambda: client.get('/'))
+    meter.measure(size, 'index (缓存命中)', lambda: client.get('/'))
+    meter.measure(size, 'index (304)', lambda: client.get('/', headers={'If-None-Match': cold.headers.get('ETag', '')}))
+
+
+def run_size(size, workdir, stages, parse_rows=MAX_PARSE_ROWS, chunksize=None):
+    """在 workdir 中跑完一个数据规模的所有环节，返回测量结果列表"""
+    os.chdir(workdir)
+    meter = StageMeter()
+    print(f"\n=== {size} 行 ===", flush=True)
+
+    from synthetic_data import write_raw_dataset
+    meter.measure(size, 'generate raw dataset', lambda: write_raw_dataset('chengdu_raw_data', size))
+    if 'parse_page' in stages:
+        _bench_parse(meter, size, min(size, parse_rows))
+    if 'clean_data' in stages:
+        from data_cleaner import clean_data
+        meter.measure(size, 'clean_data', lambda: clean_data(refit_vocab=True, chunksize=chunksize))
+    if 'charts' in stages:
+        _bench_charts(meter, size)
+    if 'run_kmeans_clustering' in stages:
+        from machine_learning import run_kmeans_clustering
+        meter.measure(size, 'run_kmeans_clustering', lambda: run_kmeans_clustering(use_cache=False))
+    if 'run_price_prediction_model' in stages:
+        from machine_learning import run_price_prediction_model
+        meter.measure(size, 'run_price_prediction_model', lambda: run_price_prediction_model(use_cache=False))
+    if 'index' in stages:
+        _bench_index(meter, size)
+    return meter.results
+
+
+def _run_size_in_subprocess(size, stages, parse_rows, chunksize):
+    with tempfile.TemporaryDirectory(prefix=f'bench-{size}-') as workdir:
+        result_path = os.path.join(workdir, 'result.json')
+        cmd = [sys.executable, os.path.abspath(__file__), '_size', str(size), workdir, result_path,
+               '--stages', ','.join(stages), '--parse-rows', str(parse_rows)]
+        if chunksize:
+            cmd += ['--chunksize', str(chunksize)]
+        subprocess.run(cmd, check=True)
+        with open(result_path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit,
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+    }
+
+
+# ==================== 对比 ====================
+
+def compare(baseline, current, threshold=0.2):
+    """
+    按 (规模, 环节) 对比两次结果，返回退化列表。
+    耗时或内存增量超过基线的 (1 + threshold) 倍，且绝对差值超过忽略阈值时视为退化。
+    """
+    base_index = {(r['size'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"{'规模':>10}  {'环节':<36}{'基线(s)':>10}{'本次(s)':>10}{'比例':>8}{'基线MB':>10}{'本次MB':>10}")
+    for row in current['results']:
+        base = base_index.get((row['size'], row['stage']))
+        if base is None:
+            continue
+        ratio = row['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        flags = []
+        if row['seconds'] > base['seconds'] * (1 + threshold) and row['seconds'] - base['seconds'] > MIN_SECONDS_DELTA:
+            flags.append('耗时退化')
+        if (row['rss_delta_mb'] > base['rss_delta_mb'] * (1 + threshold)
+                and row['rss_delta_mb'] - base['rss_delta_mb'] > MIN_MEMORY_DELTA_MB):
+            flags.append('内存退化')
+        if flags:
+            regressions.append(dict(row, baseline_seconds=base['seconds'],
+                                    baseline_rss_delta_mb=base['rss_delta_mb'], flags=flags))
+        print(f"{row['size']:>10}  {row['stage']:<36}{base['seconds']:>10.3f}{row['seconds']:>10.3f}{ratio:>8.2f}"
+              f"{base['rss_delta_mb']:>10.1f}{row['rss_delta_mb']:>10.1f}  {' '.join(flags)}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='端到端流水线基准测试')
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('--sizes', default='10k,100k', help='数据规模，逗号分隔，如 10k,100k,1M,10M')
+    run_parser.add_argument('--stages', default=','.join(DEFAULT_STAGES), help='要测量的环节，逗号分隔')
+    run_parser.add_argument('--parse-rows', type=int, default=MAX_PARSE_ROWS, help='页面解析环节最多解析的行数')
+    run_parser.add_argument('--chunksize', type=int, default=None, help='clean_data 使用分块模式时的块大小')
+    run_parser.add_argument('--output', default='benchmark_results.json', help='结果文件')
+
+    compare_parser = sub.add_parser('compare', help='与基线结果对比')
+    compare_parser.add_argument('baseline', help='基线结果文件')
+    compare_parser.add_argument('current', help='本次结果文件')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='允许的相对增幅（0.2 表示 20%%）')
+
+    size_parser = sub.add_parser('_size', help=argparse.SUPPRESS)
+    size_parser.add_argument('size', type=int)
+    size_parser.add_argument('workdir')
+    size_parser.add_argument('result_path')
+    size_parser.add_argument('--stages', default=','.join(DEFAULT_STAGES))
+    size_parser.add_argument('--parse-rows', type=int, default=MAX_PARSE_ROWS)
+    size_parser.add_argument('--chunksize', type=int, default=None)
+    args = arg_parser.parse_args()
+
+    if args.command == '_size':
+        results = run_size(args.size, args.workdir, args.stages.split(','), args.parse_rows, args.chunksize)
+        with open(args.result_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False)
+        return
+
+    if args.command == 'run':
+        stages = args.stages.split(',')
+        results = []
+        for size in (parse_size(s) for s in args.sizes.split(',')):
+            results.extend(_run_size_in_subprocess(size, stages, args.parse_rows, args.chunksize))
+        report = {'meta': _metadata(), 'results': results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"\n基准测试完成，结果已保存到 {args.output}")
+        return
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+    except FileNotFoundError as e:
+        print(f"错误: 未找到结果文件 '{e.filename}'。")
+        sys.exit(2)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n发现 {len(regressions)} 处性能退化。")
+        sys.exit(1)
+    print("\n未发现性能退化。")
+
+
+if __name__ == '__main__':
+    main()
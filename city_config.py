@@ -0,0 +1,117 @@
+# city_config.py
+# ------------------------------------------
+# 本模块读取城市配置（cities.json），为抓取、清洗、分析和建模提供各城市的参数与文件路径。
+# 主要功能：
+# 1. City: 城市名称、地图名称、各行政区列表页URL、区名标准化映射
+# 2. 每个城市的数据文件互相独立（<城市代码>_raw_data/、<城市代码>_cleaned_data.parquet 等），
+#    查询某个城市时只读取该城市的文件，新增城市不影响已有城市的查询速度
+# 3. get_city / enabled_cities: 按代码取城市、列出启用的城市
+# 新增城市只需在 cities.json 中添加一项（行政区URL路径与区名映射），无需修改代码。
+# 依赖库：json
+# ------------------------------------------
+
+import json
+import os
+
+# 城市配置随代码一起发布，按本模块所在目录查找，与当前工作目录无关
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.json')
+
+_cities = None
+_default_code = None
+
+
+class City:
+    """单个城市的配置"""
+
+    def __init__(self, code, config):
+        self.code = code
+        self.name = config['name']
+        # pyecharts 地图名称（通常与城市名相同）
+        self.map_name = config.get('map', self.name)
+        self.enabled = config.get('enabled', True)
+        self.base_url = config['base_url']
+        # {网站上的区名: 列表页URL路径}
+        self.districts = config['districts']
+        # {网站上的区名或别名: 标准区名}
+        self.district_names = config.get('district_names', {})
+
+    def district_urls(self):
+        """{网站上的区名: 列表页URL}"""
+        return {name: f"{self.base_url.rstrip('/')}/{path}/" for name, path in self.districts.items()}
+
+    def standardize_district(self, name):
+        """区名标准化：先查映射表，没有“区/市/县”后缀的补上“区”"""
+        if name in self.district_names:
+            return self.district_names[name]
+        if not any(suffix in name for suffix in ['区', '市', '县']):
+            return name + '区'
+        return name
+
+    # ---------- 该城市的数据文件 ----------
+    @property
+    def raw_dir(self):
+        return f'{self.code}_raw_data'
+
+    @property
+    def viz_path(self):
+        return f'{self.code}_cleaned_data.parquet'
+
+    @property
+    def ml_path(self):
+        return f'{self.code}_ml_data.npz'
+
+    @property
+    def vocab_path(self):
+        return f'{self.code}_ml_vocab.json'
+
+    @property
+    def clean_state_dir(self):
+        return f'{self.code}_clean_state'
+
+    @property
+    def crawl_seen_path(self):
+        return f'{self.code}_crawl_seen.sqlite'
+
+    @property
+    def validation_report_path(self):
+        return f'{self.code}_validation.json'
+
+    @property
+    def history_dir(self):
+        return f'{self.code}_history'
+
+    @property
+    def crawl_cache_path(self):
+        return f'{self.code}_crawl_cache.sqlite'
+
+
+def load_cities(path=CITIES_PATH):
+    """读取城市配置，返回 {城市代码: City}（每个进程只读取一次）"""
+    global _cities, _default_code
+    if _cities is None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        _cities = {code: City(code, entry) for code, entry in config['cities'].items()}
+        _default_code = config.get('default') or next(iter(_cities))
+    return _cities
+
+
+def default_city_code():
+    load_cities()
+    return _default_code
+
+
+def get_city(code=None):
+    """按城市代码返回 City，code 为 None 时返回默认城市"""
+    cities = load_cities()
+    code = code or _default_code
+    if code not in cities:
+        raise ValueError(f"未知的城市 '{code}'，可选: {', '.join(cities)}")
+    return cities[code]
+
+
+def enabled_cities():
+    """cities.json 中启用的全部城市"""
+    return [city for city in load_cities().values() if city.enabled]
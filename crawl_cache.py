@@ -0,0 +1,152 @@
+# crawl_cache.py
+# ------------------------------------------
+# 本模块为爬虫提供持久化的页面缓存与断点记录。
+# 主要功能：
+# 1. 以URL为键缓存响应正文、内容哈希、抓取时间及 ETag/Last-Modified
+# 2. 按 (行政区, 页码) 记录抓取进度清单；中断后重跑时，有效期内已完成的页面直接使用缓存，已知结束页之后的页面不再请求
+# 3. 支持离线遍历缓存的HTML，在解析器修改后重新解析
+# 依赖库：sqlite3, hashlib, threading, time
+# ------------------------------------------
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    district TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (district, page)
+);
+"""
+
+
+def content_hash(body):
+    """计算页面正文的 sha256 哈希"""
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    基于 SQLite 的线程安全页面缓存。
+    参数：
+        path: 缓存数据库文件路径
+        ttl: 缓存有效期（秒），超过有效期的页面需要重新验证；为 None 时永不过期
+    """
+
+    def __init__(self, path='crawl_cache.sqlite', ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    # ---------- 页面缓存 ----------
+    def get(self, url):
+        """返回缓存条目字典，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM pages WHERE url = ?', (url,)).fetchone()
+        return dict(row) if row else None
+
+    def is_fresh(self, entry):
+        """判断缓存条目是否仍在有效期内"""
+        if entry is None:
+            return False
+        if self.ttl is None:
+            return True
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def put(self, url, status, body, etag=None, last_modified=None):
+        """写入（或覆盖）一条缓存"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, status, body, content_hash, fetched_at, etag, last_modified) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, status, body, content_hash(body), time.time(), etag, last_modified),
+            )
+
+    def touch(self, url):
+        """服务端返回304时刷新抓取时间"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (time.time(), url))
+
+    @staticmethod
+    def conditional_headers(entry):
+        """根据缓存条目构造条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # ---------- 断点清单 ----------
+    def mark_page(self, district, page, url, status, records=0):
+        """记录某区某页的抓取结果（ok / empty / not_found）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (district, page, url, status, records, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (district, page, url, status, records, time.time()),
+            )
+
+    def checkpoint(self, district, since=None):
+        """返回某区已记录的 {页码: 状态}；since 不为空时只返回该时间之后记录的页面"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT page, status FROM checkpoints WHERE district = ? AND updated_at >= ? ORDER BY page',
+                (district, since or 0),
+            ).fetchall()
+        return {row['page']: row['status'] for row in rows}
+
+    def resume_state(self, district):
+        """
+        续爬时某区的断点：返回 (已完成的页码集合, 停止页码)。
+        只采用有效期内的记录；停止页码为最早一个 404/无数据页之前的页码，没有时为 None。
+        """
+        since = time.time() - self.ttl if self.ttl is not None else None
+        done = self.checkpoint(district, since)
+        ends = [page for page, status in done.items() if status in ('not_found', 'empty')]
+        stop_page = min(ends) - 1 if ends else None
+        return {page for page, status in done.items() if status == 'ok'}, stop_page
+
+    def iter_pages(self, district=None):
+        """
+        按 (行政区, 页码) 顺序遍历清单中状态为 ok 的缓存页面。
+        产出：(district, page, html)
+        """
+        sql = ('SELECT c.district, c.page, p.body FROM checkpoints c JOIN pages p ON c.url = p.url '
+               "WHERE c.status = 'ok'")
+        params = ()
+        if district is not None:
+            sql += ' AND c.district = ?'
+            params = (district,)
+        sql += ' ORDER BY c.district, c.page'
+        # 使用独立的只读连接流式遍历，避免一次性载入所有页面
+        conn = sqlite3.connect(self.path)
+        try:
+            for row in conn.execute(sql, params):
+                yield row[0], row[1], row[2]
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,182 @@
+# cube.py
+# ------------------------------------------
+# 本模块提供供所有分析图表共用的预聚合数据立方体。
+# 主要功能：
+# 1. 单次扫描数据，按 District × SubDistrict × Decoration × Layout × RoomCount 聚合
+#    房源数、各度量的和与非空计数
+# 2. 每个维度的每个取值各保存一份总价分位数草图（只按单一维度统计，大小只与不同总价取值数有关）
+# 3. 同时统计小区房源数，用于词云
+# 4. 增量更新：append / remove 只聚合新增或移除的行并与已有立方体合并（增量清洗时使用，见 incremental_cleaner.py）
+# 5. 图表从立方体上卷（rollup）得到所需的分组统计，耗时与原始行数无关
+# 依赖库：pandas, numpy, sketches.py, model_store.py, storage.py
+# ------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from model_store import artifact_key, load_artifact, save_artifact
+from sketches import QuantileSketch
+from storage import load_table
+
+CUBE_DIMENSIONS = ['District', 'SubDistrict', 'Decoration', 'Layout', 'RoomCount']
+CUBE_MEASURES = ['UnitPrice', 'TotalPrice', 'Area']
+# 构建立方体所需读取的列
+CUBE_COLUMNS = CUBE_DIMENSIONS + CUBE_MEASURES + ['Community']
+# 总价分位数草图的精度（万元，保留1位小数）
+PRICE_PRECISION = 1
+# 立方体结构版本：结构变化时递增，旧的缓存立方体随之失效
+CUBE_VERSION = 3
+
+
+def _plain(df, columns):
+    """
+    取出构建立方体所需的列：类别列转为普通对象列，保证不同批次聚合结果的索引可以对齐相加；
+    缺少的列以空值补齐（对应维度上卷时被忽略）。
+    """
+    out = df[[c for c in columns if c in df.columns]].copy()
+    for col in columns:
+        if col not in out.columns:
+            out[col] = np.nan
+            continue
+        if isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype(object)
+    return out[columns]
+
+
+def _price_sketches(data):
+    """各维度每个取值的总价分位数草图：{维度: {取值: QuantileSketch}}，维度取值为空的行不计入"""
+    valid = data[data['TotalPrice'].notna()]
+    price_keys = np.round(valid['TotalPrice'].to_numpy(dtype=float) * 10 ** PRICE_PRECISION).astype(np.int64)
+    sketches = {}
+    for dim in CUBE_DIMENSIONS:
+        pairs = pd.DataFrame({dim: valid[dim].to_numpy(), 'PriceKey': price_keys})
+        per_value = {}
+        for (value, key), count in pairs.groupby([dim, 'PriceKey'], sort=False).size().items():
+            sketch = per_value.setdefault(value, QuantileSketch(precision=PRICE_PRECISION))
+            sketch.counts[int(key)] = int(count)
+            sketch.n += int(count)
+        sketches[dim] = per_value
+    return sketches
+
+
+class AggregateCube:
+    """
+    预聚合数据立方体。
+    cells: 以维度为索引，列为 count、<度量>_sum、<度量>_n
+    price_sketches: {维度: {取值: 总价分位数草图}}
+    communities: 小区 -> 房源数
+    """
+
+    def __init__(self, cells=None, price_sketches=None, communities=None):
+        self.cells = cells
+        self.price_sketches = price_sketches
+        self.communities = communities
+
+    @classmethod
+    def from_frame(cls, df):
+        """单次扫描 DataFrame 构建立方体"""
+        data = _plain(df, CUBE_COLUMNS)
+        # 度量列以 float32 存储，按 float64 求和，均值和中位数不带单精度噪声
+        data[CUBE_MEASURES] = data[CUBE_MEASURES].astype('float64')
+        for measure in CUBE_MEASURES:
+            data[f'{measure}_n'] = data[measure].notna().astype(np.int64)
+        grouped = data.groupby(CUBE_DIMENSIONS, dropna=False, sort=False)
+        cells = grouped[[f'{m}_n' for m in CUBE_MEASURES]].sum()
+        sums = grouped[CUBE_MEASURES].sum().add_suffix('_sum')
+        cells = pd.concat([grouped.size().rename('count'), sums, cells], axis=1)
+        communities = data['Community'].value_counts()
+        return cls(cells, _price_sketches(data), communities)
+
+    def _merge(self, delta, weight):
+        self.cells = self.cells.add(weight * delta.cells, fill_value=0)
+        self.cells = self.cells[self.cells['count'] > 0]
+        self.communities = self.communities.add(weight * delta.communities, fill_value=0)
+        self.communities = self.communities[self.communities > 0]
+        for dim, per_value in delta.price_sketches.items():
+            own = self.price_sketches.setdefault(dim, {})
+            for value, sketch in per_value.items():
+                merged = own.setdefault(value, QuantileSketch(precision=PRICE_PRECISION)).merge(sketch, weight)
+                if merged.n == 0:
+                    del own[value]
+        return self
+
+    def append(self, df):
+        """将新增行聚合后合并进立方体（只扫描新增行）"""
+        if len(df) == 0:
+            return self
+        delta = AggregateCube.from_frame(df)
+        if self.cells is None:
+            self.cells, self.price_sketches, self.communities = delta.cells, delta.price_sketches, delta.communities
+            return self
+        return self._merge(delta, 1)
+
+    def remove(self, df):
+        """从立方体中减去之前加入过的行（只扫描这些行），计数归零的组随之删除"""
+        if len(df) == 0 or self.cells is None:
+            return self
+        return self._merge(AggregateCube.from_frame(df), -1)
+
+    # ---------- 查询 ----------
+    def rollup(self, dims):
+        """
+        按给定维度上卷，返回包含 count、<度量>_sum、<度量>_mean 的 DataFrame。
+        维度取值为空的组被忽略（与 pandas groupby 的默认行为一致）。
+        """
+        rolled = self.cells.groupby(level=dims, dropna=True).sum()
+        for measure in CUBE_MEASURES:
+            rolled[f'{measure}_mean'] = rolled[f'{measure}_sum'] / rolled[f'{measure}_n'].replace(0, np.nan)
+        return rolled
+
+    def counts(self, dim):
+        """某一维度各取值的房源数，按数量降序"""
+        return self.rollup([dim])['count'].astype(int).sort_values(ascending=False)
+
+    def mean(self, dim, measure):
+        """某一维度各取值上某度量的均值"""
+        return self.rollup([dim])[f'{measure}_mean']
+
+    def price_quantiles(self, dim, qs=(0, 0.25, 0.5, 0.75, 1)):
+        """
+        某一维度各取值的总价分位数（线性插值，精度 0.1 万元），直接读取该维度的草图。
+        返回 {取值: [各分位数]}，顺序与 rollup 一致。
+        """
+        sketches = self.price_sketches[dim]
+        return {value: [round(sketches[value].quantile(q), 2) for q in qs] for value in sorted(sketches)}
+
+    def top_communities(self, n=100):
+        """房源数最多的 n 个小区"""
+        return self.communities.astype(int).sort_values(ascending=False).head(n)
+
+    @property
+    def n_rows(self):
+        return int(self.cells['count'].sum()) if self.cells is not None else 0
+
+
+def as_cube(data):
+    """图表函数既接受立方体也接受 DataFrame；传入 DataFrame 时即时构建立方体"""
+    if isinstance(data, AggregateCube):
+        return data
+    return AggregateCube.from_frame(data)
+
+
+def cube_key(data_path='chengdu_cleaned_data.parquet'):
+    """聚合立方体的缓存键"""
+    return artifact_key('cube', [data_path], {'dims': CUBE_DIMENSIONS, 'precision': PRICE_PRECISION},
+                        version=CUBE_VERSION)
+
+
+def load_or_build_cube(data_path='chengdu_cleaned_data.parquet', use_cache=True):
+    """
+    每个数据版本只构建一次立方体：按数据内容哈希缓存在 model_cache 中。
+    数据文件不存在时返回 None；use_cache 为 False 时强制重建。
+    """
+    try:
+        key = cube_key(data_path)
+    except FileNotFoundError:
+        return None
+    _, cube = load_artifact('cube', key) if use_cache else (None, None)
+    if cube is None:
+        print("正在构建聚合立方体...")
+        cube = AggregateCube.from_frame(load_table(data_path, columns=CUBE_COLUMNS))
+        save_artifact('cube', key, cube)
+    return cube
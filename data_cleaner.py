@@ -1,25 +1,183 @@
 # 2_data_cleaner.py (完整最终版)
 # ------------------------------------------
-# 本脚本用于对原始爬取的成都二手房数据进行清洗、转换和标准化。
+# 本脚本用于对原始爬取的二手房数据进行清洗、转换和标准化（按城市分别处理，见 city_config.py）。
 # 主要功能：
 # 1. 数据类型转换与单位去除
 # 2. 缺失值与异常值处理
-# 3. 生成可视化和机器学习两份数据集
+# 3. 生成可视化数据集和稀疏编码的机器学习数据集（类别词表持久化，列布局稳定）
+# 4. 分块模式：两遍扫描、内存占用有界，适用于数百万行的原始数据
+# 5. 区名标准化映射来自 cities.json；输出按行政区排序，便于按区只读取相关的行组
+# 6. 各清洗环节均有埋点（见 instrumentation.py），直接运行时输出并保存运行报告
 # 依赖库：pandas, numpy
 # ------------------------------------------
 
+import os
+import tempfile
+
 import pandas as pd
 import numpy as np
+from scipy import sparse
+
+from city_config import get_city
+from feature_encoder import CategoryEncoder, save_ml_dataset
+from instrumentation import run_report, timed
+from raw_store import is_raw_dataset, iter_raw_batches, read_raw
+from sketches import QuantileSketch
+from storage import TableWriter, iter_table_batches, save_table
+
+# 用于独热编码的类别特征
+FEATURES_TO_ENCODE = ['District', 'SubDistrict', 'Orientation', 'Decoration', 'Elevator']
+# 机器学习数据中移除的原始文本列和对预测无用的列
+ML_DROP_COLUMNS = ['Title', 'Community', 'Layout', 'BuildingType', 'Floor']
+# 分位数草图精度（面积保留两位小数）
+AREA_SKETCH_PRECISION = 2
+# 出现次数少于该值的类别归入“其他”列
+MIN_CATEGORY_COUNT = 5
+
+
+def load_raw_data(input_path):
+    """
+    读取原始数据：支持爬虫输出的分区Parquet目录，也兼容旧版的原始csv文件。
+    """
+    if is_raw_dataset(input_path):
+        return read_raw(input_path)
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(input_path)
+    return pd.read_csv(input_path)
+
+
+def iter_raw_chunks(input_path, chunksize, columns=None):
+    """按块读取原始数据，支持分区Parquet目录和原始csv文件；columns 为要读取的列（csv 中没有的列跳过）"""
+    if is_raw_dataset(input_path):
+        yield from iter_raw_batches(input_path, batch_size=chunksize, columns=columns)
+        return
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(input_path)
+    usecols = None if columns is None else (lambda col: col in columns)
+    yield from pd.read_csv(input_path, chunksize=chunksize, usecols=usecols)
+
+
+def standardize_district(name, city=None):
+    """按城市配置中的区名映射进行地名标准化（city 为城市代码，默认城市见 cities.json）"""
+    return get_city(city).standardize_district(name)
+
+
+def standardize_districts(series, city=None):
+    """对整列区名做标准化：只对不重复的区名各计算一次，再按映射替换"""
+    city = get_city(city)
+    mapping = {name: city.standardize_district(name) for name in series.dropna().unique() if isinstance(name, str)}
+    return series.map(mapping)
+
+
+def sort_by_district(df):
+    """按行政区名称排序（稳定排序，区内保持原顺序，缺失区名排在最后）；内存模式与分块模式的输出顺序一致"""
+    return df.sort_values('District', kind='stable', key=lambda s: s.astype(object))
+
+
+@timed('clean_stage_seconds', stage='convert_types')
+def convert_types(df):
+    """Part 1: 数据类型转换和单位去除"""
+    df['TotalPrice'] = df['TotalPrice'].str.replace('万', '').astype(float)
+    df['UnitPrice'] = df['UnitPrice'].str.extract(r'(\d+)').astype(float)
+    df['Area'] = df['Area'].str.replace('平米', '').astype(float)
+    df['Followers'] = df['Followers'].str.replace('人关注', '').astype(int)
+    return df
+
+
+@timed('clean_stage_seconds', stage='extract_year')
+def extract_year(df):
+    """Part 2 (前半): 从建成年代文本中提取四位年份，缺失为 NaN"""
+    df['YearBuilt'] = df['YearBuilt'].str.extract(r'(\d{4})').astype(float)
+    return df
+
+
+@timed('clean_stage_seconds', stage='fill_year')
+def fill_year(df, year_median):
+    """Part 2 (后半): 用全局中位数填充缺失年份"""
+    df['YearBuilt'] = df['YearBuilt'].fillna(year_median).astype(int)
+    return df
+
+
+def area_bounds(q1, q3):
+    """Part 3: 根据面积四分位数计算IQR上下界"""
+    iqr = q3 - q1
+    return q1 - 1.5 * iqr, q3 + 1.5 * iqr
+
+
+@timed('clean_stage_seconds', stage='iqr_filter')
+def filter_area(df, lower_bound, upper_bound):
+    """Part 3: 过滤面积异常值"""
+    return df[(df['Area'] >= lower_bound) & (df['Area'] <= upper_bound)]
+
+
+@timed('clean_stage_seconds', stage='add_features')
+def add_features(df):
+    """Part 5: 特征工程，提取户型中“室”的数量"""
+    df['RoomCount'] = df['Layout'].str.extract(r'(\d)室').astype(int)
+    return df
+
+
+def ml_numeric_columns(df):
+    """Part 6: 机器学习数据中保留的数值列（编码列之外），非数值列给出警告并移除"""
+    columns = []
+    for col in df.columns:
+        if col in FEATURES_TO_ENCODE or col in ML_DROP_COLUMNS:
+            continue
+        if df[col].dtype == object:
+            print(f"警告：机器学习数据中仍存在非数值列 '{col}'，将尝试移除。")
+            continue
+        columns.append(col)
+    return columns
+
 
-def clean_data(input_path='chengdu_raw_data.csv', viz_output='chengdu_cleaned_data.csv', ml_output='chengdu_ml_data.csv'):
+def get_encoder(df, vocab_path, refit_vocab=False):
+    """
+    Part 6: 获取类别编码器。
+    词表文件已存在且不要求重建时直接复用，保证各次运行的列布局一致；
+    否则用 df（可为 None，表示稍后分块 partial_fit）创建新的编码器。
+    """
+    if not refit_vocab and vocab_path and os.path.exists(vocab_path):
+        print(f"复用已保存的类别词表: {vocab_path}")
+        return CategoryEncoder.load(vocab_path), False
+    encoder = CategoryEncoder(FEATURES_TO_ENCODE, ml_numeric_columns(df), min_count=MIN_CATEGORY_COUNT)
+    return encoder, True
+
+
+def report_unknown(unknown):
+    """打印归入“其他”列的类别数量"""
+    for feature, count in unknown.items():
+        if count:
+            print(f"  特征 '{feature}' 中有 {count} 行为低频或未见过的类别，已归入“其他”列。")
+
+
+def clean_data(input_path=None, viz_output=None, ml_output=None, vocab_path=None, refit_vocab=False,
+               chunksize=None, incremental=False, city=None):
     """
     读取原始数据，进行完整的清洗、转换和标准化流程。
-    最终生成两个文件：
-    1. chengdu_cleaned_data.csv: 用于数据可视化。
-    2. chengdu_ml_data.csv: 用于机器学习，包含独热编码。
+    city 为城市代码（默认城市见 cities.json），各路径参数为空时使用该城市的文件（见 city_config.City）。
+    input_path 可以是爬虫输出的分区目录（只读取最新快照），也可以是原始csv文件。
+    chunksize 不为空时使用分块模式（见 clean_data_chunked）。
+    incremental 为 True 时只清洗新增或变化的房源（见 incremental_cleaner.py）。
+    最终生成以下文件（以成都为例）：
+    1. chengdu_cleaned_data.parquet: 用于数据可视化（紧凑列类型，按行政区排序，见 storage.py）。
+    2. chengdu_ml_data.npz: 用于机器学习的稀疏矩阵，包含独热编码。
+    3. chengdu_ml_vocab.json: 类别词表与列索引；已存在时默认复用（refit_vocab=True 时重建）。
     """
+    config = get_city(city)
+    input_path = input_path or config.raw_dir
+    viz_output = viz_output or config.viz_path
+    ml_output = ml_output or config.ml_path
+    vocab_path = vocab_path or config.vocab_path
+    if incremental:
+        from incremental_cleaner import clean_data_incremental
+        return clean_data_incremental(input_path, viz_output, ml_output, vocab_path,
+                                      state_dir=config.clean_state_dir, refit_vocab=refit_vocab, city=city)
+    if chunksize:
+        return clean_data_chunked(input_path, viz_output, ml_output, vocab_path, refit_vocab, chunksize, city=city)
+
     try:
-        df = pd.read_csv(input_path)
+        with timed('clean_stage_seconds', stage='load_raw'):
+            df = load_raw_data(input_path)
         print("原始数据加载成功，开始清洗...")
         print(f"原始数据形状: {df.shape}")
     except FileNotFoundError:
@@ -28,97 +186,163 @@ def clean_data(input_path='chengdu_raw_data.csv', viz_output='chengdu_cleaned_da
 
     # --- Part 1: 数据类型转换和单位去除 ---
     print("正在进行数据类型转换和单位去除...")
-    df['TotalPrice'] = df['TotalPrice'].str.replace('万', '').astype(float)
-    df['UnitPrice'] = df['UnitPrice'].str.extract('(\d+)').astype(float)
-    df['Area'] = df['Area'].str.replace('平米', '').astype(float)
-    df['Followers'] = df['Followers'].str.replace('人关注', '').astype(int)
-    
+    df = convert_types(df)
+
     # --- Part 2: 处理建成年代 ---
     print("正在处理'建成年代'列...")
-    df['YearBuilt'] = df['YearBuilt'].str.extract('(\d{4})').astype(float)
-    year_median = df['YearBuilt'].median()
-    df['YearBuilt'].fillna(year_median, inplace=True)
-    df['YearBuilt'] = df['YearBuilt'].astype(int)
+    df = extract_year(df)
+    df = fill_year(df, df['YearBuilt'].median())
 
     # --- Part 3: 处理异常值 (基于面积的IQR方法) ---
     print("正在处理异常值...")
-    Q1_area = df['Area'].quantile(0.25)
-    Q3_area = df['Area'].quantile(0.75)
-    IQR_area = Q3_area - Q1_area
-    lower_bound = Q1_area - 1.5 * IQR_area
-    upper_bound = Q3_area + 1.5 * IQR_area
-    df = df[(df['Area'] >= lower_bound) & (df['Area'] <= upper_bound)]
+    lower_bound, upper_bound = area_bounds(df['Area'].quantile(0.25), df['Area'].quantile(0.75))
+    df = filter_area(df, lower_bound, upper_bound)
 
     # --- Part 4: 地名标准化 (终极版) ---
     print("正在进行地名精确标准化...")
-    DISTRICT_MAP = {
-        # 标准名称
-        '武侯': '武侯区', '锦江': '锦江区', '青羊': '青羊区', '金牛': '金牛区',
-        '成华': '成华区', '龙泉驿': '龙泉驿区', '双流': '双流区', '温江': '温江区',
-        '郫都': '郫都区', '新都': '新都区', '青白江': '青白江区', '都江堰': '都江堰市',
-        '彭州': '彭州市', '邛崃': '邛崃市', '崇州': '崇州市', '简阳': '简阳市',
-        '金堂': '金堂县', '大邑': '大邑县', '蒲江': '蒲江县', '新津': '新津区',
-        
-        # 网站上常见的高新区变体
-        '高新': '高新区',
-        '高新南区': '高新区',
-        '高新西区': '高新区',
-        '高新东区': '高新区', # 以防万一
-        
-        # 网站上常见的天府新区变体
-        '天府新区': '四川天府新区',
-        '天府新区南区': '四川天府新区',
-        
-        # 其他可能的简称或别名
-        '龙泉': '龙泉驿区'
-    }
-
-    def standardize_district(name):
-        """使用非常全面的映射字典进行地名标准化"""
-        if name in DISTRICT_MAP:
-            return DISTRICT_MAP[name]
-        if not any(suffix in name for suffix in ['区', '市', '县']):
-            return name + '区'
-        return name
-
-    df['District'] = df['District'].apply(standardize_district)
+    with timed('clean_stage_seconds', stage='standardize_district'):
+        df['District'] = standardize_districts(df['District'], city)
     print("地名精确标准化完成。")
 
     # --- Part 5: 特征工程 ---
     print("正在进行特征工程...")
-    # 清理户型，提取“室”的数量
-    df['RoomCount'] = df['Layout'].str.extract('(\d)室').astype(int)
+    df = add_features(df)
+    # 按行政区排序，使 Parquet 的每个行组只覆盖少数几个区
+    df = sort_by_district(df)
 
     # 保存用于可视化的数据
     df_viz = df.copy()
-    df_viz.to_csv(viz_output, index=False, encoding='utf-8-sig')
+    with timed('clean_stage_seconds', stage='save_viz'):
+        save_table(df_viz, viz_output)
     print(f"\n可视化数据已保存至: {viz_output}")
     print(f"可视化数据形状: {df_viz.shape}")
 
     # --- Part 6: 准备用于机器学习的数据 ---
     print("\n正在准备机器学习数据...")
-    df_ml = df.copy()
-
-    # 选择用于独热编码的类别特征
-    features_to_encode = ['District', 'SubDistrict','Orientation', 'Decoration', 'Elevator']
-    
-    # 执行独热编码，drop_first=True 可以减少共线性
-    df_ml = pd.get_dummies(df_ml, columns=features_to_encode, drop_first=True)
-    
-    # 移除不再需要的原始文本列和对预测无用的列
-    df_ml = df_ml.drop(['Title', 'Community', 'Layout', 'BuildingType', 'Floor'], axis=1)
-
-    # 再次检查并确保所有列都是数值类型
-    for col in df_ml.select_dtypes(include=['object']).columns:
-        print(f"警告：机器学习数据中仍存在非数值列 '{col}'，将尝试移除。")
-        df_ml = df_ml.drop(col, axis=1)
+    with timed('clean_stage_seconds', stage='encode'):
+        encoder, is_new = get_encoder(df, vocab_path, refit_vocab)
+        if is_new:
+            encoder.fit(df)
+            encoder.save(vocab_path)
+            print(f"类别词表已保存至: {vocab_path}")
+        ml_matrix, unknown = encoder.transform(df)
+    report_unknown(unknown)
 
     # 保存用于机器学习的数据
-    df_ml.to_csv(ml_output, index=False, encoding='utf-8-sig')
+    with timed('clean_stage_seconds', stage='save_ml'):
+        save_ml_dataset(ml_matrix, ml_output)
     print(f"机器学习数据已保存至: {ml_output}")
-    print(f"机器学习数据形状: {df_ml.shape}")
+    print(f"机器学习数据形状: {ml_matrix.shape}，非零元素: {ml_matrix.nnz}")
     
     print("\n数据清洗与准备全部完成！")
 
+
+def clean_data_chunked(input_path='chengdu_raw_data', viz_output='chengdu_cleaned_data.parquet',
+                       ml_output='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json',
+                       refit_vocab=False, chunksize=100_000, city=None):
+    """
+    分块清洗模式，内存占用只与 chunksize 有关（稀疏机器学习矩阵除外）。
+    第一遍：逐块转换面积和年份，用可合并的分位数草图累计面积四分位数和年份中位数。
+    第二遍：逐块完成填充、过滤、标准化和特征工程，按标准区名分别写入临时文件，同时累计类别频次；
+            之后按区名顺序依次拼接为可视化数据（等价于内存模式的稳定排序，输入为csv时同样成立）。
+    第三遍：逐块读取可视化数据，按类别词表稀疏编码后合并写出机器学习数据。
+    误差说明：草图按 AREA_SKETCH_PRECISION 位小数计数。面积数据不超过两位小数时
+    （链家数据即如此），IQR边界与年份中位数与内存模式一致，输出行及其顺序完全相同；
+    否则IQR边界误差不超过 0.005 平米，仅可能影响恰好落在边界附近的行。
+    """
+    area_sketch = QuantileSketch(precision=AREA_SKETCH_PRECISION)
+    year_sketch = QuantileSketch(precision=0)
+
+    # --- 第一遍：累计全局统计量 ---
+    print(f"分块模式（每块 {chunksize} 行）第一遍：统计面积四分位数与年份中位数...")
+    total_rows = 0
+    try:
+        for chunk in iter_raw_chunks(input_path, chunksize):
+            with timed('clean_stage_seconds', stage='sketch_pass'):
+                area = chunk['Area'].str.replace('平米', '').astype(float)
+                year = chunk['YearBuilt'].str.extract(r'(\d{4})', expand=False).astype(float)
+                area_sketch.update(area)
+                year_sketch.update(year)
+            total_rows += len(chunk)
+    except FileNotFoundError:
+        print(f"错误: 未找到原始数据文件 '{input_path}'。请先运行 1_scraper.py。")
+        return
+    print(f"原始数据行数: {total_rows}")
+
+    year_median = year_sketch.median()
+    lower_bound, upper_bound = area_bounds(area_sketch.quantile(0.25), area_sketch.quantile(0.75))
+    print(f"年份中位数: {year_median}，面积有效范围: [{lower_bound:.2f}, {upper_bound:.2f}]")
+
+    # --- 第二遍：清洗并写出可视化数据 ---
+    print("第二遍：逐块清洗并写出可视化数据...")
+    encoder, is_new = None, False
+    viz_rows = 0
+    spill_root = os.path.dirname(os.path.abspath(viz_output))
+    with tempfile.TemporaryDirectory(prefix='clean-spill-', dir=spill_root) as spill_dir:
+        spills = {}   # 标准区名（缺失为 None） -> 该区的临时文件
+        try:
+            for chunk in iter_raw_chunks(input_path, chunksize):
+                chunk = convert_types(chunk)
+                chunk = extract_year(chunk)
+                chunk = fill_year(chunk, year_median)
+                chunk = filter_area(chunk, lower_bound, upper_bound).copy()
+                with timed('clean_stage_seconds', stage='standardize_district'):
+                    chunk['District'] = standardize_districts(chunk['District'], city)
+                chunk = add_features(chunk)
+                with timed('clean_stage_seconds', stage='encode'):
+                    if encoder is None:
+                        encoder, is_new = get_encoder(chunk, vocab_path, refit_vocab)
+                    if is_new:
+                        encoder.partial_fit(chunk)
+                with timed('clean_stage_seconds', stage='spill_viz'):
+                    districts = chunk['District'].astype(object)
+                    for name, part in chunk.groupby(districts, sort=False, dropna=False):
+                        name = name if isinstance(name, str) else None
+                        if name not in spills:
+                            spills[name] = TableWriter(os.path.join(spill_dir, f'{len(spills)}.parquet'))
+                        spills[name].write(part)
+                viz_rows += len(chunk)
+        finally:
+            for spill in spills.values():
+                spill.close()
+
+        # 按区名顺序拼接（区内保持读取顺序），缺失区名排在最后
+        order = sorted(name for name in spills if name is not None) + ([None] if None in spills else [])
+        with timed('clean_stage_seconds', stage='save_viz'), TableWriter(viz_output) as writer:
+            for name in order:
+                for batch in iter_table_batches(spills[name].path, batch_size=chunksize):
+                    writer.write(batch)
+    print(f"可视化数据已保存至: {viz_output}（{viz_rows} 行）")
+
+    # --- 第三遍：独热编码并写出机器学习数据 ---
+    print("第三遍：逐块稀疏编码并写出机器学习数据...")
+    if encoder is None:
+        print("错误: 清洗后没有剩余数据，无法生成机器学习数据。")
+        return
+    if is_new:
+        encoder.build_vocabulary()
+        encoder.save(vocab_path)
+        print(f"类别词表已保存至: {vocab_path}")
+    blocks = []
+    unknown_total = dict.fromkeys(FEATURES_TO_ENCODE, 0)
+    for chunk in iter_table_batches(viz_output, batch_size=chunksize):
+        with timed('clean_stage_seconds', stage='encode'):
+            block, unknown = encoder.transform(chunk)
+        blocks.append(block)
+        for feature, count in unknown.items():
+            unknown_total[feature] += count
+    report_unknown(unknown_total)
+    with timed('clean_stage_seconds', stage='save_ml'):
+        ml_matrix = sparse.vstack(blocks, format='csr')
+        save_ml_dataset(ml_matrix, ml_output)
+    print(f"机器学习数据已保存至: {ml_output}（形状 {ml_matrix.shape}，非零元素 {ml_matrix.nnz}）")
+
+    print("\n数据清洗与准备全部完成！")
+
+
 if __name__ == '__main__':
-    clean_data()
\ No newline at end of file
+    import sys
+    # 用法：python data_cleaner.py [--incremental] [--city=城市代码]
+    city_code = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--city=')), None)
+    with run_report('clean_data'):
+        clean_data(incremental='--incremental' in sys.argv, city=city_code)
\ No newline at end of file
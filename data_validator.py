@@ -0,0 +1,334 @@
+# data_validator.py
+# ------------------------------------------
+# 本模块对清洗后的数据和机器学习数据做自动化质量检查，检查不通过时阻止后续的模型训练。
+# 主要功能：
+# 1. 按规则只读取需要的列，分块流式、向量化地检查清洗后的数据：
+#    未知行政区（对照 cities.json 的区名映射）、单价与 总价/面积 是否一致、面积/年份/价格范围、缺失率、最少行数
+# 2. 总行数取自 Parquet 元数据；某条规则的违规数已超过允许上限时立即停止读取（fail fast）
+# 3. 机器学习数据只读取矩阵的形状与非零值数组：检查列数与词表一致、行数与清洗后数据一致、无非有限值，
+#    并与上一次通过检查的词表列对比，报告列的增减（列漂移）
+# 4. 输出机器可读的 JSON 报告（<城市代码>_validation.json），检查不通过时以退出码 1 结束
+# 用法：
+#   python data_validator.py [--city=CODE] [--report PATH]
+# 依赖库：numpy, pandas, pyarrow, storage.py
+# ------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from city_config import get_city
+from instrumentation import timed
+from storage import iter_table_batches
+
+# 每次读取的行数
+VALIDATE_BATCH_SIZE = 500_000
+# 清洗后数据的最少行数（少于该值视为抓取失败）
+MIN_ROWS = 100
+# 单价与 总价×10000/面积 的允许相对误差，以及允许超出误差的行比例
+UNIT_PRICE_TOLERANCE = 0.05
+UNIT_PRICE_MAX_RATE = 0.01
+# 数值范围：列 -> (下限, 上限, 允许超出范围的行比例)
+VALUE_RANGES = {
+    'Area': (10, 1000, 0.0),
+    'YearBuilt': (1950, int(time.strftime('%Y')) + 1, 0.0),
+    'TotalPrice': (1, 10_000, 0.0),
+    'UnitPrice': (1_000, 200_000, 0.001),
+}
+# 允许的缺失率，未列出的列不检查
+NULL_LIMITS = {
+    'District': 0.0, 'TotalPrice': 0.0, 'UnitPrice': 0.0, 'Area': 0.0, 'YearBuilt': 0.0,
+    'Community': 0.01, 'Layout': 0.01, 'Decoration': 0.05, 'Orientation': 0.05, 'Elevator': 0.05,
+}
+
+PASS, WARN, FAIL = 'pass', 'warn', 'fail'
+
+
+class ValidationError(Exception):
+    """数据质量检查未通过"""
+
+
+class Rule:
+    """
+    分块检查规则：columns 为需要读取的列；update 累计一个批次，violations 为当前违规行数；
+    max_rate 为允许的违规行比例（相对于总行数），超过即为不通过。
+    """
+
+    columns = []
+
+    def __init__(self, name, max_rate=0.0):
+        self.name = name
+        self.max_rate = max_rate
+        self.violations = 0
+        self.checked = 0
+
+    def update(self, batch):
+        raise NotImplementedError
+
+    def limit(self, total_rows):
+        return int(self.max_rate * total_rows)
+
+    def failed_early(self, total_rows):
+        """违规数已超过上限，读完剩余数据也不会通过"""
+        return self.violations > self.limit(total_rows)
+
+    def details(self):
+        return {}
+
+    def result(self, total_rows):
+        status = FAIL if self.violations > self.limit(total_rows) else PASS
+        rate = self.violations / self.checked if self.checked else 0.0
+        return {
+            'name': self.name, 'status': status, 'violations': int(self.violations),
+            'checked_rows': int(self.checked), 'rate': round(rate, 6), 'max_rate': self.max_rate,
+            **self.details(),
+        }
+
+
+class KnownDistricts(Rule):
+    """行政区必须是城市配置中的标准区名"""
+
+    columns = ['District']
+
+    def __init__(self, known, max_rate=0.0):
+        super().__init__('known_districts', max_rate)
+        self.known = set(known)
+        self.unknown = {}
+
+    def update(self, batch):
+        counts = batch['District'].value_counts(sort=False)
+        counts = counts[counts > 0]
+        for name, n in counts[~counts.index.isin(self.known)].items():
+            self.unknown[str(name)] = self.unknown.get(str(name), 0) + int(n)
+            self.violations += int(n)
+        self.checked += len(batch)
+
+    def details(self):
+        return {'unknown': dict(sorted(self.unknown.items(), key=lambda item: -item[1]))}
+
+
+class UnitPriceConsistency(Rule):
+    """单价（元/平）应与 总价（万元）×10000 / 面积 一致"""
+
+    columns = ['UnitPrice', 'TotalPrice', 'Area']
+
+    def __init__(self, tolerance=UNIT_PRICE_TOLERANCE, max_rate=UNIT_PRICE_MAX_RATE):
+        super().__init__('unit_price_consistency', max_rate)
+        self.tolerance = tolerance
+        self.max_error = 0.0
+
+    def update(self, batch):
+        unit = batch['UnitPrice'].to_numpy(dtype=np.float64)
+        expected = batch['TotalPrice'].to_numpy(dtype=np.float64) * 10_000 / batch['Area'].to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = np.abs(unit - expected) / expected
+        # 缺失值由缺失率规则检查，这里只统计可比较的行
+        valid = np.isfinite(error)
+        bad = valid & (error > self.tolerance)
+        self.violations += int(bad.sum())
+        self.checked += int(valid.sum())
+        if valid.any():
+            self.max_error = max(self.max_error, float(error[valid].max()))
+
+    def details(self):
+        return {'tolerance': self.tolerance, 'max_relative_error': round(self.max_error, 4)}
+
+
+class ValueRange(Rule):
+    """数值列应在 [low, high] 范围内"""
+
+    def __init__(self, column, low, high, max_rate=0.0):
+        super().__init__(f'range_{column}', max_rate)
+        self.columns = [column]
+        self.column, self.low, self.high = column, low, high
+        self.observed = [np.inf, -np.inf]
+
+    def update(self, batch):
+        values = batch[self.column].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.violations += int(((values < self.low) | (values > self.high)).sum())
+        self.checked += len(values)
+        if len(values):
+            self.observed = [min(self.observed[0], float(values.min())), max(self.observed[1], float(values.max()))]
+
+    def details(self):
+        observed = self.observed if self.checked else [None, None]
+        return {'range': [self.low, self.high], 'observed': observed}
+
+
+class NullRate(Rule):
+    """列的缺失率不超过 max_rate"""
+
+    def __init__(self, column, max_rate=0.0):
+        super().__init__(f'nulls_{column}', max_rate)
+        self.columns = [column]
+        self.column = column
+
+    def update(self, batch):
+        self.violations += int(batch[self.column].isna().sum())
+        self.checked += len(batch)
+
+
+def known_districts(city):
+    """城市配置中的全部标准区名"""
+    return set(city.district_names.values()) | {city.standardize_district(name) for name in city.districts}
+
+
+def default_rules(city, available):
+    """清洗后数据的默认规则（只保留数据中存在所需列的规则）"""
+    rules = [KnownDistricts(known_districts(city)), UnitPriceConsistency()]
+    rules += [ValueRange(col, low, high, rate) for col, (low, high, rate) in VALUE_RANGES.items()]
+    rules += [NullRate(col, rate) for col, rate in NULL_LIMITS.items()]
+    return [rule for rule in rules if all(col in available for col in rule.columns)]
+
+
+@timed('validate_seconds', stage='cleaned')
+def validate_cleaned(path, rules=None, city=None, batch_size=VALIDATE_BATCH_SIZE):
+    """
+    检查清洗后的数据，返回 (总行数, 检查结果列表)。
+    只读取各规则需要的列的并集；某条规则已确定不通过时停止读取。
+    """
+    city = get_city(city)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    parquet_file = pq.ParquetFile(path)
+    total_rows = parquet_file.metadata.num_rows
+    available = parquet_file.schema_arrow.names
+    rules = rules if rules is not None else default_rules(city, available)
+    columns = sorted({col for rule in rules for col in rule.columns})
+
+    results = [{
+        'name': 'min_rows', 'status': FAIL if total_rows < MIN_ROWS else PASS,
+        'rows': int(total_rows), 'min_rows': MIN_ROWS,
+    }]
+    missing = sorted({col for col in NULL_LIMITS if col not in available})
+    if missing:
+        results.append({'name': 'required_columns', 'status': FAIL, 'missing': missing})
+
+    stopped_at = None
+    read_rows = 0
+    for batch in iter_table_batches(path, batch_size=batch_size, columns=columns):
+        for rule in rules:
+            rule.update(batch)
+        read_rows += len(batch)
+        if any(rule.failed_early(total_rows) for rule in rules):
+            stopped_at = read_rows
+            break
+    for rule in rules:
+        result = rule.result(total_rows)
+        if stopped_at is not None:
+            result['stopped_after_rows'] = stopped_at
+        results.append(result)
+    return total_rows, results
+
+
+@timed('validate_seconds', stage='ml')
+def validate_ml(ml_path, vocab_path, cleaned_rows=None, baseline_columns=None):
+    """
+    检查机器学习数据（只读取矩阵形状与非零值数组，不构建稀疏矩阵），返回 (检查结果列表, 词表列)。
+    baseline_columns 为上一次通过检查的词表列，用于报告列漂移。
+    """
+    with open(vocab_path, encoding='utf-8') as f:
+        columns = json.load(f)['columns']
+    with np.load(ml_path) as npz:
+        shape = tuple(int(n) for n in npz['shape'])
+        non_finite = int((~np.isfinite(npz['data'])).sum())
+
+    results = [{
+        'name': 'ml_column_count', 'status': PASS if shape[1] == len(columns) else FAIL,
+        'matrix_columns': shape[1], 'vocab_columns': len(columns),
+    }]
+    if cleaned_rows is not None:
+        results.append({
+            'name': 'ml_row_count', 'status': PASS if shape[0] == cleaned_rows else FAIL,
+            'matrix_rows': shape[0], 'cleaned_rows': int(cleaned_rows),
+        })
+    results.append({'name': 'ml_finite', 'status': FAIL if non_finite else PASS, 'violations': non_finite})
+    if baseline_columns is not None:
+        added = [c for c in columns if c not in set(baseline_columns)]
+        removed = [c for c in baseline_columns if c not in set(columns)]
+        # 重建词表会合法地改变列布局：记为警告，由使用方决定是否重新训练全部模型
+        results.append({
+            'name': 'ml_column_drift', 'status': WARN if added or removed or columns != baseline_columns else PASS,
+            'added': added, 'removed': removed, 'reordered': not added and not removed and columns != baseline_columns,
+        })
+    return results, columns
+
+
+def _baseline_columns(report_path):
+    """上一次通过检查的报告中的词表列"""
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path, encoding='utf-8') as f:
+        report = json.load(f)
+    return report.get('ml_columns') if report.get('passed') else report.get('baseline_ml_columns')
+
+
+def validate(city=None, report_path=None, raise_on_failure=True):
+    """
+    检查城市的清洗结果与机器学习数据，写出 JSON 报告并返回报告字典。
+    有检查不通过时（raise_on_failure 为 True）抛出 ValidationError。
+    """
+    city = get_city(city)
+    report_path = report_path or city.validation_report_path
+    start = time.perf_counter()
+    checks = []
+    cleaned_rows = None
+    ml_columns = None
+    try:
+        cleaned_rows, results = validate_cleaned(city.viz_path, city=city.code)
+        checks += results
+    except FileNotFoundError:
+        checks.append({'name': 'cleaned_data', 'status': FAIL, 'missing': city.viz_path})
+    baseline = _baseline_columns(report_path)
+    if all(os.path.exists(p) for p in (city.ml_path, city.vocab_path)):
+        results, ml_columns = validate_ml(city.ml_path, city.vocab_path, cleaned_rows, baseline)
+        checks += results
+    else:
+        checks.append({'name': 'ml_data', 'status': FAIL, 'missing': [city.ml_path, city.vocab_path]})
+
+    failed = [check['name'] for check in checks if check['status'] == FAIL]
+    report = {
+        'city': city.code, 'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'seconds': round(time.perf_counter() - start, 3), 'rows': cleaned_rows,
+        'passed': not failed, 'failed': failed, 'checks': checks,
+        'ml_columns': ml_columns,
+        # 未通过时保留上一次通过检查的词表列，作为下一次列漂移的比较基准
+        'baseline_ml_columns': baseline,
+    }
+    tmp_path = report_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, report_path)
+
+    for check in checks:
+        if check['status'] != PASS:
+            details = {k: v for k, v in check.items() if k not in ('name', 'status')}
+            print(f"  [{check['status']}] {check['name']}: {details}")
+    print(f"数据检查{'通过' if not failed else '未通过'}（{len(checks)} 项，{report['seconds']} 秒），"
+          f"报告已保存至: {report_path}")
+    if failed and raise_on_failure:
+        raise ValidationError(f"数据检查未通过: {', '.join(failed)}")
+    return report
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='检查清洗后的数据与机器学习数据')
+    arg_parser.add_argument('--city', help='城市代码（默认: cities.json 中的默认城市）')
+    arg_parser.add_argument('--report', help='报告路径（默认: <城市代码>_validation.json）')
+    args = arg_parser.parse_args()
+    try:
+        report = validate(args.city, args.report, raise_on_failure=False)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# dedup.py
+# ------------------------------------------
+# 本模块在抓取过程中对房源做流式去重。
+# 翻页期间列表顺序会变化，同一房源可能出现在多个 pg{n} 页面；推广房源还会在多个行政区重复出现。
+# 主要功能：
+# 1. listing_identity: 房源标识优先取标题链接中的房源编号，缺失时用标题、小区、户型、面积等稳定字段的内容指纹代替
+# 2. BloomFilter: 固定内存的成员判断（位数组 + 双重哈希），百万级房源只占约 1.2MB；
+#    判断“不存在”一定准确，判断“可能存在”有少量误判
+# 3. SeenStore: SQLite 中的精确集合，只在布隆过滤器判断“可能存在”时查询，用于排除误判
+# 4. ListingDeduper: 组合二者逐页过滤重复房源，按行政区统计解析条数、去重后条数、重复条数、
+#    使用内容指纹的条数和布隆过滤器误判次数
+# 依赖库：hashlib, math, sqlite3
+# ------------------------------------------
+
+import hashlib
+import math
+import sqlite3
+
+from instrumentation import count
+
+# 没有房源编号时参与内容指纹的字段（不含行政区：推广房源在各区列表中的行政区标注不同；不含价格和关注人数）
+FINGERPRINT_FIELDS = ['Title', 'Community', 'Layout', 'Area', 'Orientation', 'Floor', 'BuildingType']
+
+
+def listing_identity(record):
+    """返回 (标识, 来源)：来源为 'id'（房源编号）或 'fingerprint'（内容指纹）"""
+    listing_id = record.get('ListingId')
+    if listing_id:
+        return listing_id, 'id'
+    content = '\x1f'.join(str(record.get(field, '')) for field in FINGERPRINT_FIELDS)
+    return 'fp:' + hashlib.blake2b(content.encode('utf-8'), digest_size=12).hexdigest(), 'fingerprint'
+
+
+class BloomFilter:
+    """
+    布隆过滤器。
+    参数：
+        capacity: 预计元素个数，超过后误判率逐渐升高（由精确集合兜底，结果仍然正确）
+        error_rate: 元素个数不超过 capacity 时的误判率
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # 双重哈希：由一个128位摘要的两半生成 k 个位置
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """加入元素，返回加入前是否“可能存在”（全部位均已置位）"""
+        present = True
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            mask = 1 << bit
+            if not self.bits[byte] & mask:
+                present = False
+                self.bits[byte] |= mask
+        return present
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class SeenStore:
+    """
+    基于 SQLite 的精确集合，记录本次抓取已出现的房源标识及其首次出现的位置。
+    参数：
+        path: 数据库文件路径，为 None 时使用内存数据库
+        reset: 为 True 时清空已有记录（每次抓取对应一个新快照）
+    """
+
+    def __init__(self, path=None, reset=True):
+        self.path = path
+        self._conn = sqlite3.connect(path or ':memory:')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, district TEXT NOT NULL, page INTEGER)')
+        if reset:
+            with self._conn:
+                self._conn.execute('DELETE FROM seen')
+
+    def add(self, listing_id, district, page=None):
+        """加入标识，返回是否为新标识（在同一事务内写入，本连接后续的查询立即可见）"""
+        cursor = self._conn.execute(
+            'INSERT OR IGNORE INTO seen (id, district, page) VALUES (?, ?, ?)', (listing_id, district, page))
+        return cursor.rowcount == 1
+
+    def first_seen(self, listing_id):
+        """返回 (行政区, 页码)，未出现过时返回 None"""
+        return self._conn.execute('SELECT district, page FROM seen WHERE id = ?', (listing_id,)).fetchone()
+
+    def commit(self):
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+class ListingDeduper:
+    """
+    抓取过程中的流式去重器：布隆过滤器判断“一定是新房源”时直接写入精确集合，
+    只有判断“可能重复”时才查询精确集合确认。
+    参数：
+        path: 精确集合的 SQLite 文件路径（None 表示内存数据库）
+        capacity / error_rate: 布隆过滤器参数
+    """
+
+    def __init__(self, path=None, capacity=1_000_000, error_rate=0.01):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.seen = SeenStore(path)
+        # 行政区 -> {parsed, unique, duplicates, fingerprinted, false_positives}
+        self.stats = {}
+
+    def filter(self, records, district, page=None):
+        """过滤一页房源，返回未出现过的房源（保持原顺序）"""
+        stats = self.stats.setdefault(
+            district, {'parsed': 0, 'unique': 0, 'duplicates': 0, 'fingerprinted': 0, 'false_positives': 0})
+        unique = []
+        for record in records:
+            identity, source = listing_identity(record)
+            if source == 'fingerprint':
+                stats['fingerprinted'] += 1
+            if not self.bloom.add(identity):
+                self.seen.add(identity, district, page)
+                unique.append(record)
+            elif self.seen.add(identity, district, page):
+                # 布隆过滤器误判：精确集合中并没有该标识
+                stats['false_positives'] += 1
+                unique.append(record)
+        self.seen.commit()
+        duplicates = len(records) - len(unique)
+        stats['parsed'] += len(records)
+        stats['unique'] += len(unique)
+        stats['duplicates'] += duplicates
+        if duplicates:
+            count('scraper_duplicates_total', duplicates, district=district)
+        return unique
+
+    def totals(self):
+        """全部行政区的合计统计"""
+        keys = ['parsed', 'unique', 'duplicates', 'fingerprinted', 'false_positives']
+        return {key: sum(stats[key] for stats in self.stats.values()) for key in keys}
+
+    def report(self, prefix=''):
+        """打印各行政区的去重统计"""
+        print(f"{prefix}去重统计:")
+        print(f"  {'行政区':<10}{'解析':>8}{'去重后':>8}{'重复':>8}{'重复率':>8}{'内容指纹':>10}{'布隆误判':>10}")
+        rows = sorted(self.stats.items()) + [('合计', self.totals())]
+        for district, stats in rows:
+            rate = stats['duplicates'] / stats['parsed'] * 100 if stats['parsed'] else 0.0
+            print(f"  {district:<10}{stats['parsed']:>8}{stats['unique']:>8}{stats['duplicates']:>8}"
+                  f"{rate:>7.1f}%{stats['fingerprinted']:>10}{stats['false_positives']:>10}")
+
+    def close(self):
+        self.seen.close()
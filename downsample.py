@@ -0,0 +1,88 @@
+# downsample.py
+# ------------------------------------------
+# 本模块为散点图提供服务端降采样。
+# 主要功能：
+# 1. grid_downsample: 在给定视窗内按网格聚合散点，返回点数不超过上限
+# 2. 视窗越小，网格越细，缩放时自动返回更精细的数据
+# 每个返回点为 [x均值, y均值, 该格内的房源数]；视窗内点数不超过上限时原样返回。
+# 依赖库：numpy
+# ------------------------------------------
+
+import math
+
+import numpy as np
+
+
+def _viewport(x, y, bounds):
+    """补全视窗边界，缺省的一侧取数据的极值"""
+    xmin, xmax, ymin, ymax = bounds or (None, None, None, None)
+    xmin = float(np.nanmin(x)) if xmin is None else xmin
+    xmax = float(np.nanmax(x)) if xmax is None else xmax
+    ymin = float(np.nanmin(y)) if ymin is None else ymin
+    ymax = float(np.nanmax(y)) if ymax is None else ymax
+    return xmin, xmax, ymin, ymax
+
+
+def _bin(x, y, viewport, grid):
+    """在视窗内按 grid x grid 的网格聚合，返回 [[x均值, y均值, 数量], ...]"""
+    xmin, xmax, ymin, ymax = viewport
+    x_span = (xmax - xmin) or 1.0
+    y_span = (ymax - ymin) or 1.0
+    ix = np.clip(((x - xmin) / x_span * grid).astype(np.int64), 0, grid - 1)
+    iy = np.clip(((y - ymin) / y_span * grid).astype(np.int64), 0, grid - 1)
+    cells = ix * grid + iy
+    counts = np.bincount(cells, minlength=grid * grid)
+    sum_x = np.bincount(cells, weights=x, minlength=grid * grid)
+    sum_y = np.bincount(cells, weights=y, minlength=grid * grid)
+    occupied = np.nonzero(counts)[0]
+    n = counts[occupied]
+    return np.column_stack([sum_x[occupied] / n, sum_y[occupied] / n, n]).round(2).tolist()
+
+
+def grid_downsample(x, y, max_points=2000, bounds=None, groups=None):
+    """
+    对视窗内的散点做网格降采样。
+    参数：
+        x, y: 坐标数组
+        max_points: 返回点数上限（所有分组合计）
+        bounds: (xmin, xmax, ymin, ymax)，任一项为 None 时取数据极值
+        groups: 与 x 等长的分组标签（如聚类编号），按组分别聚合；视窗内没有点的组也返回（data 为空），
+                各次请求的系列一一对应
+    返回：
+        {'series': [{'name': 组名, 'data': [[x, y, 数量], ...]}], 'total': 视窗内点数,
+         'returned': 返回点数, 'grid': 网格边长（0 表示未聚合）, 'viewport': [...]}
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    groups = np.zeros(len(x), dtype=np.int64) if groups is None else np.asarray(groups)
+    if len(x) == 0:
+        return {'series': [], 'total': 0, 'returned': 0, 'grid': 0, 'viewport': None}
+
+    labels = np.unique(groups)
+    viewport = _viewport(x, y, bounds)
+    xmin, xmax, ymin, ymax = viewport
+    in_view = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    x, y, groups = x[in_view], y[in_view], groups[in_view]
+    total = int(in_view.sum())
+
+    grid = 0
+    if total > max_points and len(labels):
+        # 每组的点数上限为 max_points / 组数，对应网格边长
+        grid = max(1, int(math.sqrt(max_points / len(labels))))
+
+    series = []
+    for label in labels:
+        mask = groups == label
+        if grid:
+            data = _bin(x[mask], y[mask], viewport, grid)
+        else:
+            data = np.column_stack([x[mask], y[mask], np.ones(int(mask.sum()))]).round(2).tolist()
+        series.append({'name': label.item() if hasattr(label, 'item') else label, 'data': data})
+
+    return {
+        'series': series,
+        'total': total,
+        'returned': sum(len(s['data']) for s in series),
+        'grid': grid,
+        'viewport': list(viewport),
+    }
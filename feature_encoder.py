@@ -0,0 +1,153 @@
+# feature_encoder.py
+# ------------------------------------------
+# 本模块提供词表固定的稀疏独热编码器，用于生成机器学习数据。
+# 主要功能：
+# 1. 统计各类别特征的取值频次，生成并持久化类别词表（列索引）
+# 2. 将数据编码为 scipy 稀疏矩阵，列布局只由词表决定，训练与推理完全一致
+# 3. 低频类别与未见过的类别统一归入“其他”列
+# 依赖库：numpy, pandas, scipy
+# ------------------------------------------
+
+import json
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+OTHER_CATEGORY = '其他'
+TARGET_COLUMN = 'TotalPrice'
+
+
+class CategoryEncoder:
+    """
+    稀疏独热编码器。
+    参数：
+        features: 需要编码的类别特征列表
+        numeric_columns: 原样保留的数值列（按顺序排在编码列之前）
+        min_count: 出现次数少于该值的类别归入“其他”
+        drop_first: 是否丢弃每个特征（按排序）的第一个类别，以减少共线性
+    每个特征的编码列依次为：保留的类别（排序后去掉第一个）+ “其他”。
+    被丢弃的第一个类别编码为全0；缺失值同样编码为全0。
+    """
+
+    def __init__(self, features, numeric_columns=None, min_count=1, drop_first=True):
+        self.features = list(features)
+        self.numeric_columns = list(numeric_columns or [])
+        self.min_count = min_count
+        self.drop_first = drop_first
+        self.counts = {f: Counter() for f in self.features}
+        self.vocabulary = None   # {特征: [有独立列的类别]}
+        self.baseline = None     # {特征: 被丢弃的参考类别}
+
+    # ---------- 拟合 ----------
+    def partial_fit(self, df):
+        """累计一批数据的类别频次（可多次调用以支持分块）"""
+        for feature in self.features:
+            self.counts[feature].update(df[feature].dropna().value_counts().to_dict())
+        return self
+
+    def build_vocabulary(self):
+        """根据累计频次生成词表"""
+        self.vocabulary, self.baseline = {}, {}
+        for feature in self.features:
+            kept = sorted(c for c, n in self.counts[feature].items() if n >= self.min_count)
+            if self.drop_first and kept:
+                self.baseline[feature] = kept[0]
+                kept = kept[1:]
+            else:
+                self.baseline[feature] = None
+            self.vocabulary[feature] = kept
+        return self
+
+    def fit(self, df):
+        return self.partial_fit(df).build_vocabulary()
+
+    @property
+    def columns(self):
+        """完整的列索引：数值列 + 各特征的编码列"""
+        names = list(self.numeric_columns)
+        for feature in self.features:
+            names.extend(f'{feature}_{c}' for c in self.vocabulary[feature])
+            names.append(f'{feature}_{OTHER_CATEGORY}')
+        return names
+
+    # ---------- 编码 ----------
+    def transform(self, df):
+        """
+        将 DataFrame 编码为 CSR 稀疏矩阵，列顺序与 self.columns 一致。
+        返回：(矩阵, 未知类别计数 {特征: 行数})
+        """
+        if self.vocabulary is None:
+            raise RuntimeError("编码器尚未生成词表，请先调用 fit 或 load")
+        n_rows = len(df)
+        blocks = []
+        if self.numeric_columns:
+            numeric = df[self.numeric_columns].to_numpy(dtype=np.float64)
+            blocks.append(sparse.csr_matrix(numeric))
+
+        unknown = {}
+        for feature in self.features:
+            vocab = self.vocabulary[feature]
+            values = df[feature]
+            # 类别 -> 列号；参考类别和缺失值为 -1（全0），其余未知类别指向“其他”列
+            codes = pd.Categorical(values, categories=vocab).codes.astype(np.int64)
+            is_other = (codes == -1) & values.notna().to_numpy() & (values != self.baseline[feature]).to_numpy()
+            codes[is_other] = len(vocab)
+            unknown[feature] = int(is_other.sum())
+            rows = np.nonzero(codes >= 0)[0]
+            block = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, codes[rows])), shape=(n_rows, len(vocab) + 1)
+            )
+            blocks.append(block)
+        return sparse.hstack(blocks, format='csr'), unknown
+
+    # ---------- 持久化 ----------
+    def to_dict(self):
+        """词表与列索引的可序列化表示"""
+        return {
+            'features': self.features,
+            'numeric_columns': self.numeric_columns,
+            'min_count': self.min_count,
+            'drop_first': self.drop_first,
+            'vocabulary': self.vocabulary,
+            'baseline': self.baseline,
+            'columns': self.columns,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        encoder = cls(state['features'], state['numeric_columns'], state['min_count'], state['drop_first'])
+        encoder.vocabulary = state['vocabulary']
+        encoder.baseline = state['baseline']
+        return encoder
+
+    def save(self, path):
+        """保存词表与列索引"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def save_ml_dataset(matrix, path):
+    """保存稀疏机器学习矩阵（float32，列索引保存在词表文件中）"""
+    sparse.save_npz(path, matrix.tocsr().astype(np.float32), compressed=True)
+
+
+def load_ml_dataset(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json', target=TARGET_COLUMN):
+    """
+    读取稀疏机器学习数据。
+    返回：(特征矩阵 CSR, 目标向量, 特征列名列表)
+    """
+    matrix = sparse.load_npz(data_path).tocsc()
+    with open(vocab_path, encoding='utf-8') as f:
+        columns = json.load(f)['columns']
+    target_idx = columns.index(target)
+    y = matrix[:, target_idx].toarray().ravel()
+    keep = [i for i in range(len(columns)) if i != target_idx]
+    X = matrix[:, keep].tocsr()
+    return X, y, [columns[i] for i in keep]
@@ -0,0 +1,135 @@
+# fetcher.py
+# ------------------------------------------
+# 本模块为爬虫提供并发抓取引擎。
+# 主要功能：
+# 1. 令牌桶限速器（支持全局限速与按行政区限速）
+# 2. 基于 requests.Session 的长连接池（keep-alive）
+# 3. 针对 429/5xx 及网络错误的指数退避重试
+# 依赖库：requests, threading, time, random
+# ------------------------------------------
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 需要重试的HTTP状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    令牌桶限速器。
+    参数：
+        rate: 每秒产生的令牌数（即每秒允许的请求数），为 None 或 <=0 时不限速
+        capacity: 桶容量（允许的突发请求数），默认为 1
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    组合限速器：先按 key（行政区）限速，再按全局限速。
+    参数：
+        global_rate: 全局每秒请求数
+        per_key_rate: 每个 key 的默认每秒请求数
+        per_key_rates: 针对个别 key 的单独限速，如 {'锦江': 0.5}
+    """
+
+    def __init__(self, global_rate=None, per_key_rate=None, per_key_rates=None):
+        self._global = TokenBucket(global_rate)
+        self._per_key_rate = per_key_rate
+        self._per_key_rates = dict(per_key_rates or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key):
+        with self._lock:
+            if key not in self._buckets:
+                rate = self._per_key_rates.get(key, self._per_key_rate)
+                self._buckets[key] = TokenBucket(rate)
+            return self._buckets[key]
+
+    def acquire(self, key=None):
+        if key is not None:
+            self._bucket(key).acquire()
+        self._global.acquire()
+
+
+class Fetcher:
+    """
+    线程安全的HTTP抓取器，所有线程共享一个带连接池的 Session。
+    参数：
+        headers: 默认请求头
+        concurrency: 并发数，同时决定连接池大小
+        limiter: RateLimiter 实例，为 None 时不限速
+        max_retries: 遇到 429/5xx/网络错误时的最大重试次数
+        backoff: 退避基数（秒），第 n 次重试等待 backoff * 2**n 秒（带随机抖动）
+        timeout: 单次请求超时（秒）
+    """
+
+    def __init__(self, headers=None, concurrency=4, limiter=None, max_retries=3, backoff=1.0, timeout=10):
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        """计算并执行重试前的等待，优先遵循服务端的 Retry-After"""
+        wait = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                wait = max(wait, float(retry_after))
+        time.sleep(wait)
+
+    def fetch(self, url, key=None, headers=None):
+        """
+        抓取单个URL。每次（包括重试）发送请求前都要经过限速器。
+        返回最后一次请求的 Response；重试耗尽后仍为网络错误时抛出 RequestException。
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(key)
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response)
+                continue
+            return response
+
+    def close(self):
+        self.session.close()
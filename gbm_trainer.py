@@ -0,0 +1,186 @@
+# gbm_trainer.py
+# ------------------------------------------
+# 本脚本提供基于直方图梯度提升树的房价回归训练。
+# 主要功能：
+# 1. 直接读取清洗后的数据，类别特征编码为整数后交给 HistGradientBoostingRegressor 原生处理，
+#    不需要独热展开
+# 2. 逐次减半的随机超参数搜索（HalvingRandomSearchCV）：k 折交叉验证、多进程并行、
+#    每个候选模型都启用早停
+# 3. 训练结果按数据哈希缓存（model_store.py），每次训练登记到模型登记表（model_registry.py）
+# 用法：
+#   python gbm_trainer.py [--candidates N] [--cv K] [--jobs N]
+# 依赖库：pandas, numpy, scipy, sklearn
+# ------------------------------------------
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.stats import loguniform, randint
+from sklearn import metrics
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 启用逐次减半搜索
+from sklearn.model_selection import HalvingRandomSearchCV, KFold, train_test_split
+
+from data_cleaner import FEATURES_TO_ENCODE
+from feature_encoder import TARGET_COLUMN
+from instrumentation import run_report, timed
+from model_registry import list_runs, record_run
+from model_store import artifact_key, load_artifact, save_artifact
+from storage import load_table
+
+# 原生类别特征与数值特征（不含单价和关注人数，原因见 machine_learning.SERVING_EXCLUDED_FEATURES）
+GBM_CATEGORICAL_FEATURES = FEATURES_TO_ENCODE
+GBM_NUMERIC_FEATURES = ['Area', 'YearBuilt', 'RoomCount']
+# 每个类别特征最多保留的类别数（HistGradientBoosting 要求类别编号小于 max_bins=255），其余归入“其他”
+MAX_CATEGORIES = 254
+# 每个候选模型的最大迭代次数（由早停决定实际次数）
+GBM_MAX_ITER = 1000
+# 超参数搜索空间
+GBM_PARAM_DISTRIBUTIONS = {
+    'learning_rate': loguniform(0.02, 0.3),
+    'max_leaf_nodes': randint(15, 128),
+    'min_samples_leaf': randint(10, 200),
+    'l2_regularization': loguniform(1e-3, 10),
+}
+# 搜索预算：首轮候选数、交叉验证折数、首轮每个候选使用的最少样本数
+GBM_SEARCH = {'n_candidates': 32, 'cv': 5, 'min_resources': 2000, 'factor': 3}
+GBM_ARTIFACT_VERSION = 1
+
+
+def category_vocabulary(df, features=GBM_CATEGORICAL_FEATURES, max_categories=MAX_CATEGORIES):
+    """每个类别特征按频次保留最多 max_categories 个类别"""
+    return {
+        feature: [str(v) for v in df[feature].value_counts().index[:max_categories]]
+        for feature in features
+    }
+
+
+def encode_features(df, vocabulary):
+    """
+    生成模型输入矩阵：类别特征在前（编号 0..n-1，其余类别为 n，缺失为 NaN），数值特征在后。
+    """
+    columns = []
+    for feature, categories in vocabulary.items():
+        values = df[feature].astype(object)
+        codes = pd.Categorical(values.where(values.isna(), values.astype(str)), categories=categories).codes
+        codes = codes.astype(np.float64)
+        codes[(codes == -1) & values.notna().to_numpy()] = len(categories)
+        codes[values.isna().to_numpy()] = np.nan
+        columns.append(codes)
+    for feature in GBM_NUMERIC_FEATURES:
+        columns.append(pd.to_numeric(df[feature], errors='coerce').to_numpy(dtype=np.float64))
+    return np.column_stack(columns)
+
+
+def _evaluate(y_true, y_pred):
+    return {
+        'R-squared': metrics.r2_score(y_true, y_pred),
+        'Mean Absolute Error (MAE)': metrics.mean_absolute_error(y_true, y_pred),
+        'Root Mean Squared Error (RMSE)': np.sqrt(metrics.mean_squared_error(y_true, y_pred)),
+    }
+
+
+def gbm_key(data_path='chengdu_cleaned_data.parquet', search=None):
+    """梯度提升模型产物的缓存键"""
+    params = {
+        'search': dict(GBM_SEARCH, **(search or {})),
+        'space': {k: [v.dist.name, list(v.args)] for k, v in GBM_PARAM_DISTRIBUTIONS.items()},
+        'max_iter': GBM_MAX_ITER, 'features': GBM_CATEGORICAL_FEATURES + GBM_NUMERIC_FEATURES,
+    }
+    return artifact_key('gbm_model', [data_path], params, GBM_ARTIFACT_VERSION)
+
+
+def train_gbm(data_path='chengdu_cleaned_data.parquet', n_jobs=-1, **search):
+    """
+    训练梯度提升回归模型，返回产物字典：
+    model, vocabulary, best_params, evaluation, search_summary
+    search 可覆盖 GBM_SEARCH 中的搜索预算（n_candidates, cv, min_resources, factor）。
+    """
+    search = dict(GBM_SEARCH, **search)
+    df = load_table(data_path, columns=GBM_CATEGORICAL_FEATURES + GBM_NUMERIC_FEATURES + [TARGET_COLUMN])
+    vocabulary = category_vocabulary(df)
+    X = encode_features(df, vocabulary)
+    y = df[TARGET_COLUMN].to_numpy(dtype=np.float64)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    base = HistGradientBoostingRegressor(
+        categorical_features=[True] * len(vocabulary) + [False] * len(GBM_NUMERIC_FEATURES),
+        max_iter=GBM_MAX_ITER, early_stopping=True, validation_fraction=0.1, n_iter_no_change=20,
+        random_state=42,
+    )
+    searcher = HalvingRandomSearchCV(
+        base, GBM_PARAM_DISTRIBUTIONS,
+        n_candidates=search['n_candidates'], factor=search['factor'],
+        min_resources=min(search['min_resources'], len(X_train)),
+        cv=KFold(n_splits=search['cv'], shuffle=True, random_state=42),
+        scoring='neg_mean_absolute_error', n_jobs=n_jobs, random_state=42,
+    )
+    print(f"\n正在进行逐次减半超参数搜索（{search['n_candidates']} 个候选，{search['cv']} 折交叉验证）...")
+    searcher.fit(X_train, y_train)
+
+    model = searcher.best_estimator_
+    evaluation = _evaluate(y_test, model.predict(X_test))
+    print(f"最优参数: {searcher.best_params_}（早停于第 {model.n_iter_} 轮）")
+    print("\n梯度提升模型评估结果:")
+    for metric, value in evaluation.items():
+        print(f"{metric}: {value:.4f}")
+
+    summary = pd.DataFrame(searcher.cv_results_)[['iter', 'n_resources', 'mean_test_score', 'params']]
+    return {
+        'model': model, 'vocabulary': vocabulary,
+        'best_params': dict(searcher.best_params_, n_iter=int(model.n_iter_)),
+        'evaluation': evaluation, 'search_summary': summary,
+    }
+
+
+def run_gbm_model(data_path='chengdu_cleaned_data.parquet', use_cache=True, n_jobs=-1, **search):
+    """训练（或从缓存加载）梯度提升模型并登记训练记录，返回评估结果"""
+    key = gbm_key(data_path, search)
+    _, artifact = load_artifact('gbm_model', key) if use_cache else (None, None)
+    if artifact is None:
+        with timed('model_train_seconds', model='gbm_model') as timer:
+            artifact = train_gbm(data_path, n_jobs=n_jobs, **search)
+        record_run('gbm_model', [data_path], artifact['best_params'], artifact['evaluation'],
+                   timer.seconds, key, search=dict(GBM_SEARCH, **search))
+        save_artifact('gbm_model', key, artifact)
+    return artifact['evaluation']
+
+
+def predict_gbm(df, key=None, data_path='chengdu_cleaned_data.parquet'):
+    """用已保存的梯度提升模型预测总价（万元）；key 为 None 时使用 data_path 上按默认搜索参数训练的模型"""
+    _, artifact = load_artifact('gbm_model', key or gbm_key(data_path, {}))
+    if artifact is None:
+        raise FileNotFoundError('未找到已训练的梯度提升模型，请先运行 gbm_trainer.py')
+    return artifact['model'].predict(encode_features(df, artifact['vocabulary']))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='梯度提升回归训练（原生类别特征 + 逐次减半搜索）')
+    arg_parser.add_argument('--data', default='chengdu_cleaned_data.parquet', help='清洗后的数据文件')
+    arg_parser.add_argument('--candidates', type=int, default=GBM_SEARCH['n_candidates'], help='首轮候选数')
+    arg_parser.add_argument('--cv', type=int, default=GBM_SEARCH['cv'], help='交叉验证折数')
+    arg_parser.add_argument('--jobs', type=int, default=-1, help='并行进程数（-1 为全部核心）')
+    arg_parser.add_argument('--no-cache', action='store_true', help='忽略缓存重新训练')
+    args = arg_parser.parse_args()
+
+    try:
+        with run_report('gbm_trainer'):
+            run_gbm_model(args.data, use_cache=not args.no_cache, n_jobs=args.jobs,
+                          n_candidates=args.candidates, cv=args.cv)
+    except FileNotFoundError:
+        print(f"错误: 未找到清洗后的数据文件 '{args.data}'。请先运行 data_cleaner.py。")
+        return
+
+    print("\n模型登记表（各模型最近一次训练）:")
+    latest = {}
+    for run in list_runs():
+        latest[run['name']] = run
+    for name, run in latest.items():
+        r2 = run['metrics'].get('R-squared', float('nan'))
+        mae = run['metrics'].get('Mean Absolute Error (MAE)', float('nan'))
+        print(f"  {name:<14} R2={r2:.4f}  MAE={mae:.2f}  训练耗时={run['train_seconds']:.1f}s  ({run['time']})")
+
+
+if __name__ == '__main__':
+    main()
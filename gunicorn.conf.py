@@ -0,0 +1,47 @@
+# gunicorn.conf.py
+# ------------------------------------------
+# 多进程部署配置：主进程预加载数据和模型一次，再 fork 出各工作进程。
+# 主要功能：
+# 1. preload_app: 数据、聚合立方体、查询索引和模型只在主进程加载，工作进程通过写时复制共享
+# 2. gc.freeze: fork 前把已加载的对象移出垃圾回收的追踪范围，避免工作进程中的垃圾回收
+#    改写这些对象的头部、导致共享页被复制
+# 3. post_fork: 在每个工作进程中启动后台线程（线程不能跨越 fork）；工作进程不训练模型，
+#    刷新线程定期检查数据文件和流水线构建记录，重新加载 pipeline.py 产出的新数据和新模型
+# 用法：
+#   gunicorn app:app                        # 使用本配置（gunicorn 默认读取当前目录的 gunicorn.conf.py）
+#   WEB_WORKERS=8 gunicorn app:app
+#   python pipeline.py                      # 更新数据或模型，各工作进程在 MODEL_REFRESH_INTERVAL 秒内自动加载
+# 注意：preload_app 模式下 HUP 信号只会用主进程中已加载的旧应用重新 fork 工作进程，不会重新预加载。
+# 工作进程自行重新加载的数据不再与其他进程共享；需要恢复写时复制共享时请完全重启 gunicorn
+# （停止后重新启动，或发送 USR2 启动新主进程后向旧主进程发送 QUIT）。
+# 依赖库：gunicorn
+# ------------------------------------------
+
+import gc
+import os
+
+# 告知 app.py 以预加载模式运行（须在加载 app 之前设置）
+os.environ.setdefault('HOUSEPRICE_PRELOAD', '1')
+
+bind = os.environ.get('WEB_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_WORKERS', '4'))
+# 预测接口的微批处理器依赖同一进程内的并发请求，每个工作进程使用多个线程
+threads = int(os.environ.get('WEB_THREADS', '8'))
+preload_app = os.environ['HOUSEPRICE_PRELOAD'] == '1'
+
+if preload_app:
+    # 加载期间关闭自动垃圾回收，减少内存空洞（fork 前统一冻结）
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        gc.freeze()
+        server.log.info('已冻结 %d 个预加载对象', gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        from app import start_background_tasks
+        start_background_tasks(train=False)
@@ -0,0 +1,393 @@
+# incremental_cleaner.py
+# ------------------------------------------
+# 本模块实现基于房源标识的增量清洗。
+# 主要功能：
+# 1. 为每条原始房源生成稳定的房源键（有房源编号时取编号，否则取 dedup.py 中不含行政区的内容指纹字段，
+#    推广房源跨区重复或区名标注变化时键不变）和内容哈希
+# 2. 与上次处理的快照逐键比较：只对新增或内容变化的房源做类型转换、地名标准化等清洗；
+#    最新快照中已不存在的房源（下架）写入删除标记，其面积与年份从草图中减去
+# 3. 面积四分位数与年份中位数以分位数草图的形式持久化，随增量加入/移除而更新
+# 4. 由暂存区按最新的全局统计量生成可视化数据与机器学习数据；快照没有变化时不重写输出
+# 5. 聚合立方体随之增量更新（减去移除的行、加入新增的行以及因IQR边界移动而进出的行），
+#    保存在新输出的缓存键下，流水线与Web应用直接加载，无需重新扫描全部数据（见 cube.py）
+# 状态目录结构（每次提交写入新编号的文件，最后原子替换 manifest.json，中途崩溃不会使草图与暂存区不一致）：
+#   <state_dir>/manifest.json         —— 当前有效的暂存分片、键索引、草图文件及已处理的数据源
+#   <state_dir>/part-00000.parquet    —— 暂存区分片（未过滤、未填充年份的清洗结果）
+#   <state_dir>/tomb-00000.parquet    —— 删除标记（下架房源的房源键），与暂存分片按提交顺序生效
+#   <state_dir>/index-00000.parquet   —— 当前房源的键索引（房源键、内容哈希、面积、年份），用于比较快照
+#   <state_dir>/stats-00000.json      —— 面积、年份分位数草图
+# 依赖库：pandas, pyarrow, data_cleaner.py, cube.py, dedup.py, sketches.py, storage.py
+# ------------------------------------------
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_cleaner import (
+    AREA_SKETCH_PRECISION, add_features, area_bounds, convert_types, extract_year, fill_year,
+    filter_area, get_encoder, iter_raw_chunks, report_unknown, sort_by_district, standardize_districts,
+)
+from cube import CUBE_COLUMNS, AggregateCube, cube_key
+from dedup import FINGERPRINT_FIELDS
+from feature_encoder import save_ml_dataset
+from model_store import load_artifact, save_artifact
+from raw_store import ID_COLUMN, RAW_COLUMNS, is_raw_dataset, latest_snapshot
+from sketches import QuantileSketch
+from storage import save_table
+
+# 生成房源键所需的原始列：房源编号，以及没有编号时的内容指纹字段（与 dedup.listing_identity 一致，不含行政区）
+KEY_COLUMNS = [ID_COLUMN] + FINGERPRINT_FIELDS
+# 旧版房源键使用的字段（含行政区），只用于迁移旧版价格历史（见 price_history.py）
+LEGACY_KEY_COLUMNS = ['District', 'Title', 'Community', 'Area']
+# 暂存区分片数超过该值时合并为一个文件
+MAX_STAGED_PARTS = 20
+# 状态格式版本：房源键或暂存格式变化时递增，旧版本的状态会被丢弃并全量重建
+STATE_VERSION = 3
+# 比较快照时每批读取的原始行数
+DIFF_BATCH_SIZE = 100_000
+INDEX_COLUMNS = ['ListingKey', 'RowHash', 'Area', 'YearBuilt']
+
+
+def listing_keys(raw):
+    """
+    生成稳定的64位房源键（哈希种子固定，跨运行一致）：有房源编号的行按编号生成，
+    没有编号的行（早期数据）按 dedup.FINGERPRINT_FIELDS 的内容生成；两者都不含行政区。
+    raw 中缺少的列按空字符串处理。
+    """
+    fields = pd.DataFrame({col: raw[col].fillna('').astype(str) if col in raw.columns else ''
+                           for col in FINGERPRINT_FIELDS}, index=raw.index)
+    keys = pd.util.hash_pandas_object(fields, index=False).to_numpy()
+    if ID_COLUMN in raw.columns:
+        ids = raw[ID_COLUMN]
+        has_id = (ids.notna() & (ids.astype(str) != '')).to_numpy()
+        if has_id.any():
+            id_keys = pd.util.hash_pandas_object('id:' + ids[has_id].astype(str), index=False).to_numpy()
+            keys[has_id] = id_keys
+    return keys
+
+
+def legacy_listing_keys(raw):
+    """旧版房源键（District+Title+Community+Area 的哈希），只用于把旧版价格历史迁移到新的房源键"""
+    return pd.util.hash_pandas_object(raw[LEGACY_KEY_COLUMNS].astype(str), index=False).to_numpy()
+
+
+def row_hashes(raw):
+    """原始记录的内容哈希，用于判断房源信息是否变化（原始字段均为字符串，直接按列哈希）"""
+    columns = [col for col in RAW_COLUMNS if col in raw.columns]
+    return pd.util.hash_pandas_object(raw[columns], index=False).to_numpy()
+
+
+def source_id(input_path):
+    """
+    数据源标识：分区目录为最新快照名及其文件的大小与修改时间，csv 为文件的大小与修改时间。
+    标识与上次处理时相同说明原始数据没有变化。
+    """
+    if is_raw_dataset(input_path):
+        snapshot = latest_snapshot(input_path)
+        files = []
+        for district_dir in sorted(os.listdir(input_path)):
+            snapshot_dir = os.path.join(input_path, district_dir, f'Snapshot={snapshot}')
+            if os.path.isdir(snapshot_dir):
+                for name in sorted(os.listdir(snapshot_dir)):
+                    stat = os.stat(os.path.join(snapshot_dir, name))
+                    files.append([district_dir, name, stat.st_size, stat.st_mtime_ns])
+        return {'snapshot': snapshot, 'files': files}
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(input_path)
+    stat = os.stat(input_path)
+    return {'snapshot': None, 'files': [[input_path, stat.st_size, stat.st_mtime_ns]]}
+
+
+class CleanState:
+    """
+    增量清洗的持久化状态：暂存区分片 + 键索引 + 全局统计量草图。
+    所有文件由 manifest.json 引用，commit() 写完新文件后原子替换清单，未被引用的文件视为未完成的写入并删除。
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.manifest_path = os.path.join(state_dir, 'manifest.json')
+        manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != STATE_VERSION:
+                print("增量清洗状态的格式已变化，将全量重建。")
+                manifest = None
+        self.manifest = manifest or {'version': STATE_VERSION, 'seq': 0, 'parts': [], 'index': None,
+                                     'stats': None, 'source': None}
+        if self.manifest['stats']:
+            with open(self._path(self.manifest['stats']), encoding='utf-8') as f:
+                stats = json.load(f)
+            self.area_sketch = QuantileSketch.from_dict(stats['area'])
+            self.year_sketch = QuantileSketch.from_dict(stats['year'])
+        else:
+            self.area_sketch = QuantileSketch(precision=AREA_SKETCH_PRECISION)
+            self.year_sketch = QuantileSketch(precision=0)
+        self._remove_unreferenced()
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name)
+
+    def _next_name(self, prefix, ext):
+        self.manifest['seq'] += 1
+        return f"{prefix}-{self.manifest['seq']:05d}{ext}"
+
+    def _remove_unreferenced(self):
+        referenced = set(self.manifest['parts']) | {self.manifest['index'], self.manifest['stats'], 'manifest.json'}
+        for name in os.listdir(self.state_dir):
+            if name not in referenced and name.endswith(('.parquet', '.json', '.tmp')):
+                os.remove(self._path(name))
+
+    @property
+    def parts(self):
+        return [self._path(name) for name in self.manifest['parts']]
+
+    def read_index(self):
+        """读取上次提交的键索引（只有四个数值列），没有时返回空表"""
+        if not self.manifest['index']:
+            return pd.DataFrame({'ListingKey': pd.Series(dtype='uint64'), 'RowHash': pd.Series(dtype='uint64'),
+                                 'Area': pd.Series(dtype=float), 'YearBuilt': pd.Series(dtype=float)})
+        return pq.read_table(self._path(self.manifest['index'])).to_pandas()
+
+    def read_staged(self, columns=None):
+        """
+        读取暂存区：同一房源键出现在多个分片时以最新分片为准；
+        删除标记晚于该房源最后一次写入时，房源视为已下架并被剔除。
+        """
+        if columns is not None and 'ListingKey' not in columns:
+            columns = ['ListingKey'] + list(columns)
+        frames, tombs = [], []
+        for seq, name in enumerate(self.manifest['parts']):
+            table = pq.read_table(self._path(name), columns=['ListingKey'] if name.startswith('tomb-') else columns)
+            (tombs if name.startswith('tomb-') else frames).append(table.to_pandas().assign(_seq=seq))
+        if not frames:
+            return None
+        staged = pd.concat(frames, ignore_index=True).drop_duplicates('ListingKey', keep='last')
+        if tombs:
+            deleted_at = pd.concat(tombs, ignore_index=True).groupby('ListingKey')['_seq'].max()
+            tomb_seq = staged['ListingKey'].map(deleted_at)
+            staged = staged[tomb_seq.isna().to_numpy() | (staged['_seq'] > tomb_seq).to_numpy()]
+        return staged.drop(columns='_seq').reset_index(drop=True)
+
+    def commit(self, delta_clean, deleted_keys, index, source):
+        """
+        提交一次增量：新的暂存分片、删除标记、键索引和草图写入新编号的文件，
+        最后原子替换清单。分片过多时先合并再提交。
+        """
+        old_files = set(self.manifest['parts']) | {self.manifest['index'], self.manifest['stats']}
+        if len(delta_clean):
+            name = self._next_name('part', '.parquet')
+            pq.write_table(pa.Table.from_pandas(delta_clean, preserve_index=False), self._path(name))
+            self.manifest['parts'].append(name)
+        if len(deleted_keys):
+            name = self._next_name('tomb', '.parquet')
+            tombstones = pa.table({'ListingKey': pa.array(deleted_keys, type=pa.uint64())})
+            pq.write_table(tombstones, self._path(name))
+            self.manifest['parts'].append(name)
+        if len(self.manifest['parts']) > MAX_STAGED_PARTS:
+            self._compact()
+
+        index_name = self._next_name('index', '.parquet')
+        pq.write_table(pa.Table.from_pandas(index[INDEX_COLUMNS], preserve_index=False), self._path(index_name))
+        stats_name = self._next_name('stats', '.json')
+        with open(self._path(stats_name), 'w', encoding='utf-8') as f:
+            json.dump({'area': self.area_sketch.to_dict(), 'year': self.year_sketch.to_dict()}, f)
+        self.manifest.update(index=index_name, stats=stats_name, source=source)
+        self._save_manifest()
+        for name in old_files - set(self.manifest['parts']) - {index_name, stats_name}:
+            if name and os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def record_output(self, cube, bounds):
+        """记录最近一次输出对应的立方体缓存键与面积边界，供下次增量更新立方体"""
+        self.manifest['output'] = {'cube': cube, 'bounds': list(bounds)}
+        self._save_manifest()
+
+    def record_source(self, source):
+        """数据源有变化但没有增量时（如重新抓取的快照内容相同），只更新清单中的数据源标识"""
+        self.manifest['source'] = source
+        self._save_manifest()
+
+    def _compact(self):
+        """将所有暂存分片合并为一个（已下架的房源与删除标记随之清除），旧分片在提交清单后删除"""
+        staged = self.read_staged()
+        name = self._next_name('part', '.parquet')
+        pq.write_table(pa.Table.from_pandas(staged, preserve_index=False), self._path(name))
+        self.manifest['parts'] = [name]
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def _transform_delta(raw, city=None):
+    """对新增/变化的原始记录做与 clean_data 相同的逐行清洗（不含依赖全局统计量的步骤）"""
+    df = convert_types(raw.copy())
+    df = extract_year(df)
+    df['District'] = standardize_districts(df['District'], city)
+    return add_features(df)
+
+
+def _previous_cube(state, viz_output):
+    """上次输出对应的立方体及其面积边界；可视化数据文件已被其他方式改写（缓存键不一致）时返回 (None, None)"""
+    output = state.manifest.get('output')
+    if not output or not os.path.exists(viz_output) or cube_key(viz_output) != output['cube']:
+        return None, None
+    _, cube = load_artifact('cube', output['cube'])
+    return (cube, tuple(output['bounds'])) if cube is not None else (None, None)
+
+
+def _in_bounds(df, bounds):
+    return df['Area'].between(*bounds).to_numpy()
+
+
+def update_cube(cube, previous, removed_keys, delta_clean, staged, old_bounds, new_bounds):
+    """
+    增量更新立方体，使其与按新边界过滤后的输出一致：
+    减去旧边界内被移除（下架或变化）的旧记录，以及未变化但因边界移动而移出的记录；
+    加入新边界内的新增/变化记录，以及因边界移动而移入的记录。
+    只有这几部分行参与聚合，耗时与增量大小有关。
+    """
+    if previous is not None and len(removed_keys):
+        removed = previous[previous['ListingKey'].isin(removed_keys)]
+        cube.remove(removed[_in_bounds(removed, old_bounds)])
+    delta_keys = delta_clean['ListingKey'] if len(delta_clean) else []
+    kept = staged[~staged['ListingKey'].isin(delta_keys)]
+    was_in, now_in = _in_bounds(kept, old_bounds), _in_bounds(kept, new_bounds)
+    cube.remove(kept[was_in & ~now_in])
+    cube.append(kept[now_in & ~was_in])
+    if len(delta_clean):
+        cube.append(delta_clean[_in_bounds(delta_clean, new_bounds)])
+    return cube
+
+
+def diff_snapshot(input_path, index, batch_size=DIFF_BATCH_SIZE):
+    """
+    按批读取最新快照，与上次的键索引比较。
+    返回 (增量原始记录, 快照中的全部房源键)：增量为新增或内容变化的房源，同一房源键以最后一次出现为准。
+    内存中只保留增量行和每行16字节的键与哈希。
+    """
+    known_keys = pd.Index(index['ListingKey'].to_numpy())
+    known_hashes = index['RowHash'].to_numpy()
+    deltas, all_keys = [], []
+    for raw in iter_raw_chunks(input_path, batch_size, columns=RAW_COLUMNS + [ID_COLUMN]):
+        keys, hashes = listing_keys(raw), row_hashes(raw)
+        raw = raw.drop(columns=ID_COLUMN, errors='ignore')
+        all_keys.append(keys)
+        # 键索引中每个房源键只出现一次，直接按位置取出上次的内容哈希（避免缺失值把64位哈希转成浮点数）；
+        # 新房源（位置为 -1，键索引为空时全部如此）不参与哈希比较
+        position = known_keys.get_indexer(keys)
+        is_delta = position < 0
+        known = ~is_delta
+        is_delta[known] = known_hashes[position[known]] != hashes[known]
+        if is_delta.any():
+            deltas.append(raw[is_delta].assign(ListingKey=keys[is_delta], RowHash=hashes[is_delta]))
+    all_keys = np.unique(np.concatenate(all_keys)) if all_keys else np.array([], dtype=np.uint64)
+    if not deltas:
+        return None, all_keys
+    delta = pd.concat(deltas, ignore_index=True).drop_duplicates('ListingKey', keep='last')
+    return delta, all_keys
+
+
+def clean_data_incremental(input_path='chengdu_raw_data', viz_output='chengdu_cleaned_data.parquet',
+                           ml_output='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json',
+                           state_dir='chengdu_clean_state', refit_vocab=False, city=None):
+    """
+    增量清洗：与上次处理的快照逐键比较，只转换新增或内容变化的房源，并为下架的房源写入删除标记。
+    字符串解析、地名标准化等逐行清洗的开销只与增量行数有关；比较快照只需按批哈希最新快照；
+    面积IQR边界与年份中位数由持久化的分位数草图直接给出（下架与变化房源的旧值会被减去），
+    除同一房源在快照中重复出现时只保留最后一条外，结果与对最新快照做全量清洗一致。
+    最后按最新边界从暂存区（已是类型化的列式数据）向量化地生成两份输出（下游读取的是完整文件，有增量时需整体重写）；
+    快照没有变化或没有任何增量时直接返回，不重写输出。
+    """
+    try:
+        source = source_id(input_path)
+    except FileNotFoundError:
+        print(f"错误: 未找到原始数据文件 '{input_path}'。请先运行 1_scraper.py。")
+        return
+    state = CleanState(state_dir)
+    outputs_exist = os.path.exists(viz_output) and os.path.exists(ml_output)
+    if source == state.manifest['source'] and outputs_exist:
+        print("原始数据自上次增量清洗以来没有变化，无需处理。")
+        return
+
+    # --- 与上次的键索引比较，找出新增、变化与下架的房源 ---
+    index = state.read_index()
+    delta, snapshot_keys = diff_snapshot(input_path, index)
+    is_deleted = ~index['ListingKey'].isin(snapshot_keys)
+    if delta is not None:
+        is_changed = index['ListingKey'].isin(delta['ListingKey'])
+    else:
+        is_changed = pd.Series(False, index=index.index)
+    removed = index[is_deleted | is_changed]
+    n_delta = 0 if delta is None else len(delta)
+    print(f"快照 {source['snapshot'] or input_path}: 共 {len(snapshot_keys)} 条，"
+          f"新增 {n_delta - int(is_changed.sum())} 条，变化 {int(is_changed.sum())} 条，下架 {int(is_deleted.sum())} 条")
+
+    cube, old_bounds = _previous_cube(state, viz_output)
+    previous = None
+    delta_clean = pd.DataFrame()
+    removed_keys = removed['ListingKey'].to_numpy()
+    if n_delta == 0 and not is_deleted.any():
+        state.record_source(source)
+        if outputs_exist:
+            print("没有增量，无需重写输出。")
+            return
+    else:
+        if cube is not None and len(removed_keys):
+            # 被移除房源的旧记录只在提交前的暂存区中，只读取立方体需要的列
+            previous = state.read_staged(columns=CUBE_COLUMNS)
+        # --- 更新全局统计量草图：移除旧值、加入新值 ---
+        state.area_sketch.remove(removed['Area'])
+        state.year_sketch.remove(removed['YearBuilt'])
+        if n_delta:
+            delta_clean = _transform_delta(delta, city)
+            state.area_sketch.update(delta_clean['Area'])
+            state.year_sketch.update(delta_clean['YearBuilt'])
+        kept = index[~(is_deleted | is_changed)]
+        new_index = pd.concat([kept, delta_clean[INDEX_COLUMNS]], ignore_index=True) if n_delta else kept
+        state.commit(delta_clean, index.loc[is_deleted, 'ListingKey'].to_numpy(), new_index, source)
+
+    # --- 由暂存区生成输出 ---
+    staged = state.read_staged()
+    if staged is None or staged.empty:
+        print("错误: 增量清洗后没有剩余数据。")
+        return
+    year_median = state.year_sketch.median()
+    lower_bound, upper_bound = area_bounds(state.area_sketch.quantile(0.25), state.area_sketch.quantile(0.75))
+    print(f"年份中位数: {year_median}，面积有效范围: [{lower_bound:.2f}, {upper_bound:.2f}]")
+
+    df = filter_area(staged, lower_bound, upper_bound).drop(columns=['ListingKey', 'RowHash'])
+    df = sort_by_district(fill_year(df.copy(), year_median))
+    save_table(df, viz_output)
+    print(f"可视化数据已保存至: {viz_output}（{len(df)} 行）")
+
+    bounds = (lower_bound, upper_bound)
+    if cube is not None:
+        cube = update_cube(cube, previous, removed_keys, delta_clean, staged, old_bounds, bounds)
+        print("聚合立方体已增量更新。")
+    else:
+        cube = AggregateCube.from_frame(df)
+    new_cube_key = cube_key(viz_output)
+    save_artifact('cube', new_cube_key, cube)
+    state.record_output(new_cube_key, bounds)
+
+    encoder, is_new_vocab = get_encoder(df, vocab_path, refit_vocab)
+    if is_new_vocab:
+        encoder.fit(df)
+        encoder.save(vocab_path)
+        print(f"类别词表已保存至: {vocab_path}")
+    ml_matrix, unknown = encoder.transform(df)
+    report_unknown(unknown)
+    save_ml_dataset(ml_matrix, ml_output)
+    print(f"机器学习数据已保存至: {ml_output}（形状 {ml_matrix.shape}）")
+
+    print("\n增量清洗完成！")
@@ -0,0 +1,254 @@
+# instrumentation.py
+# ------------------------------------------
+# 本模块提供轻量的埋点工具，用于定位流水线和 Web 应用中的耗时环节。
+# 主要功能：
+# 1. timed: 计时上下文管理器/装饰器，记录耗时直方图，并在结束时更新进程内存峰值；
+#    有运行报告时同时记录环节开始和结束时的常驻内存
+# 2. count / set_gauge: 计数器与仪表
+# 3. render_prometheus: 以 Prometheus 文本格式导出全部指标（app.py 的 /metrics 接口）
+# 4. run_report: 批处理运行期间收集每个环节的耗时与内存增量，结束后打印并保存为 JSON 报告
+# 每次记录只需一次加锁和几次字典操作，可常驻在热点路径上。
+# 依赖库：resource, threading, json
+# ------------------------------------------
+
+import bisect
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_PREFIX = 'houseprice_'
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+RUN_REPORT_DIR = 'run_reports'
+
+_lock = threading.Lock()
+_counters = {}     # (名称, 标签) -> 值
+_gauges = {}       # (名称, 标签) -> 值
+_histograms = {}   # (名称, 标签) -> [各桶计数..., 总数, 总和]
+_help = {}
+_active_reports = []
+_local = threading.local()
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def peak_rss_bytes():
+    """进程常驻内存的历史峰值（字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """进程当前的常驻内存（字节），不支持 /proc 的平台返回历史峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def describe(name, text):
+    """为指标添加说明（导出为 # HELP）"""
+    _help[name] = text
+
+
+def count(name, value=1, **labels):
+    """计数器加 value"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """设置仪表的当前值"""
+    with _lock:
+        _gauges[(name, _labels_key(labels))] = value
+
+
+def observe(name, seconds, **labels):
+    """向耗时直方图记录一次观测"""
+    key = (name, _labels_key(labels))
+    index = bisect.bisect_left(DEFAULT_BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        if index < len(DEFAULT_BUCKETS):
+            hist[index] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+
+
+class timed:
+    """
+    计时器，可作为上下文管理器或装饰器使用：
+        with timed('clean_stage_seconds', stage='convert_types'): ...
+        @timed('model_train_seconds', model='kmeans')
+    结束时记录耗时直方图、更新内存峰值仪表，并写入正在进行的运行报告。
+    进程内存峰值是累计值，不能反映单个环节；运行报告中记录的是环节开始和结束时的常驻内存
+    （只在有运行报告时读取，热点路径上没有额外开销）。
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.labels.get('stage') or next(iter(self.labels.values()), self.name))
+        self._rss_entry = current_rss_bytes() if _active_reports else None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        stack = _local.stack
+        path = '/'.join(stack)
+        stack.pop()
+        observe(self.name, self.seconds, **self.labels)
+        peak = peak_rss_bytes()
+        set_gauge('process_peak_rss_bytes', peak)
+        if _active_reports:
+            rss_exit = current_rss_bytes()
+            rss_entry = rss_exit if self._rss_entry is None else self._rss_entry
+            span = {'stage': path, 'metric': self.name, 'seconds': self.seconds,
+                    'rss_exit_mb': rss_exit / 1024 ** 2, 'rss_delta_mb': (rss_exit - rss_entry) / 1024 ** 2}
+            with _lock:
+                for report in _active_reports:
+                    report.add(span)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+# ==================== Prometheus 导出 ====================
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in items)
+    return '{' + body + '}'
+
+
+def render_prometheus():
+    """以 Prometheus 文本格式（0.0.4）导出全部指标"""
+    set_gauge('process_peak_rss_bytes', peak_rss_bytes())
+    with _lock:
+        counters, gauges = dict(_counters), dict(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    lines = []
+
+    def header(name, kind):
+        full = METRIC_PREFIX + name
+        if name in _help:
+            lines.append(f'# HELP {full} {_help[name]}')
+        lines.append(f'# TYPE {full} {kind}')
+        return full
+
+    for kind, series in (('counter', counters), ('gauge', gauges)):
+        for name in sorted({n for n, _ in series}):
+            full = header(name, kind)
+            for (n, labels), value in sorted(series.items()):
+                if n == name:
+                    lines.append(f'{full}{_format_labels(labels)} {value}')
+
+    for name in sorted({n for n, _ in histograms}):
+        full = header(name, 'histogram')
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(DEFAULT_BUCKETS, hist):
+                cumulative += bucket
+                lines.append(f'{full}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{full}_bucket{_format_labels(labels, [("le", "+Inf")])} {hist[-2]}')
+            lines.append(f'{full}_count{_format_labels(labels)} {hist[-2]}')
+            lines.append(f'{full}_sum{_format_labels(labels)} {hist[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== 运行报告 ====================
+
+class RunReport:
+    """
+    一次批处理运行的环节耗时报告：按环节路径汇总次数、总耗时、单次调用的最大内存增量
+    （结束时减开始时的常驻内存）和最近一次结束时的常驻内存；进程内存峰值只在报告顶层给出。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.stages = {}
+        self.total_seconds = None
+
+    def add(self, span):
+        entry = self.stages.get(span['stage'])
+        if entry is None:
+            entry = self.stages[span['stage']] = {'calls': 0, 'seconds': 0.0, 'rss_delta_mb': span['rss_delta_mb']}
+        entry['calls'] += 1
+        entry['seconds'] += span['seconds']
+        entry['rss_delta_mb'] = max(entry['rss_delta_mb'], span['rss_delta_mb'])
+        entry['rss_exit_mb'] = span['rss_exit_mb']
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'started': self.started, 'total_seconds': self.total_seconds,
+            'process_peak_rss_mb': peak_rss_bytes() / 1024 ** 2,
+            'stages': [dict(stage=k, **{f: round(v, 4) if isinstance(v, float) else v for f, v in s.items()})
+                       for k, s in self.stages.items()],
+        }
+
+    def print(self):
+        print(f"\n运行报告: {self.name}（总耗时 {self.total_seconds:.2f} 秒）")
+        print(f"  {'环节':<40}{'次数':>6}{'耗时(s)':>10}{'占比':>8}{'内存增量(MB)':>14}{'结束内存(MB)':>14}")
+        for stage, s in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            share = s['seconds'] / self.total_seconds * 100 if self.total_seconds else 0
+            print(f"  {stage:<40}{s['calls']:>6}{s['seconds']:>10.3f}{share:>7.1f}%"
+                  f"{s['rss_delta_mb']:>14.1f}{s['rss_exit_mb']:>14.1f}")
+        print(f"  进程内存峰值: {peak_rss_bytes() / 1024 ** 2:.1f} MB")
+
+    def save(self, directory=RUN_REPORT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        return path
+
+
+@contextmanager
+def run_report(name, save=True):
+    """
+    收集运行期间所有 timed 环节的报告；结束时打印汇总，save 为 True 时保存到 RUN_REPORT_DIR。
+    """
+    report = RunReport(name)
+    with _lock:
+        _active_reports.append(report)
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.total_seconds = time.perf_counter() - start
+        with _lock:
+            _active_reports.remove(report)
+        report.print()
+        if save:
+            print(f"运行报告已保存至: {report.save()}")
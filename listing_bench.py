@@ -0,0 +1,123 @@
+# listing_bench.py
+# ------------------------------------------
+# 本脚本用于测量房源查询索引的延迟。
+# 主要功能：
+# 1. 在模拟数据（或清洗后的数据文件）上构建 ListingIndex，统计构建耗时
+# 2. 对典型的过滤组合分别测量 p50/p99 延迟，并与逐行布尔掩码扫描对比
+# 3. 校验索引查询与布尔掩码扫描的匹配总数一致（含上下限取存储值的边界查询）
+# 用法：
+#   python listing_bench.py [行数 | 数据文件] [--repeat N]
+# 依赖库：pandas, numpy, listing_index.py, storage.py, synthetic_data.py
+# ------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from listing_index import LISTING_COLUMNS, ListingIndex
+from storage import load_table
+from synthetic_data import generate_cleaned
+
+# 典型查询：(名称, 查询参数)
+TYPICAL_QUERIES = [
+    ('无过滤，首页', {}),
+    ('单区', {'categories': {'District': ['武侯区']}}),
+    ('单区 + 总价区间', {'categories': {'District': ['武侯区']}, 'ranges': {'TotalPrice': (100, 200)}}),
+    ('多区 + 室数 + 电梯', {'categories': {'District': ['锦江区', '青羊区'], 'RoomCount': [2, 3], 'Elevator': ['有电梯']}}),
+    ('总价区间，按单价降序', {'ranges': {'TotalPrice': (80, 150)}, 'sort': 'UnitPrice', 'descending': True}),
+    ('面积 + 总价区间 + 装修', {'ranges': {'Area': (80, 120), 'TotalPrice': (100, 300)},
+                          'categories': {'Decoration': ['精装']}}),
+    ('板块 + 按总价升序', {'categories': {'SubDistrict': ['板块1']}, 'sort': 'TotalPrice'}),
+]
+
+
+def boundary_queries(df):
+    """
+    边界查询：上下限都取某一行的值（按接口显示的两位小数），检验闭区间不会漏掉存储为 float32 的边界值
+    """
+    queries = []
+    for col in ['TotalPrice', 'UnitPrice', 'Area']:
+        if col in df.columns and len(df):
+            value = round(float(df[col].iloc[len(df) // 2]), 2)
+            queries.append((f'{col} = {value}', {'ranges': {col: (value, value)}}))
+    return queries
+
+
+def check_counts(index, df, queries):
+    """校验索引查询与布尔掩码扫描的匹配总数一致，返回不一致的查询数"""
+    failures = 0
+    for name, params in queries:
+        total, expected = index.query(limit=1, **params)['total'], mask_scan(df, **params)
+        if total != expected:
+            print(f"错误: 查询 '{name}' 的匹配数 {total} 与扫描结果 {expected} 不一致。")
+            failures += 1
+    return failures
+
+
+def mask_scan(df, categories=None, ranges=None, **_):
+    """对照实现：逐列布尔掩码扫描，返回匹配行数"""
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in (categories or {}).items():
+        mask &= df[col].astype(str).isin([str(v) for v in values]).to_numpy()
+    for col, (low, high) in (ranges or {}).items():
+        values = df[col].to_numpy()
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    return int(mask.sum())
+
+
+def _percentiles(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def benchmark(df, repeat=50):
+    """返回每个典型查询的 p50/p99 延迟（毫秒）及对照扫描的 p50"""
+    start = time.perf_counter()
+    index = ListingIndex(df)
+    print(f"索引构建耗时: {time.perf_counter() - start:.2f} 秒（{len(df)} 行）")
+
+    if check_counts(index, df, TYPICAL_QUERIES + boundary_queries(df)):
+        sys.exit(1)
+
+    rows = []
+    for name, params in TYPICAL_QUERIES:
+        result = index.query(limit=20, **params)
+        p50, p99 = _percentiles(lambda: index.query(limit=20, **params), repeat)
+        # 第二页：带游标的翻页
+        next_p50, _ = _percentiles(lambda: index.query(limit=20, cursor=result['next_cursor'], **params), repeat) \
+            if result['next_cursor'] else (float('nan'), None)
+        scan_p50, _ = _percentiles(lambda: mask_scan(df, **params), max(3, repeat // 10))
+        rows.append((name, result['total'], p50, p99, next_p50, scan_p50))
+    return rows
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='房源查询索引延迟基准测试')
+    arg_parser.add_argument('source', nargs='?', default='1000000', help='模拟数据行数，或清洗后的数据文件')
+    arg_parser.add_argument('--repeat', type=int, default=50, help='每个查询的重复次数')
+    args = arg_parser.parse_args()
+
+    if os.path.exists(args.source):
+        df = load_table(args.source, columns=LISTING_COLUMNS)
+    else:
+        print(f"正在生成 {int(args.source)} 行模拟数据...")
+        df = generate_cleaned(int(args.source))
+
+    rows = benchmark(df, args.repeat)
+    print(f"{'查询':<22}{'匹配数':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'翻页p50':>10}{'扫描p50':>10}")
+    for name, total, p50, p99, next_p50, scan_p50 in rows:
+        print(f"{name:<22}{total:>10}{p50:>10.2f}{p99:>10.2f}{next_p50:>10.2f}{scan_p50:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# listing_index.py
+# ------------------------------------------
+# 本模块为房源查询接口提供内存索引。
+# 主要功能：
+# 1. 类别列（区、板块、装修、电梯、室数）建立倒排表：每个取值对应按行号排序的行号数组
+# 2. 数值列（总价、单价、面积）建立排序数组和名次数组，范围过滤只需两次二分查找
+# 3. 查询时以最小的候选集驱动，其余条件只在候选行上校验，不扫描整张表
+# 4. 按名次做游标分页，翻页代价与页码无关
+# 索引在数据加载时构建一次，之后只读，可被多个请求线程共享。
+# 依赖库：pandas, numpy
+# ------------------------------------------
+
+import base64
+
+import numpy as np
+import pandas as pd
+
+# 可按取值过滤的类别列
+INDEXED_CATEGORIES = ['District', 'SubDistrict', 'Decoration', 'Elevator', 'RoomCount']
+# 可按范围过滤、排序的数值列
+INDEXED_NUMERICS = ['TotalPrice', 'UnitPrice', 'Area']
+# 查询结果返回的列
+LISTING_COLUMNS = [
+    'Title', 'Community', 'District', 'SubDistrict', 'TotalPrice', 'UnitPrice', 'Area',
+    'Layout', 'RoomCount', 'Decoration', 'Elevator', 'Floor', 'YearBuilt',
+]
+# 默认排序：按行号（即数据文件中的顺序）
+DEFAULT_SORT = 'id'
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def _key(value):
+    """类别取值统一转为字符串，整数型取值（如室数 3.0）去掉小数部分"""
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+class _CategoryIndex:
+    """
+    类别列索引。
+    codes: 每行的取值编号（缺失为 -1），用于在候选行上校验
+    postings: 取值编号 -> 按行号升序的行号数组
+    """
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values)
+        self.codes = codes.astype(np.int32)
+        self.code_of = {_key(u): i for i, u in enumerate(uniques)}
+        order = np.argsort(self.codes, kind='stable').astype(np.int32)
+        counts = np.bincount(self.codes[self.codes >= 0], minlength=len(uniques))
+        # 缺失值（编号 -1）排在最前面
+        bounds = int((self.codes < 0).sum()) + np.concatenate([[0], np.cumsum(counts)])
+        self.postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+
+    def lookup(self, values):
+        """返回取值对应的编号列表（不存在的取值被忽略）"""
+        return [self.code_of[_key(v)] for v in values if _key(v) in self.code_of]
+
+    def rows(self, codes):
+        """多个取值的倒排表求并集，结果按行号升序"""
+        if not codes:
+            return _EMPTY
+        if len(codes) == 1:
+            return self.postings[codes[0]]
+        return np.sort(np.concatenate([self.postings[c] for c in codes]))
+
+
+class _SortedIndex:
+    """
+    数值列索引。
+    order: 按值升序排列的行号（缺失值排在最后），sorted: 对应的值
+    rank: 每行在 order 中的位置，n_valid: 非缺失值的数量
+    浮点列保持存储类型（如 float32），查询边界先转换为同一类型再比较：
+    否则 96.9 的 float32 存储值放大为 float64 后小于 96.9，闭区间会漏掉边界上的值。
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(np.float64)
+        self.order = np.argsort(values, kind='stable').astype(np.int32)
+        self.sorted = values[self.order]
+        self.rank = np.empty(len(values), dtype=np.int32)
+        self.rank[self.order] = np.arange(len(values), dtype=np.int32)
+        self.n_valid = int(np.count_nonzero(~np.isnan(values)))
+
+    def rank_range(self, low=None, high=None):
+        """值落在 [low, high] 内的名次区间 [lo, hi)"""
+        valid = self.sorted[:self.n_valid]
+        as_stored = valid.dtype.type
+        lo = 0 if low is None else int(np.searchsorted(valid, as_stored(low), side='left'))
+        hi = self.n_valid if high is None else int(np.searchsorted(valid, as_stored(high), side='right'))
+        return lo, max(lo, hi)
+
+    def sort_keys(self, rows, descending=False):
+        """
+        行的排序键：升序时为名次；降序时非缺失值的名次反转，缺失值仍排在最后。
+        各行的键互不相同，可直接作为分页游标。
+        """
+        rank = self.rank[rows]
+        if not descending:
+            return rank
+        return np.where(rank < self.n_valid, self.n_valid - 1 - rank, rank)
+
+    def rows_for_keys(self, keys, descending=False):
+        """sort_keys 的逆映射：由排序键得到行号"""
+        if descending:
+            keys = np.where(keys < self.n_valid, self.n_valid - 1 - keys, keys)
+        return self.order[keys]
+
+
+class _RowIdIndex(_SortedIndex):
+    """按行号排序时使用的恒等索引，不额外占用内存"""
+
+    def __init__(self, n_rows):
+        self.n_valid = n_rows
+
+    def sort_keys(self, rows, descending=False):
+        return self.n_valid - 1 - rows if descending else rows
+
+    def rows_for_keys(self, keys, descending=False):
+        return self.n_valid - 1 - keys if descending else keys
+
+
+def encode_cursor(sort, descending, key):
+    return base64.urlsafe_b64encode(f'{sort}:{int(descending)}:{key}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort, descending):
+    """解析游标，游标与当前排序方式不符或格式错误时抛出 ValueError"""
+    try:
+        c_sort, c_desc, c_key = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':')
+        c_desc, c_key = bool(int(c_desc)), int(c_key)
+    except Exception:
+        raise ValueError('无效的分页游标')
+    if c_sort != sort or c_desc != descending:
+        raise ValueError('分页游标与当前排序方式不一致')
+    return c_key
+
+
+class ListingIndex:
+    """
+    房源查询索引。
+    用法：
+        index = ListingIndex(df)
+        index.query(categories={'District': ['锦江区']}, ranges={'TotalPrice': (100, 200)},
+                    sort='TotalPrice', descending=True, limit=20)
+    """
+
+    def __init__(self, df):
+        self.frame = df[[c for c in LISTING_COLUMNS if c in df.columns]].reset_index(drop=True)
+        self.n_rows = len(self.frame)
+        self.categories = {c: _CategoryIndex(df[c].to_numpy()) for c in INDEXED_CATEGORIES if c in df.columns}
+        self.numerics = {c: _SortedIndex(df[c].to_numpy()) for c in INDEXED_NUMERICS if c in df.columns}
+        self.numerics[DEFAULT_SORT] = _RowIdIndex(self.n_rows)
+
+    def _match(self, categories, ranges):
+        """
+        返回满足所有条件的行号（未排序），没有任何条件时返回 None 表示全部行。
+        以最小的候选集驱动，其余条件只在候选行上按编号/名次校验。
+        """
+        candidates = []  # (大小, 行号数组的生成函数)
+        checks = []      # 在候选行上执行的校验
+        for col, values in (categories or {}).items():
+            if col not in self.categories:
+                raise ValueError(f'不支持按 {col} 过滤')
+            index = self.categories[col]
+            codes = index.lookup(values)
+            size = sum(len(index.postings[c]) for c in codes)
+            candidates.append((size, lambda index=index, codes=codes: index.rows(codes)))
+            checks.append(lambda rows, index=index, codes=codes: np.isin(index.codes[rows], codes))
+        for col, (low, high) in (ranges or {}).items():
+            if col not in self.numerics or col == DEFAULT_SORT:
+                raise ValueError(f'不支持按 {col} 范围过滤')
+            index = self.numerics[col]
+            lo, hi = index.rank_range(low, high)
+            candidates.append((hi - lo, lambda index=index, lo=lo, hi=hi: index.order[lo:hi]))
+            checks.append(lambda rows, index=index, lo=lo, hi=hi: (index.rank[rows] >= lo) & (index.rank[rows] < hi))
+        if not candidates:
+            return None
+
+        driver = min(range(len(candidates)), key=lambda i: candidates[i][0])
+        rows = candidates[driver][1]()
+        for i, check in enumerate(checks):
+            if i != driver and len(rows):
+                rows = rows[check(rows)]
+        return rows
+
+    def query(self, categories=None, ranges=None, sort=DEFAULT_SORT, descending=False, limit=20, cursor=None):
+        """
+        执行查询。
+        参数：
+            categories: {列名: [取值, ...]}，同一列的多个取值为“或”，不同列之间为“且”
+            ranges: {列名: (下限, 上限)}，闭区间，任一端为 None 表示不限
+            sort: 排序列（INDEXED_NUMERICS 之一或 'id'），descending: 是否降序
+            limit: 每页条数，cursor: 上一页返回的 next_cursor
+        返回：
+            {'total': 匹配总数, 'items': [记录, ...], 'next_cursor': 下一页游标（没有下一页时为 None）}
+        """
+        if sort not in self.numerics:
+            raise ValueError(f'不支持按 {sort} 排序')
+        sort_index = self.numerics[sort]
+        after = -1 if cursor is None else decode_cursor(cursor, sort, descending)
+        rows = self._match(categories, ranges)
+
+        if rows is None:
+            # 没有过滤条件：排序键恰为 0..n-1，直接按区间取出下一页
+            total = self.n_rows
+            keys = np.arange(after + 1, min(after + 1 + limit, self.n_rows), dtype=np.int64)
+            page_rows = sort_index.rows_for_keys(keys, descending)
+            has_more = after + 1 + limit < self.n_rows
+        else:
+            total = len(rows)
+            keys = sort_index.sort_keys(rows, descending)
+            if cursor is not None:
+                mask = keys > after
+                rows, keys = rows[mask], keys[mask]
+            has_more = len(keys) > limit
+            if has_more:
+                # 只对前 limit 个做部分排序
+                top = np.argpartition(keys, limit)[:limit]
+                rows, keys = rows[top], keys[top]
+            order = np.argsort(keys, kind='stable')
+            page_rows, keys = rows[order], keys[order]
+
+        next_cursor = encode_cursor(sort, descending, int(keys[-1])) if has_more and len(keys) else None
+        return {'total': int(total), 'items': self.records(page_rows), 'next_cursor': next_cursor}
+
+    def records(self, rows):
+        """将行号转为可序列化为 JSON 的记录列表"""
+        page = self.frame.iloc[np.asarray(rows, dtype=np.int64)]
+        page = page.astype({c: 'float64' for c in page.columns if page[c].dtype == np.float32}).round(2)
+        page = page.astype(object).where(page.notna(), None)
+        return [
+            {k: (v.item() if isinstance(v, np.generic) else v) for k, v in record.items()}
+            for record in page.to_dict(orient='records')
+        ]
@@ -0,0 +1,120 @@
+# listing_parser.py
+# ------------------------------------------
+# 本模块提供基于 lxml 预编译 XPath 的快速房源列表解析器。
+# 主要功能：
+# 1. parse_page_lxml: 与 scraper.parse_page（BeautifulSoup 参考实现）输出完全一致的记录（15个原始字段 + 房源编号）
+# 2. parse_pages_parallel: 使用进程池在多核上并行解析多个页面
+# 依赖库：lxml, concurrent.futures
+# ------------------------------------------
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree, html as lxml_html
+
+
+def _cls(name):
+    """生成与CSS类选择器等价的XPath谓词"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# 预编译的XPath，与参考实现中的CSS选择器一一对应
+_HOUSE_LIST = etree.XPath(f"//ul[{_cls('sellListContent')}]/li[{_cls('clear')}]")
+_TITLE = etree.XPath(f".//div[{_cls('title')}]/a")
+_POSITION_LINKS = etree.XPath(f".//div[{_cls('positionInfo')}]/a")
+_HOUSE_INFO = etree.XPath(f".//div[{_cls('houseInfo')}]")
+_TOTAL_PRICE = etree.XPath(f".//div[{_cls('totalPrice')}]/span")
+_UNIT_PRICE = etree.XPath(f".//div[{_cls('unitPrice')}]/span")
+_FOLLOW_INFO = etree.XPath(f".//div[{_cls('followInfo')}]")
+_ELEVATOR = etree.XPath(f"boolean(.//div[{_cls('tag')}]/span[{_cls('elevator')}])")
+
+
+# 房源详情页链接中的编号，如 https://cd.lianjia.com/ershoufang/106112345678.html
+_LISTING_ID = re.compile(r'/(\d+)\.html')
+
+
+def listing_id_from_url(href):
+    """从标题链接中提取房源编号，无法提取时返回 None"""
+    match = _LISTING_ID.search(href or '')
+    return match.group(1) if match else None
+
+
+def _first_text(xpath, node, field):
+    """取第一个匹配节点的文本，缺失时抛出与参考实现相同类型的异常"""
+    found = xpath(node)
+    if not found:
+        raise AttributeError(f"缺少字段 {field}")
+    return found[0].text_content().strip()
+
+
+def parse_page_lxml(html, guaranteed_district):
+    """
+    解析单个页面的HTML，提取房源信息（lxml + XPath 实现）。
+    参数与返回值同 scraper.parse_page。
+    """
+    if not html or not html.strip():
+        return []
+    try:
+        tree = lxml_html.fromstring(html)
+    except ValueError:
+        # 带有 XML 编码声明的字符串需以字节形式解析
+        tree = lxml_html.fromstring(html.encode('utf-8'))
+    house_list = _HOUSE_LIST(tree)
+
+    if not house_list:
+        return []
+
+    data = []
+    for house in house_list:
+        try:
+            title_links = _TITLE(house)
+            if not title_links:
+                raise AttributeError("缺少字段 title")
+            title = title_links[0].text_content().strip()
+            listing_id = listing_id_from_url(title_links[0].get('href'))
+            position_links = _POSITION_LINKS(house)
+            if not position_links:
+                raise AttributeError("缺少字段 positionInfo")
+            community = position_links[0].text_content().strip()
+            # 与参考实现保持一致：子区域同样取 positionInfo 下的第一个链接
+            sub_district = community
+            house_info_str = _first_text(_HOUSE_INFO, house, 'houseInfo')
+            parts = house_info_str.split('|')
+            layout, area, orientation, decoration, floor, year_built, building_type = (parts + ['未知'] * 7)[:7]
+            total_price = _first_text(_TOTAL_PRICE, house, 'totalPrice') + '万'
+            unit_price = _first_text(_UNIT_PRICE, house, 'unitPrice')
+            follow_info = _first_text(_FOLLOW_INFO, house, 'followInfo')
+            followers = follow_info.split('/')[0].strip()
+            elevator = '有电梯' if _ELEVATOR(house) else '无电梯'
+
+            data.append({
+                'Title': title, 'Community': community, 'District': guaranteed_district, 'SubDistrict': sub_district.strip(),
+                'Layout': layout.strip(), 'Area': area.strip(), 'Orientation': orientation.strip(), 'Decoration': decoration.strip(),
+                'Floor': floor.strip(), 'YearBuilt': year_built.strip(), 'BuildingType': building_type.strip(),
+                'TotalPrice': total_price, 'UnitPrice': unit_price, 'Followers': followers, 'Elevator': elevator,
+                'ListingId': listing_id,
+            })
+        except Exception as e:
+            print(f"解析房源时出错: {e}")
+            continue
+    return data
+
+
+def _parse_job(args):
+    parser, html, district = args
+    return parser(html, district)
+
+
+def parse_pages_parallel(pages, parser=parse_page_lxml, workers=None, chunksize=4):
+    """
+    使用进程池并行解析多个页面。
+    参数：
+        pages: [(html, district), ...]
+        parser: 解析函数（需为模块级函数以便在进程间传递）
+        workers: 进程数，默认为CPU核数
+    返回：
+        与 pages 顺序一致的房源列表的列表
+    """
+    jobs = [(parser, html, district) for html, district in pages]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_job, jobs, chunksize=chunksize))
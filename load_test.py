@@ -0,0 +1,113 @@
+# load_test.py
+# ------------------------------------------
+# 本脚本用于对本地运行的 /predict 接口做并发压测。
+# 主要功能：
+# 1. 多个线程以固定并发持续发送预测请求（每个线程复用一个连接）
+# 2. 统计吞吐量、错误数以及 p50/p95/p99 延迟，并检查 p99 是否达到目标
+# 用法（先运行 python app.py）：
+#   python load_test.py [--url URL] [--concurrency N] [--duration 秒] [--target-p99 毫秒]
+# 依赖库：requests, numpy
+# ------------------------------------------
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+# 压测使用的样例房源
+SAMPLE_LISTINGS = [
+    {'district': '武侯', 'sub_district': '桐梓林', 'area': 89.5, 'layout': '3室2厅', 'decoration': '精装',
+     'orientation': '南', 'elevator': '有电梯', 'year': 2012},
+    {'district': '锦江', 'sub_district': '东大街', 'area': 120.0, 'layout': '4室2厅', 'decoration': '简装',
+     'orientation': '南 北', 'elevator': '有电梯', 'year': 2016},
+    {'district': '高新', 'sub_district': '金融城', 'area': 65.3, 'layout': '2室1厅', 'decoration': '精装',
+     'orientation': '东南', 'elevator': '有电梯', 'year': 2018},
+    {'district': '成华', 'area': 75.0, 'layout': '2室2厅', 'decoration': '毛坯', 'elevator': '无电梯', 'year': 2001},
+    {'district': '双流', 'area': 102.8, 'layout': '3室1厅'},
+]
+
+
+def _worker(url, deadline, latencies, errors, lock):
+    session = requests.Session()
+    local_latencies, local_errors = [], 0
+    while time.perf_counter() < deadline:
+        payload = random.choice(SAMPLE_LISTINGS)
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=payload, timeout=5)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok:
+            local_latencies.append(elapsed)
+        else:
+            local_errors += 1
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def run_load_test(url, concurrency=16, duration=30.0, warmup=2.0):
+    """
+    以固定并发压测 duration 秒（之前先预热 warmup 秒，不计入结果）。
+    返回 {'requests', 'errors', 'rps', 'p50', 'p95', 'p99', 'max'}，延迟单位为毫秒。
+    """
+    lock = threading.Lock()
+    for phase_duration, record in ((warmup, False), (duration, True)):
+        latencies, errors = [], []
+        deadline = time.perf_counter() + phase_duration
+        threads = [
+            threading.Thread(target=_worker, args=(url, deadline, latencies, errors, lock))
+            for _ in range(concurrency)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    if not latencies:
+        return {'requests': 0, 'errors': sum(errors), 'rps': 0.0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': len(latencies), 'errors': sum(errors), 'rps': len(latencies) / elapsed,
+        'p50': p50, 'p95': p95, 'p99': p99, 'max': max(latencies),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='/predict 接口并发压测')
+    arg_parser.add_argument('--url', default='http://127.0.0.1:5000/predict', help='预测接口地址')
+    arg_parser.add_argument('--concurrency', type=int, default=16, help='并发线程数')
+    arg_parser.add_argument('--duration', type=float, default=30.0, help='压测时长（秒）')
+    arg_parser.add_argument('--target-p99', type=float, default=20.0, help='p99 延迟目标（毫秒）')
+    args = arg_parser.parse_args()
+
+    try:
+        requests.post(args.url, json=SAMPLE_LISTINGS[0], timeout=5).raise_for_status()
+    except requests.RequestException as e:
+        print(f"错误: 无法访问预测接口 {args.url}，请先运行 app.py。({e})")
+        sys.exit(1)
+
+    print(f"正在以 {args.concurrency} 并发压测 {args.duration:.0f} 秒...")
+    result = run_load_test(args.url, args.concurrency, args.duration)
+    if not result['requests']:
+        print(f"压测失败：没有成功的请求（错误 {result['errors']} 次）。")
+        sys.exit(1)
+    print(f"  成功请求: {result['requests']}，错误: {result['errors']}，吞吐量: {result['rps']:.1f} 次/秒")
+    print(f"  延迟(ms): p50={result['p50']:.2f}  p95={result['p95']:.2f}  "
+          f"p99={result['p99']:.2f}  max={result['max']:.2f}")
+    if result['p99'] > args.target_p99:
+        print(f"未达标：p99 {result['p99']:.2f} ms 超过目标 {args.target_p99:.0f} ms。")
+        sys.exit(1)
+    print(f"达标：p99 不超过 {args.target_p99:.0f} ms。")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,79 @@
 # ------------------------------------------
 # 本脚本用于对成都二手房数据进行聚类分析和房价预测建模。
 # 主要功能：
-# 1. K-Means聚类分析
+# 1. K-Means聚类分析（全量或分块流式 MiniBatchKMeans；并行 k 扫描选择聚类数）
 # 2. 随机森林回归预测房价
+# 3. 训练结果按“数据哈希 + 超参数”缓存到磁盘（见 model_store.py），数据不变时直接加载；
+#    每次训练登记到模型登记表（见 model_registry.py）
+# 4. 训练用于线上预测的服务模型（只使用挂牌前可知的特征），供 /predict 接口和批量打分使用
 # 依赖库：pandas, sklearn, numpy
 # ------------------------------------------
 
+import os
+
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn import metrics
 import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+
+from feature_encoder import CategoryEncoder, load_ml_dataset
+from instrumentation import timed
+from model_registry import record_run
+from model_store import CACHE_DIR, artifact_key, load_artifact, save_artifact
+from storage import TableWriter, iter_table_batches, load_mapped_table, load_table
+
+# K-Means 聚类使用的特征
+CLUSTER_FEATURES = ['Area', 'TotalPrice', 'UnitPrice']
+# 聚类训练方式：'full' 为全量 KMeans，'minibatch' 为分块流式 MiniBatchKMeans（适用于大数据）
+KMEANS_MODE = 'full'
+# 流式训练时每块的行数、每次 partial_fit 的小批行数
+KMEANS_CHUNKSIZE = 100_000
+KMEANS_BATCH_SIZE = 4096
+# 流式训练最多遍历数据的遍数；一遍内惯性的相对变化低于此值时视为收敛
+KMEANS_MAX_PASSES = 10
+KMEANS_TOL = 1e-3
+# k 扫描的候选范围与轮廓系数的抽样行数
+K_RANGE = range(2, 11)
+SILHOUETTE_SAMPLE = 10_000
+# 随机森林超参数
+RF_PARAMS = {'n_estimators': 100, 'random_state': 42}
+# 随机森林在稠密矩阵上训练快得多（10k×333 时稀疏 42 秒、稠密 14 秒）：
+# 稠密 float32 矩阵不超过该内存预算（MB）时转为稠密训练，超过时保持稀疏
+DENSE_TRAIN_BUDGET_MB = 2048
+# 服务模型不使用的列：单价（总价 = 单价 × 面积，属于目标泄漏）和关注人数（挂牌后才产生）
+SERVING_EXCLUDED_FEATURES = ['UnitPrice', 'Followers']
+# 训练代码有改动、需要让旧缓存失效时递增此版本号
+ARTIFACT_VERSION = 2
+
+
+def price_model_key(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json'):
+    """回归模型产物的缓存键"""
+    return artifact_key('price_model', [data_path, vocab_path], RF_PARAMS, ARTIFACT_VERSION)
+
 
-def run_kmeans_clustering(data_path='chengdu_cleaned_data.csv', n_clusters=4):
+def train_kmeans(data_path='chengdu_cleaned_data.parquet', n_clusters=4, mode=None, chunksize=KMEANS_CHUNKSIZE,
+                 clustered_path=None):
     """
-    执行K-Means聚类分析，返回聚类结果和各类均值。
+    训练K-Means模型，返回产物字典：
+    model, scaler, clustered（带 Cluster 列的聚类数据）, cluster_summary
+    mode 为 'minibatch' 时分块流式训练（见 _train_kmeans_streaming），不一次性加载整个文件；
+    聚类数据逐块写入 clustered_path（Parquet），产物中只记录该路径（clustered_path 键）。
+    读取聚类数据请使用 clustered_frame，两种模式通用。
     """
-    df = pd.read_csv(data_path)
+    if (mode or KMEANS_MODE) == 'minibatch':
+        if clustered_path is None:
+            clustered_path = os.path.splitext(data_path)[0] + '_clustered.parquet'
+        return _train_kmeans_streaming(data_path, n_clusters, chunksize, clustered_path)
+
+    df = load_table(data_path, columns=CLUSTER_FEATURES)
     
     # 选择聚类特征
-    features = ['Area', 'TotalPrice', 'UnitPrice']
+    features = CLUSTER_FEATURES
     X = df[features]
     
     # 数据标准化
@@ -33,29 +85,199 @@ def run_kmeans_clustering(data_path='chengdu_cleaned_data.csv', n_clusters=4):
     kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
     df['Cluster'] = kmeans.fit_predict(X_scaled)
     
-    # 分析聚类结果
-    cluster_summary = df.groupby('Cluster')[features].mean().round(2)
+    # 分析聚类结果（数值列以 float32 存储，先转为 float64 再聚合，避免均值带出单精度噪声如 313.190002）
+    cluster_summary = df[features].astype('float64').groupby(df['Cluster']).mean().round(2)
     
     print("\nK-Means 聚类结果分析:")
     print(cluster_summary)
-    
-    return df, cluster_summary
 
-def run_price_prediction_model(data_path='chengdu_ml_data.csv'):
+    return {'model': kmeans, 'scaler': scaler, 'clustered': df, 'cluster_summary': cluster_summary}
+
+
+def _train_kmeans_streaming(data_path, n_clusters, chunksize, clustered_path):
     """
-    执行房价预测回归模型训练与评估，返回评估结果和特征重要性。
+    分块流式训练：第一遍 partial_fit 标准化器；之后每遍把各块切成 KMEANS_BATCH_SIZE 行的小批逐批
+    partial_fit MiniBatchKMeans，一遍内的惯性相对变化低于 KMEANS_TOL 或达到 KMEANS_MAX_PASSES 遍时停止；
+    最后一遍逐块分配聚类、累计各类的和与计数，并把带 Cluster 列的块追加写入 clustered_path。
+    内存占用只与块大小有关。
     """
-    df = pd.read_csv(data_path)
-    
-    # 定义特征和目标
-    X = df.drop('TotalPrice', axis=1)
-    y = df['TotalPrice']
+    def chunks():
+        return iter_table_batches(data_path, chunksize, columns=CLUSTER_FEATURES)
+
+    scaler = StandardScaler()
+    for chunk in chunks():
+        scaler.partial_fit(chunk[CLUSTER_FEATURES])
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=KMEANS_BATCH_SIZE, n_init=3)
+    fitted = False
+    previous = None
+    for n_pass in range(1, KMEANS_MAX_PASSES + 1):
+        inertia = 0.0
+        for chunk in chunks():
+            X = scaler.transform(chunk[CLUSTER_FEATURES])
+            for start in range(0, len(X), KMEANS_BATCH_SIZE):
+                batch = X[start:start + KMEANS_BATCH_SIZE]
+                # 首个小批用于初始化聚类中心，行数不能少于聚类数
+                if not fitted and len(batch) < n_clusters:
+                    continue
+                kmeans.partial_fit(batch)
+                fitted = True
+                inertia -= kmeans.score(batch)
+        if not fitted:
+            raise ValueError(f'数据行数少于聚类数 {n_clusters}，无法训练聚类模型')
+        print(f"MiniBatchKMeans 第 {n_pass} 遍，惯性 {inertia:.2f}")
+        if previous is not None and abs(previous - inertia) <= KMEANS_TOL * previous:
+            break
+        previous = inertia
+
+    sums = pd.DataFrame(0.0, index=range(n_clusters), columns=CLUSTER_FEATURES)
+    counts = pd.Series(0, index=range(n_clusters))
+    tmp_path = clustered_path + '.tmp'
+    with TableWriter(tmp_path) as writer:
+        for chunk in chunks():
+            chunk['Cluster'] = kmeans.predict(scaler.transform(chunk[CLUSTER_FEATURES])).astype(np.int8)
+            grouped = chunk[CLUSTER_FEATURES].astype('float64').groupby(chunk['Cluster'])
+            sums = sums.add(grouped.sum(), fill_value=0)
+            counts = counts.add(grouped.size(), fill_value=0)
+            writer.write(chunk)
+    os.replace(tmp_path, clustered_path)
+    cluster_summary = sums.div(counts, axis=0).dropna().round(2)
+    cluster_summary.index.name = 'Cluster'
+
+    print("\nMiniBatchKMeans 聚类结果分析:")
+    print(cluster_summary)
+    return {'model': kmeans, 'scaler': scaler, 'clustered_path': clustered_path, 'cluster_summary': cluster_summary}
+
+
+def clustered_frame(artifact, columns=None):
+    """
+    返回聚类产物中的聚类数据（带 Cluster 列）。
+    流式训练的产物只记录 Parquet 路径，此时以内存映射方式读取（见 storage.load_mapped_table）。
+    """
+    if 'clustered' in artifact:
+        df = artifact['clustered']
+        return df if columns is None else df[columns]
+    return load_mapped_table(artifact['clustered_path'], columns)
+
+
+def _evaluate_k(X, k, sample, mode):
+    """在标准化后的数据上拟合 k 个聚类，返回惯性和抽样轮廓系数"""
+    if mode == 'minibatch':
+        model = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=4096, n_init=3)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    model.fit(X)
+    labels = model.predict(X[sample])
+    silhouette = metrics.silhouette_score(X[sample], labels) if len(set(labels)) > 1 else float('nan')
+    return {'k': k, 'inertia': float(model.inertia_), 'silhouette': float(silhouette)}
+
+
+def sweep_k(data_path='chengdu_cleaned_data.parquet', k_values=K_RANGE, mode=None, use_cache=True, n_jobs=-1):
+    """
+    在多个进程中并行评估一组 k，返回按 k 排序的 DataFrame（k, inertia, silhouette）。
+    惯性在全部数据上计算，轮廓系数在 SILHOUETTE_SAMPLE 行的随机样本上计算；结果按数据哈希缓存。
+    """
+    mode = mode or KMEANS_MODE
+    k_values = list(k_values)
+    params = {'k_values': k_values, 'mode': mode, 'sample': SILHOUETTE_SAMPLE, 'features': CLUSTER_FEATURES}
+    key = artifact_key('kmeans_sweep', [data_path], params, ARTIFACT_VERSION)
+    _, result = load_artifact('kmeans_sweep', key) if use_cache else (None, None)
+    if result is not None:
+        return result
+
+    X = StandardScaler().fit_transform(load_table(data_path, columns=CLUSTER_FEATURES))
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(X), size=min(SILHOUETTE_SAMPLE, len(X)), replace=False)
+    print(f"正在并行评估 k = {k_values} ...")
+    with timed('model_train_seconds', model='kmeans_sweep'):
+        rows = Parallel(n_jobs=n_jobs)(delayed(_evaluate_k)(X, k, sample, mode) for k in k_values)
+    result = pd.DataFrame(rows).sort_values('k').reset_index(drop=True)
+    print(result.round(4).to_string(index=False))
+    save_artifact('kmeans_sweep', key, result)
+    return result
+
+
+def choose_k(sweep):
+    """选择抽样轮廓系数最高的 k"""
+    return int(sweep.loc[sweep['silhouette'].idxmax(), 'k'])
+
+
+def resolve_n_clusters(data_path='chengdu_cleaned_data.parquet', n_clusters=4, mode=None):
+    """n_clusters 为 'auto' 时通过 k 扫描（结果有缓存）确定聚类数"""
+    if n_clusters == 'auto':
+        return choose_k(sweep_k(data_path, mode=mode))
+    return n_clusters
+
+
+def kmeans_key(data_path='chengdu_cleaned_data.parquet', n_clusters=4, mode=None):
+    """K-Means 产物的缓存键"""
+    mode = mode or KMEANS_MODE
+    n_clusters = resolve_n_clusters(data_path, n_clusters, mode)
+    params = {'n_clusters': n_clusters, 'random_state': 42, 'n_init': 10, 'features': CLUSTER_FEATURES, 'mode': mode}
+    if mode == 'minibatch':
+        params.update(batch_size=KMEANS_BATCH_SIZE, max_passes=KMEANS_MAX_PASSES, tol=KMEANS_TOL)
+    return artifact_key('kmeans', [data_path], params, ARTIFACT_VERSION)
+
+
+def run_kmeans_clustering(data_path='chengdu_cleaned_data.parquet', n_clusters=4, use_cache=True, mode=None):
+    """
+    执行K-Means聚类分析，返回聚类结果和各类均值。
+    只读取聚类所需的列；数据和参数未变化时直接加载缓存的结果。
+    n_clusters 可为 'auto'（按 k 扫描结果选择），mode 可为 'full' 或 'minibatch'（默认取 KMEANS_MODE）。
+    """
+    mode = mode or KMEANS_MODE
+    n_clusters = resolve_n_clusters(data_path, n_clusters, mode)
+    key = kmeans_key(data_path, n_clusters, mode)
+    _, artifact = load_artifact('kmeans', key) if use_cache else (None, None)
+    if artifact is None:
+        clustered_path = os.path.join(CACHE_DIR, f'kmeans-{key}-clustered.parquet')
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with timed('model_train_seconds', model='kmeans'):
+            artifact = train_kmeans(data_path, n_clusters, mode, clustered_path=clustered_path)
+        save_artifact('kmeans', key, artifact)
+    return clustered_frame(artifact), artifact['cluster_summary']
+
+
+def assign_clusters(df, key=None, city=None):
+    """
+    用已保存的标准化器和聚类模型为新房源分配聚类，无需重新训练。
+    key 为 None 时使用城市 city（默认城市见 cities.json）的流水线最近一次构建的模型；返回与 df 对齐的聚类编号数组。
+    """
+    if key is None:
+        from pipeline import built_artifact_keys
+        key = (built_artifact_keys(city) or {}).get('kmeans')
+    _, artifact = load_artifact('kmeans', key) if key else (None, None)
+    if artifact is None:
+        raise FileNotFoundError('未找到该城市已训练的聚类模型，请先运行 python pipeline.py')
+    X = artifact['scaler'].transform(df[CLUSTER_FEATURES])
+    return artifact['model'].predict(X)
+
+
+def training_matrix(X, budget_mb=DENSE_TRAIN_BUDGET_MB):
+    """稀疏特征矩阵在内存预算内时转为稠密 float32 矩阵（随机森林训练更快），否则原样返回"""
+    if sparse.issparse(X) and X.shape[0] * X.shape[1] * 4 <= budget_mb * 1024 ** 2:
+        return X.astype(np.float32).toarray()
+    return X
+
+
+def _column(X, i):
+    return X[:, i].toarray().ravel() if sparse.issparse(X) else X[:, i]
+
+
+def train_price_model(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json'):
+    """
+    训练随机森林回归模型，返回产物字典：
+    model, feature_names, evaluation, feature_importances
+    """
+    # 定义特征和目标（内存预算内转为稠密矩阵训练，见 training_matrix）
+    X, y, feature_names = load_ml_dataset(data_path, vocab_path)
+    X = training_matrix(X)
     
     # 划分训练集和测试集
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # 选择并训练模型（随机森林回归）
-    model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+    model = RandomForestRegressor(**RF_PARAMS, n_jobs=-1)
     print("\n正在训练随机森林回归模型...")
     model.fit(X_train, y_train)
     
@@ -75,8 +297,82 @@ def run_price_prediction_model(data_path='chengdu_ml_data.csv'):
         print(f"{metric}: {value:.4f}")
         
     # 获取特征重要性
-    feature_importances = pd.Series(model.feature_importances_, index=X.columns).sort_values(ascending=False).head(10)
+    feature_importances = pd.Series(model.feature_importances_, index=feature_names).sort_values(ascending=False).head(10)
     print("\n特征重要性 Top 10:")
     print(feature_importances)
-    
-    return evaluation_results, feature_importances
\ No newline at end of file
+
+    return {
+        'model': model, 'feature_names': feature_names,
+        'evaluation': evaluation_results, 'feature_importances': feature_importances,
+    }
+
+
+def run_price_prediction_model(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json', use_cache=True):
+    """
+    执行房价预测回归模型训练与评估，返回评估结果和特征重要性。
+    特征为稀疏矩阵，列名来自类别词表文件；数据和参数未变化时直接加载缓存的结果。
+    """
+    key = price_model_key(data_path, vocab_path)
+    _, artifact = load_artifact('price_model', key) if use_cache else (None, None)
+    if artifact is None:
+        with timed('model_train_seconds', model='price_model') as timer:
+            artifact = train_price_model(data_path, vocab_path)
+        record_run('price_model', [data_path, vocab_path], RF_PARAMS, artifact['evaluation'],
+                   timer.seconds, key)
+        save_artifact('price_model', key, artifact)
+    return artifact['evaluation'], artifact['feature_importances']
+
+
+def serving_model_key(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json'):
+    """服务模型产物的缓存键"""
+    params = dict(RF_PARAMS, excluded=SERVING_EXCLUDED_FEATURES)
+    return artifact_key('serving_model', [data_path, vocab_path], params, ARTIFACT_VERSION)
+
+
+def train_serving_model(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json'):
+    """
+    训练服务模型，返回产物字典：
+    model, feature_names, encoder（训练时的词表，保证推理列布局一致）,
+    fill_values（推理时数值特征缺失的填充值，取训练集中位数）, evaluation
+    """
+    X, y, feature_names = load_ml_dataset(data_path, vocab_path)
+    encoder = CategoryEncoder.load(vocab_path)
+    keep = [i for i, name in enumerate(feature_names) if name not in SERVING_EXCLUDED_FEATURES]
+    X = training_matrix(X[:, keep])
+    feature_names = [feature_names[i] for i in keep]
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    fill_values = {
+        name: float(np.median(_column(X_train, i)))
+        for i, name in enumerate(feature_names) if name in encoder.numeric_columns
+    }
+    model = RandomForestRegressor(**RF_PARAMS, n_jobs=-1)
+    print("\n正在训练服务模型（不含单价和关注人数）...")
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    evaluation_results = {
+        'R-squared': metrics.r2_score(y_test, y_pred),
+        'Mean Absolute Error (MAE)': metrics.mean_absolute_error(y_test, y_pred),
+        'Root Mean Squared Error (RMSE)': np.sqrt(metrics.mean_squared_error(y_test, y_pred))
+    }
+    print("\n服务模型评估结果:")
+    for metric, value in evaluation_results.items():
+        print(f"{metric}: {value:.4f}")
+
+    return {
+        'model': model, 'feature_names': feature_names,
+        'encoder': encoder.to_dict(), 'fill_values': fill_values, 'evaluation': evaluation_results,
+    }
+
+
+def run_serving_model(data_path='chengdu_ml_data.npz', vocab_path='chengdu_ml_vocab.json', use_cache=True):
+    """训练（或从缓存加载）服务模型，返回产物字典"""
+    key = serving_model_key(data_path, vocab_path)
+    _, artifact = load_artifact('serving_model', key) if use_cache else (None, None)
+    if artifact is None:
+        with timed('model_train_seconds', model='serving_model') as timer:
+            artifact = train_serving_model(data_path, vocab_path)
+        record_run('serving_model', [data_path, vocab_path], dict(RF_PARAMS, excluded=SERVING_EXCLUDED_FEATURES),
+                   artifact['evaluation'], timer.seconds, key)
+        save_artifact('serving_model', key, artifact)
+    return artifact
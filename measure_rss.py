@@ -0,0 +1,165 @@
+# measure_rss.py
+# ------------------------------------------
+# 本脚本测量 gunicorn 多进程部署在不同工作进程数下的内存占用。
+# 主要功能：
+# 1. 按给定的工作进程数依次启动 gunicorn（预加载模式，或 --compare 时同时测量不预加载的模式）
+# 2. 等待所有工作进程就绪后发送一轮预热请求（首页、房源查询、散点图、预测）
+# 3. 读取主进程和各工作进程的 /proc/<pid>/smaps_rollup，统计 RSS、PSS（共享页按进程数均摊）
+#    和 USS（进程独占的页），并计算每增加一个工作进程的内存增量
+# RSS 会把共享页重复计入每个进程，判断共享效果应看 PSS 合计与 USS。仅支持 Linux。
+# 用法：
+#   python measure_rss.py --workers 1,2,4,8 [--compare] [--output rss_results.json]
+# 依赖库：requests, gunicorn
+# ------------------------------------------
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+# 预热请求（每个请求发送多次，使各工作进程都处理过请求）
+WARMUP_REQUESTS = [
+    ('GET', '/', None),
+    ('GET', '/api/listings?limit=50&sort=-price', None),
+    ('GET', '/api/scatter/kmeans', None),
+    ('POST', '/predict', {'district': '锦江区', 'area': 89.5, 'layout': '2室1厅', 'decoration': '精装'}),
+]
+WARMUP_ROUNDS = 20
+STARTUP_TIMEOUT = 600
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    """返回 pid 的直接子进程列表（扫描 /proc）"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 进程名可能包含空格，跳过最后一个右括号之前的内容
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def memory_of(pid):
+    """读取进程的 RSS、PSS、USS（MB）"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss': values.get('Rss', 0.0),
+        'pss': values.get('Pss', 0.0),
+        'uss': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0),
+    }
+
+
+def _wait_ready(proc, base_url, workers):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'gunicorn 已退出（返回码 {proc.returncode}）')
+        try:
+            if requests.get(base_url + '/metrics', timeout=2).ok and len(_children(proc.pid)) >= workers:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('等待 gunicorn 启动超时')
+
+
+def _warm_up(base_url):
+    session = requests.Session()
+    for _ in range(WARMUP_ROUNDS):
+        for method, path, body in WARMUP_REQUESTS:
+            session.request(method, base_url + path, json=body, timeout=60)
+
+
+def measure(workers, preload=True):
+    """启动 gunicorn 并测量内存，返回该次测量的结果字典"""
+    port = _free_port()
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_BIND=f'127.0.0.1:{port}',
+               HOUSEPRICE_PRELOAD='1' if preload else '0')
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(source_dir, 'gunicorn.conf.py'),
+                             '--pythonpath', source_dir, 'app:app'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        start = time.perf_counter()
+        _wait_ready(proc, base_url, workers)
+        startup = time.perf_counter() - start
+        _warm_up(base_url)
+        master = memory_of(proc.pid)
+        worker_mem = [memory_of(pid) for pid in _children(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    total = {k: master[k] + sum(w[k] for w in worker_mem) for k in ('rss', 'pss', 'uss')}
+    return {
+        'workers': workers, 'preload': preload, 'startup_seconds': round(startup, 2),
+        'master_rss_mb': round(master['rss'], 1),
+        'worker_rss_mb': round(sum(w['rss'] for w in worker_mem) / len(worker_mem), 1),
+        'worker_uss_mb': round(sum(w['uss'] for w in worker_mem) / len(worker_mem), 1),
+        'total_rss_mb': round(total['rss'], 1),
+        'total_pss_mb': round(total['pss'], 1),
+    }
+
+
+def print_results(results):
+    print(f"\n{'模式':<8}{'进程数':>6}{'启动(s)':>9}{'主进程RSS':>11}{'工作进程RSS':>12}"
+          f"{'工作进程USS':>12}{'RSS合计':>10}{'PSS合计':>10}{'每进程增量':>11}")
+    for preload in (True, False):
+        rows = sorted((r for r in results if r['preload'] == preload), key=lambda r: r['workers'])
+        for i, r in enumerate(rows):
+            # 每增加一个工作进程的 PSS 增量（相对于最少进程数的那次测量）
+            marginal = ((r['total_pss_mb'] - rows[0]['total_pss_mb']) / (r['workers'] - rows[0]['workers'])
+                        if i else float('nan'))
+            print(f"{'预加载' if preload else '独立加载':<8}{r['workers']:>6}{r['startup_seconds']:>9.1f}"
+                  f"{r['master_rss_mb']:>11.1f}{r['worker_rss_mb']:>12.1f}{r['worker_uss_mb']:>12.1f}"
+                  f"{r['total_rss_mb']:>10.1f}{r['total_pss_mb']:>10.1f}{marginal:>11.1f}")
+
+
+def main():
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("错误: 本脚本需要 Linux 的 /proc/<pid>/smaps_rollup。")
+        sys.exit(1)
+    arg_parser = argparse.ArgumentParser(description='测量不同工作进程数下 gunicorn 的内存占用')
+    arg_parser.add_argument('--workers', default='1,2,4,8', help='逗号分隔的工作进程数')
+    arg_parser.add_argument('--compare', action='store_true', help='同时测量不预加载（各进程独立加载）的模式')
+    arg_parser.add_argument('--output', help='结果写入的 JSON 文件')
+    args = arg_parser.parse_args()
+
+    counts = [int(n) for n in args.workers.split(',')]
+    results = []
+    for preload in ([True, False] if args.compare else [True]):
+        for workers in counts:
+            print(f"正在测量: {'预加载' if preload else '独立加载'}，{workers} 个工作进程...")
+            results.append(measure(workers, preload))
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\n结果已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
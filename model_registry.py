@@ -0,0 +1,60 @@
+# model_registry.py
+# ------------------------------------------
+# 本模块提供一个轻量的模型训练登记表。
+# 主要功能：
+# 1. 每次训练追加一条 JSON 记录：模型名、数据哈希、超参数、评估指标、训练耗时、缓存键
+# 2. 按模型名列出历史记录，按指标挑选最优的一次训练
+# 文件格式：model_cache/registry.jsonl，每行一条记录，只追加不修改
+# 依赖库：json, model_store.py
+# ------------------------------------------
+
+import json
+import os
+import threading
+import time
+
+from model_store import CACHE_DIR, file_fingerprint
+
+REGISTRY_PATH = os.path.join(CACHE_DIR, 'registry.jsonl')
+_registry_lock = threading.Lock()
+
+
+def record_run(name, data_paths, params, metrics, train_seconds, key=None, registry_path=REGISTRY_PATH, **extra):
+    """登记一次训练，返回写入的记录"""
+    entry = {
+        'name': name,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'data': {os.path.basename(p): file_fingerprint(p)[:16] for p in data_paths},
+        'params': params,
+        'metrics': {k: float(v) for k, v in metrics.items()},
+        'train_seconds': round(float(train_seconds), 3),
+        'key': key,
+    }
+    entry.update(extra)
+    with _registry_lock:
+        os.makedirs(os.path.dirname(registry_path) or '.', exist_ok=True)
+        with open(registry_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+    return entry
+
+
+def list_runs(name=None, registry_path=REGISTRY_PATH):
+    """按登记顺序返回记录列表，name 不为空时只返回该模型的记录"""
+    if not os.path.exists(registry_path):
+        return []
+    runs = []
+    with open(registry_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if name is None or entry['name'] == name:
+                    runs.append(entry)
+    return runs
+
+
+def best_run(name, metric='R-squared', higher_is_better=True, registry_path=REGISTRY_PATH):
+    """返回该模型按指定指标最优的一次记录，没有记录时返回 None"""
+    runs = [r for r in list_runs(name, registry_path) if metric in r['metrics']]
+    if not runs:
+        return None
+    return (max if higher_is_better else min)(runs, key=lambda r: r['metrics'][metric])
@@ -0,0 +1,124 @@
+# model_store.py
+# ------------------------------------------
+# 本模块为训练好的模型及其派生结果提供磁盘缓存。
+# 主要功能：
+# 1. 以“输入数据内容哈希 + 超参数 + 代码版本”生成缓存键
+# 2. 保存/加载模型产物（joblib）。加载时必须给出缓存键：模型缓存由所有城市共用，
+#    “最近一次保存的版本”可能属于别的城市；各城市的当前版本见流水线构建记录（pipeline.built_artifact_keys）
+# 3. 数据文件哈希按 (大小, 修改时间) 记忆，未变化的文件无需重新计算哈希
+# 目录结构：
+#   model_cache/<name>-<key>.joblib   —— 模型产物
+#   model_cache/fingerprints.json     —— 数据文件哈希记忆（每次计算哈希只读写一次，目录也一样）
+#   model_cache/pipeline-<城市>.json  —— 流水线构建记录（见 pipeline.py）
+# 依赖库：joblib, hashlib, json
+# ------------------------------------------
+
+import hashlib
+import json
+import os
+import threading
+
+import joblib
+
+CACHE_DIR = 'model_cache'
+_fingerprint_lock = threading.Lock()
+
+
+def _hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_memo(memo_path):
+    if not os.path.exists(memo_path):
+        return {}
+    with open(memo_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_memo(memo_path, memo):
+    os.makedirs(os.path.dirname(memo_path) or '.', exist_ok=True)
+    tmp_path = f'{memo_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(memo, f)
+    os.replace(tmp_path, memo_path)
+
+
+def _memo_fingerprint(path, memo):
+    """使用 memo 中记忆的哈希（大小和修改时间未变时），否则计算并写入 memo；返回 (哈希, 是否更新了 memo)"""
+    stat = os.stat(path)
+    abs_path = os.path.abspath(path)
+    entry = memo.get(abs_path)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256'], False
+    sha = _hash_file(path)
+    memo[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+    return sha, True
+
+
+def file_fingerprint(path, cache_dir=CACHE_DIR):
+    """
+    返回数据文件（或目录下所有文件）的内容哈希。
+    文件大小和修改时间未变时直接使用记忆的哈希值；记忆文件每次调用只读写一次（目录也一样）。
+    """
+    memo_path = os.path.join(cache_dir, 'fingerprints.json')
+    with _fingerprint_lock:
+        memo = _load_memo(memo_path)
+        changed = False
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    sha, updated = _memo_fingerprint(full, memo)
+                    changed = changed or updated
+                    digest.update(os.path.relpath(full, path).encode('utf-8'))
+                    digest.update(sha.encode('ascii'))
+            result = digest.hexdigest()
+        else:
+            result, changed = _memo_fingerprint(path, memo)
+        if changed:
+            _save_memo(memo_path, memo)
+        return result
+
+
+def artifact_key(name, data_paths, params, version=1):
+    """由产物名称、输入数据哈希、超参数和代码版本生成缓存键"""
+    payload = {
+        'name': name,
+        'data': [file_fingerprint(p) for p in data_paths],
+        'params': params,
+        'version': version,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def artifact_path(name, key, cache_dir=CACHE_DIR):
+    """产物文件路径"""
+    return os.path.join(cache_dir, f'{name}-{key}.joblib')
+
+
+def save_artifact(name, key, payload, cache_dir=CACHE_DIR):
+    """保存产物（先写临时文件再原子替换）"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = artifact_path(name, key, cache_dir)
+    tmp_path = path + '.tmp'
+    joblib.dump(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(name, key, cache_dir=CACHE_DIR, mmap_mode=None):
+    """
+    按缓存键加载产物，key 为空时抛出 ValueError（不存在跨城市共用的“最新版本”）。
+    mmap_mode 为 'r' 时产物中的 numpy 数组以只读内存映射方式加载，多个进程共享同一份物理内存。
+    返回 (key, payload)，缓存不存在时返回 (None, None)。
+    """
+    if not key:
+        raise ValueError(f'加载产物 {name} 必须指定缓存键（见 pipeline.built_artifact_keys）')
+    path = artifact_path(name, key, cache_dir)
+    if not os.path.exists(path):
+        return None, None
+    return key, joblib.load(path, mmap_mode=mmap_mode)
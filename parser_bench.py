@@ -0,0 +1,110 @@
+# parser_bench.py
+# ------------------------------------------
+# 本脚本用于校验并比较各页面解析后端。
+# 主要功能：
+# 1. 在保存的列表页语料上校验快速解析器与 BeautifulSoup 参考实现输出完全一致
+# 2. 统计各后端的解析速度（页/秒），以及进程池并行解析的速度
+# 语料来源：目录下的 *.html 文件，或爬虫的页面缓存（默认城市的 <城市代码>_crawl_cache.sqlite）
+# 用法：
+#   python parser_bench.py [语料目录或缓存文件] [--repeat N] [--workers N]
+# 依赖库：scraper.py, listing_parser.py
+# ------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+
+from city_config import get_city
+from crawl_cache import PageCache
+from listing_parser import parse_pages_parallel
+from scraper import PARSERS
+
+
+def load_corpus(source):
+    """
+    读取语料，返回 [(html, district), ...]。
+    目录中的文件以文件名（去掉扩展名）作为行政区标注。
+    """
+    pages = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith('.html'):
+                with open(os.path.join(source, name), encoding='utf-8') as f:
+                    pages.append((f.read(), os.path.splitext(name)[0]))
+    elif os.path.isfile(source):
+        cache = PageCache(source, ttl=None)
+        try:
+            pages = [(html, district) for district, _, html in cache.iter_pages()]
+        finally:
+            cache.close()
+    return pages
+
+
+def check_equivalence(pages, reference='bs4'):
+    """
+    逐页比较各后端与参考实现的输出，返回不一致的页面数量。
+    """
+    mismatches = 0
+    ref_parser = PARSERS[reference]
+    for i, (html, district) in enumerate(pages):
+        expected = ref_parser(html, district)
+        for backend, parser in PARSERS.items():
+            if backend == reference:
+                continue
+            actual = parser(html, district)
+            if actual != expected:
+                mismatches += 1
+                print(f"第 {i} 页 ({district}) 后端 '{backend}' 与参考实现不一致: "
+                      f"{len(actual)} 条 vs {len(expected)} 条")
+    return mismatches
+
+
+def benchmark(pages, repeat=3, workers=None):
+    """
+    统计各后端的单进程解析速度，以及快速后端的进程池并行速度。
+    返回 {名称: 页/秒}
+    """
+    results = {}
+    for backend, parser in PARSERS.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for html, district in pages:
+                parser(html, district)
+        elapsed = time.perf_counter() - start
+        results[backend] = len(pages) * repeat / elapsed
+
+    start = time.perf_counter()
+    parse_pages_parallel(pages * repeat, workers=workers)
+    elapsed = time.perf_counter() - start
+    results['lxml (进程池)'] = len(pages) * repeat / elapsed
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='页面解析后端一致性校验与基准测试')
+    arg_parser.add_argument('source', nargs='?', default=get_city().crawl_cache_path, help='语料目录（*.html）或页面缓存文件')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='基准测试重复次数')
+    arg_parser.add_argument('--workers', type=int, default=None, help='并行解析进程数')
+    args = arg_parser.parse_args()
+
+    pages = load_corpus(args.source)
+    if not pages:
+        print(f"错误: 在 '{args.source}' 中没有找到可用的页面。")
+        sys.exit(1)
+    print(f"共加载 {len(pages)} 个页面。")
+
+    print("\n正在校验各解析后端的一致性...")
+    mismatches = check_equivalence(pages)
+    if mismatches:
+        print(f"校验失败：{mismatches} 个页面输出不一致。")
+        sys.exit(1)
+    print("校验通过：所有后端输出一致。")
+
+    print("\n正在进行解析速度基准测试...")
+    for name, pages_per_sec in benchmark(pages, args.repeat, args.workers).items():
+        print(f"  {name:<16} {pages_per_sec:10.1f} 页/秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+# pipeline.py
+# ------------------------------------------
+# 本脚本把“抓取 → 价格历史 / 清洗 → 数据检查 → 聚合立方体 / 聚类 / 回归模型”组织成一个有向无环图（DAG）依次构建。
+# 主要功能：
+# 1. 每个环节的版本键 = 输入文件内容哈希 + 相关源代码文件哈希 + 参数；键与上次构建相同且输出完好时跳过
+# 2. 上游重新构建后按新输出的内容重新计算下游的键：只重建真正受影响的环节
+# 3. 互不依赖的环节（价格历史与清洗；立方体、K-Means、回归模型、服务模型）在线程池中并行构建
+# 4. 每个城市一条流水线，构建记录保存在 model_cache/pipeline-<城市代码>.json（各环节的键、代码哈希、输出哈希、耗时）
+# 用法：
+#   python pipeline.py                    # 构建全部环节，未变化的环节直接跳过
+#   python pipeline.py --city chengdu     # 指定城市（可重复，默认城市见 cities.json）
+#   python pipeline.py kmeans             # 只构建 kmeans 及其上游
+#   python pipeline.py --force scrape     # 强制重新抓取（及受影响的下游）
+#   python pipeline.py --dry-run          # 只查看哪些环节需要重建
+# 依赖库：concurrent.futures, hashlib, json, model_store.py
+# ------------------------------------------
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from city_config import get_city
+from instrumentation import run_report, timed
+from model_store import CACHE_DIR, artifact_path, file_fingerprint
+
+# 构建记录文件，{city} 替换为城市代码
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'pipeline-{city}.json')
+# 源代码所在目录：各环节的 code 列表相对于此目录，与当前工作目录无关（数据文件仍相对于工作目录）
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 同时构建的环节数上限
+DEFAULT_JOBS = 4
+# 模型环节（Web 应用从这些环节的构建记录加载模型）
+MODEL_STAGES = ['kmeans', 'price_model', 'serving_model']
+# Web 应用后台刷新时构建的环节：先检查数据质量，未通过时模型环节被阻塞
+REFRESH_STAGES = ['validate'] + MODEL_STAGES
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def code_fingerprint(modules):
+    """一组源代码文件（相对于 SOURCE_DIR）的合并哈希（文件未改动时使用记忆的哈希，无需重新读取）"""
+    return _digest({module: file_fingerprint(os.path.join(SOURCE_DIR, module)) for module in modules})
+
+
+class Stage:
+    """
+    流水线中的一个环节。
+    参数：
+        run: 构建函数，参数 rebuild 为 True 时不使用该环节自身的产物缓存；产出模型产物的环节返回其缓存键
+        inputs / outputs: 输入、输出文件（或目录）路径
+        code: 影响该环节结果的源代码文件
+        deps: 上游环节名称
+        artifact: 产出的 model_store 产物名称（没有时为 None）
+        external: 数据来自外部（网站）时为 True：输出已存在即视为最新，只在强制时重建
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), code=(), deps=(), artifact=None, params=None,
+                 external=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.deps = list(deps)
+        self.artifact = artifact
+        self.params = params or {}
+        self.external = external
+
+    def fingerprint(self):
+        """返回 (版本键, 代码哈希)；输入文件不存在时抛出 FileNotFoundError"""
+        code = code_fingerprint(self.code)
+        inputs = {path: file_fingerprint(path) for path in self.inputs}
+        return _digest({'name': self.name, 'inputs': inputs, 'code': code, 'params': self.params}), code
+
+    def record(self, key, code, result, seconds):
+        """构建完成后生成构建记录；声明的输出缺失时抛出 FileNotFoundError"""
+        entry = {'key': key, 'code': code, 'seconds': round(seconds, 3),
+                 'outputs': {path: file_fingerprint(path) for path in self.outputs}}
+        if self.artifact:
+            if not result or not os.path.exists(artifact_path(self.artifact, result)):
+                raise FileNotFoundError(f'未生成产物 {self.artifact}')
+            entry['artifact_key'] = result
+        return entry
+
+    def intact(self, entry):
+        """上次构建的输出是否仍然存在且未被改动"""
+        for path, fingerprint in entry.get('outputs', {}).items():
+            if not os.path.exists(path) or file_fingerprint(path) != fingerprint:
+                return False
+        if self.artifact:
+            return os.path.exists(artifact_path(self.artifact, entry.get('artifact_key', '')))
+        return True
+
+
+# ==================== 各环节的构建函数 ====================
+# 在函数内导入各模块：没有环节需要重建时无需加载 pandas / sklearn
+
+def _run_scrape(city, rebuild):
+    import scraper
+    scraper.main(cities=[city.code])
+
+
+def _run_clean(city, rebuild):
+    from data_cleaner import clean_data
+    clean_data(city.raw_dir, city.viz_path, city.ml_path, city.vocab_path, city=city.code)
+
+
+def _run_history(city, rebuild):
+    from price_history import record_raw_snapshots
+    record_raw_snapshots(city.code)
+
+
+def _run_validate(city, rebuild):
+    from data_validator import validate
+    validate(city.code)
+
+
+def _run_cube(city, rebuild):
+    from cube import cube_key, load_or_build_cube
+    load_or_build_cube(city.viz_path, use_cache=not rebuild)
+    return cube_key(city.viz_path)
+
+
+def _run_kmeans(city, rebuild):
+    from machine_learning import kmeans_key, run_kmeans_clustering
+    run_kmeans_clustering(city.viz_path, use_cache=not rebuild)
+    return kmeans_key(city.viz_path)
+
+
+def _run_price_model(city, rebuild):
+    from machine_learning import price_model_key, run_price_prediction_model
+    run_price_prediction_model(city.ml_path, city.vocab_path, use_cache=not rebuild)
+    return price_model_key(city.ml_path, city.vocab_path)
+
+
+def _run_serving_model(city, rebuild):
+    from machine_learning import run_serving_model, serving_model_key
+    run_serving_model(city.ml_path, city.vocab_path, use_cache=not rebuild)
+    return serving_model_key(city.ml_path, city.vocab_path)
+
+
+def default_stages(city=None):
+    """城市的默认流水线（按拓扑顺序排列），city 为城市代码，默认城市见 cities.json"""
+    city = get_city(city)
+    viz, ml, vocab = city.viz_path, city.ml_path, city.vocab_path
+    return [
+        # 网站内容随时变化，无法由输入判断是否过期：已有原始数据时跳过，用 --force scrape 重新抓取
+        Stage('scrape', partial(_run_scrape, city), outputs=[city.raw_dir], external=True),
+        # 类别词表在重新清洗时被复用，属于清洗的输出而不是输入，否则首次构建后键会变化
+        Stage('clean', partial(_run_clean, city), inputs=[city.raw_dir], outputs=[viz, ml, vocab],
+              code=['data_cleaner.py', 'feature_encoder.py', 'storage.py', 'sketches.py', 'raw_store.py',
+                    'cities.json'],
+              deps=['scrape']),
+        # 已记录的快照不可修改，重新运行只会记入新的原始快照
+        Stage('history', partial(_run_history, city), inputs=[city.raw_dir],
+              outputs=[os.path.join(city.history_dir, 'index.json')],
+              code=['price_history.py', 'incremental_cleaner.py', 'dedup.py', 'cities.json'], deps=['scrape']),
+        # 数据质量检查不通过时抛出异常，下游环节全部阻塞，异常数据不会进入训练
+        Stage('validate', partial(_run_validate, city), inputs=[viz, ml, vocab],
+              outputs=[city.validation_report_path], code=['data_validator.py', 'cities.json'], deps=['clean']),
+        Stage('cube', partial(_run_cube, city), inputs=[viz], code=['cube.py', 'sketches.py'],
+              deps=['validate'], artifact='cube'),
+        Stage('kmeans', partial(_run_kmeans, city), inputs=[viz], code=['machine_learning.py'],
+              deps=['validate'], artifact='kmeans'),
+        Stage('price_model', partial(_run_price_model, city), inputs=[ml, vocab],
+              code=['machine_learning.py', 'feature_encoder.py'], deps=['validate'], artifact='price_model'),
+        Stage('serving_model', partial(_run_serving_model, city), inputs=[ml, vocab],
+              code=['machine_learning.py', 'feature_encoder.py'], deps=['validate'], artifact='serving_model'),
+    ]
+
+
+# ==================== 调度 ====================
+
+def city_manifest_path(city=None):
+    """城市的构建记录文件路径"""
+    return MANIFEST_PATH.format(city=get_city(city).code)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _select(stages, targets, force, upstream):
+    """目标环节及（upstream 为 True 时）其全部上游，按拓扑顺序返回名称列表"""
+    unknown = [t for t in list(targets or []) + list(force) if t not in stages]
+    if unknown:
+        raise ValueError(f"未知的环节: {', '.join(unknown)}（可选: {', '.join(stages)}）")
+    if not targets:
+        return list(stages)
+    selected = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            if upstream:
+                todo.extend(stages[name].deps)
+    return [name for name in stages if name in selected]
+
+
+def _execute(stage, rebuild):
+    with timed('pipeline_stage_seconds', stage=stage.name) as timer:
+        result = stage.run(rebuild)
+    return result, timer.seconds
+
+
+def run_pipeline(targets=None, force=(), jobs=DEFAULT_JOBS, upstream=True, stages=None, manifest_path=None,
+                 city=None):
+    """
+    构建城市 city 的目标环节，返回 {环节: 状态}，状态为 skipped / built / failed / blocked。
+    force 中的环节无论键是否变化都重新构建（且不使用其产物缓存）；
+    upstream 为 False 时只构建 targets 本身，其上游视为已就绪。
+    """
+    stages = {stage.name: stage for stage in (stages or default_stages(city))}
+    selected = _select(stages, targets, force, upstream)
+    manifest_path = manifest_path or city_manifest_path(city)
+    manifest = load_manifest(manifest_path)
+    status = {}
+    pending = list(selected)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            # 按拓扑顺序处理上游都已完成的环节：跳过未变化的，提交需要重建的
+            for name in list(pending):
+                stage = stages[name]
+                deps = [d for d in stage.deps if d in selected]
+                if any(status.get(d) in ('failed', 'blocked') for d in deps):
+                    pending.remove(name)
+                    status[name] = 'blocked'
+                    print(f"[阻塞] {name}（上游构建失败）")
+                    continue
+                if not all(d in status for d in deps):
+                    continue
+                pending.remove(name)
+                if stage.external and name not in force and all(os.path.exists(p) for p in stage.outputs):
+                    status[name] = 'skipped'
+                    print(f"[跳过] {name}（已有数据，可用 --force {name} 重新构建）")
+                    continue
+                try:
+                    key, code = stage.fingerprint()
+                except FileNotFoundError as e:
+                    status[name] = 'failed'
+                    print(f"[失败] {name}: 缺少输入 {e.filename or e}")
+                    continue
+                entry = manifest.get(name)
+                if name not in force and entry and entry['key'] == key and stage.intact(entry):
+                    status[name] = 'skipped'
+                    print(f"[跳过] {name}（输入与代码均未变化）")
+                    continue
+                # 代码有改动时不能复用该环节自身的产物缓存（其缓存键不包含代码哈希）
+                rebuild = name in force or (entry is not None and entry['code'] != code)
+                print(f"[构建] {name}")
+                running[pool.submit(_execute, stage, rebuild)] = (name, key, code)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key, code = running.pop(future)
+                try:
+                    result, seconds = future.result()
+                    manifest[name] = stages[name].record(key, code, result, seconds)
+                except Exception as e:
+                    status[name] = 'failed'
+                    print(f"[失败] {name}: {e}")
+                    continue
+                save_manifest(manifest, manifest_path)
+                status[name] = 'built'
+                print(f"[完成] {name}（{seconds:.1f} 秒）")
+    return status
+
+
+def plan(targets=None, force=(), upstream=True, stages=None, manifest_path=None, city=None):
+    """不执行构建，返回 {环节: 原因}，只包含需要重建的环节"""
+    stages = {stage.name: stage for stage in (stages or default_stages(city))}
+    manifest = load_manifest(manifest_path or city_manifest_path(city))
+    stale = {}
+    for name in _select(stages, targets, force, upstream):
+        stage = stages[name]
+        entry = manifest.get(name)
+        changed_deps = [d for d in stage.deps if d in stale]
+        if name in force:
+            stale[name] = '强制重建'
+        elif stage.external:
+            if not all(os.path.exists(p) for p in stage.outputs):
+                stale[name] = '输出不存在'
+        elif changed_deps:
+            stale[name] = f"上游 {', '.join(changed_deps)} 需要重建"
+        elif entry is None:
+            stale[name] = '没有构建记录'
+        else:
+            try:
+                key, code = stage.fingerprint()
+            except FileNotFoundError as e:
+                stale[name] = f'缺少输入 {e.filename or e}'
+                continue
+            if code != entry['code']:
+                stale[name] = '代码有改动'
+            elif key != entry['key']:
+                stale[name] = '输入有变化'
+            elif not stage.intact(entry):
+                stale[name] = '输出缺失或被改动'
+    return stale
+
+
+def built_artifact_keys(city=None, names=MODEL_STAGES):
+    """城市流水线最近一次构建的产物键 {环节: 键}，任一环节没有构建记录时返回 None"""
+    manifest = load_manifest(city_manifest_path(city))
+    keys = {name: manifest.get(name, {}).get('artifact_key') for name in names}
+    return keys if all(keys.values()) else None
+
+
+def main():
+    names = [stage.name for stage in default_stages()]
+    arg_parser = argparse.ArgumentParser(description='增量构建数据与模型流水线')
+    arg_parser.add_argument('targets', nargs='*', help=f"要构建的环节（默认全部）: {', '.join(names)}")
+    arg_parser.add_argument('--force', action='append', default=[], metavar='STAGE', help='强制重建的环节，可重复')
+    arg_parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help='同时构建的环节数')
+    arg_parser.add_argument('--dry-run', action='store_true', help='只列出需要重建的环节')
+    arg_parser.add_argument('--city', action='append', default=[], metavar='CODE',
+                            help='要构建的城市代码，可重复（默认: cities.json 中的默认城市）')
+    args = arg_parser.parse_args()
+
+    status = {}
+    try:
+        for code in args.city or [None]:
+            city = get_city(code)
+            label = f"{city.name}/" if len(args.city) > 1 else ''
+            if args.dry_run:
+                stale = plan(args.targets, args.force, city=code)
+                if not stale:
+                    print(f"{city.name}: 所有环节均为最新。")
+                for name, reason in stale.items():
+                    print(f"  {label + name:<14} {reason}")
+                continue
+            print(f"\n===== {city.name} =====")
+            with run_report('pipeline', save=False):
+                result = run_pipeline(args.targets, args.force, args.jobs, city=code)
+            status.update({label + name: s for name, s in result.items()})
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+    if args.dry_run:
+        return
+
+    summary = {s: [n for n, v in status.items() if v == s] for s in ('built', 'skipped', 'failed', 'blocked')}
+    print(f"\n重建 {len(summary['built'])} 个环节，跳过 {len(summary['skipped'])} 个。")
+    if summary['failed'] or summary['blocked']:
+        print(f"失败: {', '.join(summary['failed'] + summary['blocked'])}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+# price_history.py
+# ------------------------------------------
+# 本模块将每次抓取保存为不可变的日期快照，形成房源价格历史。
+# 主要功能：
+# 1. 每个快照只保存相对上一快照的增量：新增、下架、价格变化的房源（按房源键关联，见 incremental_cleaner.listing_keys）
+# 2. 记录快照时预先计算各区的房源数、单价/总价中位数、调价房源数等聚合值，保存在 index.json 中
+# 3. 查询：近 N 个快照各区单价中位数的变化只读 index.json；降价房源只读窗口内的增量文件，不回放全部快照
+# 4. reconstruct: 按顺序回放增量，还原任意一个快照的全部房源
+# 目录结构：
+#   <城市代码>_history/index.json                  —— 快照列表与各快照的聚合值（写入该文件即视为快照记录完成）
+#   <城市代码>_history/deltas/<YYYY-MM-DD>.parquet —— 各快照的增量
+#   <城市代码>_history/state-<YYYY-MM-DD>.parquet  —— 最新快照的全部房源，用于与下一个快照比较
+# 原始数据的各快照记入历史后可用 --prune-raw 删除（保留最新一个供清洗使用）。
+# 房源键生成方式变化时（index.json 中的 key_version），记录下一个快照前先把已有历史迁移到新的房源键。
+# 用法：
+#   python price_history.py [--city=CODE] [--prune-raw]     # 记录尚未记入历史的原始快照
+#   python price_history.py --change 4                        # 近4个快照各区单价中位数变化
+#   python price_history.py --drops 10 [--last 4] [--district 武侯区]   # 降价超过10%的房源
+# 依赖库：pandas, numpy, pyarrow, raw_store.py, storage.py
+# ------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from city_config import get_city
+from data_cleaner import convert_types, standardize_districts
+from incremental_cleaner import KEY_COLUMNS, LEGACY_KEY_COLUMNS, legacy_listing_keys, listing_keys
+from raw_store import LATEST, drop_snapshot, is_raw_dataset, list_snapshots, read_raw, today_snapshot
+from storage import load_table, save_table
+
+# 记录历史时读取的原始列（convert_types 需要 Followers；另含生成新旧房源键所需的列）
+RAW_HISTORY_COLUMNS = list(dict.fromkeys(
+    ['Title', 'Community', 'District', 'TotalPrice', 'UnitPrice', 'Area', 'Followers'] + KEY_COLUMNS + LEGACY_KEY_COLUMNS))
+# 房源键版本：对应 incremental_cleaner.listing_keys 的生成方式（1 为含行政区的旧版键）
+KEY_VERSION = 2
+# 快照中保存的列
+HISTORY_COLUMNS = ['ListingKey', 'District', 'Community', 'Title', 'Area', 'TotalPrice', 'UnitPrice']
+# 增量中的变化类型
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+# 聚合结果中代表全市的行
+ALL_DISTRICTS = '全部'
+
+
+def prepare_snapshot(raw, city=None):
+    """原始快照 -> 历史记录所需的列（房源键、标准区名、数值价格），同一房源键只保留最后一条"""
+    keys = listing_keys(raw)
+    df = convert_types(raw.copy())
+    df['District'] = standardize_districts(df['District'], city)
+    df.insert(0, 'ListingKey', keys)
+    df = df[HISTORY_COLUMNS].drop_duplicates('ListingKey', keep='last')
+    # 与存储类型（float32）一致，否则读回的旧价格与新价格比较时会因精度不同被误判为变化
+    for col in ['Area', 'TotalPrice', 'UnitPrice']:
+        df[col] = df[col].astype(np.float32)
+    return df.reset_index(drop=True)
+
+
+def diff_snapshots(previous, current):
+    """比较两个快照，返回增量（新增、下架、价格变化的房源）；previous 为 None 时全部为新增"""
+    if previous is None:
+        delta = current.assign(Change=ADDED, PrevTotalPrice=np.nan, PrevUnitPrice=np.nan)
+    else:
+        merged = previous.merge(current, on='ListingKey', how='outer', suffixes=('_prev', ''), indicator=True)
+        side = merged['_merge']
+        added = (side == 'right_only').to_numpy()
+        removed = (side == 'left_only').to_numpy()
+        # 缺失的价格视为相同的值，避免 NaN != NaN 被误判为变化
+        changed = (side == 'both').to_numpy() & (
+            (merged['TotalPrice'].fillna(-1) != merged['TotalPrice_prev'].fillna(-1))
+            | (merged['UnitPrice'].fillna(-1) != merged['UnitPrice_prev'].fillna(-1))
+        ).to_numpy()
+        keep = added | removed | changed
+        rows, removed = merged[keep], removed[keep]
+        delta = pd.DataFrame({'ListingKey': rows['ListingKey'].to_numpy()})
+        # 下架的房源只在旧快照中有描述信息
+        for col in ['District', 'Community', 'Title', 'Area']:
+            delta[col] = np.where(removed, rows[f'{col}_prev'].astype(object), rows[col].astype(object))
+        delta['Area'] = delta['Area'].astype(np.float32)
+        delta['TotalPrice'] = rows['TotalPrice'].to_numpy()
+        delta['UnitPrice'] = rows['UnitPrice'].to_numpy()
+        delta['Change'] = np.select([added[keep], removed], [ADDED, REMOVED], CHANGED)
+        delta['PrevTotalPrice'] = rows['TotalPrice_prev'].to_numpy()
+        delta['PrevUnitPrice'] = rows['UnitPrice_prev'].to_numpy()
+    # 按行政区排序，按区查询时可跳过无关的行组
+    return delta.sort_values(['District', 'ListingKey'], kind='stable').reset_index(drop=True)
+
+
+def _number(value, digits=2):
+    """JSON 中的数值：NaN 记为 null"""
+    return None if pd.isna(value) else round(float(value), digits)
+
+
+def snapshot_aggregates(current, delta):
+    """一个快照的聚合值：各区及全市的房源数、单价/总价中位数、单价均值、调价房源数与调价幅度中位数"""
+    changed = delta[delta['Change'] == CHANGED]
+    change_pct = (changed['UnitPrice'] / changed['PrevUnitPrice'] - 1) * 100
+
+    def summarize(frame, pct):
+        return {
+            'count': int(len(frame)),
+            'median_unit_price': _number(frame['UnitPrice'].median()),
+            'mean_unit_price': _number(frame['UnitPrice'].mean()),
+            'median_total_price': _number(frame['TotalPrice'].median()),
+            'changed': int(len(pct)),
+            'median_change_pct': _number(pct.median()),
+        }
+
+    districts = {
+        str(district): summarize(frame, change_pct[changed['District'] == district])
+        for district, frame in current.groupby(current['District'].astype(object), sort=True)
+    }
+    return {
+        'listings': int(len(current)),
+        'added': int((delta['Change'] == ADDED).sum()),
+        'removed': int((delta['Change'] == REMOVED).sum()),
+        'changed': int(len(changed)),
+        'all': summarize(current, change_pct),
+        'districts': districts,
+    }
+
+
+def to_records(df):
+    """DataFrame -> 可序列化为 JSON 的记录列表（房源键转为十六进制字符串，NaN 转为 None）"""
+    df = df.copy()
+    if 'ListingKey' in df:
+        df['ListingKey'] = [format(int(key), '016x') for key in df['ListingKey']]
+    df = df.astype({c: 'float64' for c in df.columns if df[c].dtype == np.float32}).round(2)
+    df = df.astype(object).where(df.notna(), None)
+    return [
+        {k: (v.item() if isinstance(v, np.generic) else v) for k, v in record.items()}
+        for record in df.to_dict(orient='records')
+    ]
+
+
+class PriceHistory:
+    """一个城市的快照历史：增量文件 + 最新状态 + 带聚合值的索引"""
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'key_version': KEY_VERSION, 'state': None, 'snapshots': []}
+
+    @property
+    def snapshots(self):
+        """已记录的快照名（按日期顺序）"""
+        return [entry['snapshot'] for entry in self.index['snapshots']]
+
+    @property
+    def needs_rekey(self):
+        """已有历史使用的是旧版房源键"""
+        return self.index['state'] is not None and self.index.get('key_version', 1) != KEY_VERSION
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def rekey(self, old_keys, new_keys):
+        """
+        把已记录的增量和最新状态中的旧版房源键替换为新版房源键（old_keys/new_keys 为同一批原始房源的两种键），
+        映射中没有的键（早已下架的房源）保持不变，替换后合并为同一房源的行只保留最后一条。
+        各文件先写临时文件再原子替换，最后更新索引中的键版本；中途失败时重新运行即可。
+        """
+        mapping = pd.Series(new_keys, index=old_keys)
+        mapping = mapping[~mapping.index.duplicated(keep='last')]
+        lookup, targets = pd.Index(mapping.index), mapping.to_numpy()
+        paths = [self.delta_path(name) for name in self.snapshots] + [os.path.join(self.root, self.index['state'])]
+        for path in paths:
+            df = load_table(path)
+            keys = df['ListingKey'].to_numpy().copy()
+            position = lookup.get_indexer(keys)
+            found = position >= 0
+            if not found.any():
+                continue
+            keys[found] = targets[position[found]]
+            df['ListingKey'] = keys
+            save_table(df.drop_duplicates('ListingKey', keep='last'), path + '.tmp')
+            os.replace(path + '.tmp', path)
+        self.index['key_version'] = KEY_VERSION
+        self._save_index()
+        print(f"价格历史已迁移到新的房源键（{len(paths)} 个文件）")
+
+    def delta_path(self, snapshot):
+        return os.path.join(self.root, 'deltas', f'{snapshot}.parquet')
+
+    def load_state(self, columns=None):
+        """最新快照的全部房源，没有历史时返回 None"""
+        if self.index['state'] is None:
+            return None
+        return load_table(os.path.join(self.root, self.index['state']), columns=columns)
+
+    def record(self, current, snapshot):
+        """
+        记录一个快照（current 为 prepare_snapshot 的结果），返回该快照的索引项。
+        快照一经记录不再修改：已记录的快照直接跳过，早于最新快照的快照拒绝记录。
+        """
+        snapshots = self.snapshots
+        if snapshot in snapshots:
+            print(f"快照 {snapshot} 已记录，跳过。")
+            return None
+        if snapshots and snapshot < snapshots[-1]:
+            raise ValueError(f"快照 {snapshot} 早于已记录的最新快照 {snapshots[-1]}，历史快照不可修改")
+
+        delta = diff_snapshots(self.load_state(), current)
+        entry = {'snapshot': snapshot, **snapshot_aggregates(current, delta)}
+
+        # 先写增量与新状态，最后替换索引：中途失败时索引仍指向旧状态，重新运行即可
+        os.makedirs(os.path.dirname(self.delta_path(snapshot)), exist_ok=True)
+        save_table(delta, self.delta_path(snapshot) + '.tmp')
+        os.replace(self.delta_path(snapshot) + '.tmp', self.delta_path(snapshot))
+        state_name = f'state-{snapshot}.parquet'
+        save_table(current, os.path.join(self.root, state_name))
+
+        old_state = self.index['state']
+        self.index = {**self.index, 'state': state_name, 'snapshots': self.index['snapshots'] + [entry]}
+        self._save_index()
+        if old_state and old_state != state_name:
+            os.remove(os.path.join(self.root, old_state))
+
+        print(f"快照 {snapshot}: {entry['listings']} 条房源，新增 {entry['added']}，下架 {entry['removed']}，"
+              f"调价 {entry['changed']}（增量 {len(delta)} 行）")
+        return entry
+
+    def reconstruct(self, snapshot):
+        """按顺序回放增量，还原某个快照的全部房源"""
+        snapshots = self.snapshots
+        if snapshot not in snapshots:
+            raise ValueError(f"未记录的快照: {snapshot}")
+        state = pd.DataFrame(columns=HISTORY_COLUMNS)
+        for name in snapshots[:snapshots.index(snapshot) + 1]:
+            delta = load_table(self.delta_path(name), columns=HISTORY_COLUMNS + ['Change'])
+            delta['District'] = delta['District'].astype(object)
+            state = state[~state['ListingKey'].isin(delta['ListingKey'])]
+            state = pd.concat([state, delta.loc[delta['Change'] != REMOVED, HISTORY_COLUMNS]], ignore_index=True)
+        return state.reset_index(drop=True)
+
+    def _window(self, last_n):
+        """最近 last_n 个快照的索引项（last_n 为 None 时为全部）"""
+        entries = self.index['snapshots']
+        return entries[-last_n:] if last_n else entries
+
+    def aggregates(self, last_n=None):
+        """各快照各区的聚合值（长表：Snapshot, District, count, median_unit_price, ...），只读索引"""
+        rows = [
+            {'Snapshot': entry['snapshot'], 'District': district, **stats}
+            for entry in self._window(last_n)
+            for district, stats in [(ALL_DISTRICTS, entry['all'])] + list(entry['districts'].items())
+        ]
+        return pd.DataFrame(rows)
+
+    def district_median_change(self, last_n=2, districts=None):
+        """
+        最近 last_n 个快照中，各区单价中位数从第一个快照到最后一个快照的变化（只读索引中的聚合值）。
+        返回列：District, From, To, MedianUnitPriceFrom, MedianUnitPriceTo, Change, ChangePct, Changed
+        （Changed 为窗口内调价房源的次数）。
+        """
+        window = self._window(last_n)
+        if len(window) < 2:
+            raise ValueError(f"至少需要两个快照，当前只有 {len(self.index['snapshots'])} 个")
+        first, last = window[0], window[-1]
+        names = [ALL_DISTRICTS] + sorted(set(first['districts']) | set(last['districts']))
+        if districts is not None:
+            names = [name for name in names if name in districts]
+
+        def stats(entry, name):
+            return entry['all'] if name == ALL_DISTRICTS else entry['districts'].get(name, {})
+
+        rows = []
+        for name in names:
+            before = stats(first, name).get('median_unit_price')
+            after = stats(last, name).get('median_unit_price')
+            change = after - before if before is not None and after is not None else None
+            rows.append({
+                'District': name, 'From': first['snapshot'], 'To': last['snapshot'],
+                'MedianUnitPriceFrom': before, 'MedianUnitPriceTo': after, 'Change': _number(change),
+                'ChangePct': _number(change / before * 100) if change is not None and before else None,
+                'Changed': sum(stats(entry, name).get('changed', 0) for entry in window[1:]),
+            })
+        return pd.DataFrame(rows)
+
+    def price_drops(self, min_drop=0.1, last_n=None, districts=None):
+        """
+        最近 last_n 个快照中总价累计下降超过 min_drop（比例）的在售房源，按降幅从大到小排列。
+        窗口第一个快照为比较基准，只读取其后各快照的增量文件。
+        返回列：ListingKey, District, Community, Title, Area, FirstPrice, LastPrice, DropPct, Snapshot
+        """
+        window = [entry['snapshot'] for entry in self._window(last_n)][1:]
+        columns = ['ListingKey', 'Change', 'District', 'Community', 'Title', 'Area', 'TotalPrice', 'PrevTotalPrice']
+        frames = [
+            load_table(self.delta_path(name), columns=columns, districts=districts).assign(Snapshot=name)
+            for name in window
+        ]
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame(columns=['ListingKey', 'District', 'Community', 'Title', 'Area',
+                                         'FirstPrice', 'LastPrice', 'DropPct', 'Snapshot'])
+        deltas = pd.concat(frames, ignore_index=True)
+        deltas['District'] = deltas['District'].astype(object)
+        # 变化前的价格：调价为原价，窗口内新上架的房源为上架时的价格
+        deltas['Before'] = deltas['PrevTotalPrice'].fillna(deltas['TotalPrice'])
+        # 增量按快照顺序拼接，first/last 即窗口内最早/最晚的值（跳过 NaN）
+        listings = deltas.groupby('ListingKey', sort=False).agg(
+            District=('District', 'last'), Community=('Community', 'last'), Title=('Title', 'last'),
+            Area=('Area', 'last'), FirstPrice=('Before', 'first'), LastPrice=('TotalPrice', 'last'),
+            LastChange=('Change', 'last'), Snapshot=('Snapshot', 'last'),
+        ).reset_index()
+        listings = listings[listings['LastChange'].astype(object) != REMOVED]
+        listings['DropPct'] = (1 - listings['LastPrice'] / listings['FirstPrice']) * 100
+        result = listings[listings['DropPct'] >= min_drop * 100].drop(columns='LastChange')
+        return result.sort_values('DropPct', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def record_raw_snapshots(city=None, prune_raw=False):
+    """
+    将城市原始数据中尚未记入历史的快照依次记入，返回 PriceHistory。
+    prune_raw 为 True 时删除已记入历史的原始快照（保留最新一个，清洗仍读取它）。
+    """
+    city = get_city(city)
+    history = PriceHistory(city.history_dir)
+    if not is_raw_dataset(city.raw_dir):
+        print(f"错误: 未找到原始数据目录 '{city.raw_dir}'。请先运行 1_scraper.py。")
+        return history
+    snapshots = list_snapshots(city.raw_dir)
+    recorded = history.snapshots
+    if snapshots:
+        pending = [name for name in snapshots if not recorded or name > recorded[-1]]
+    else:
+        # 旧版目录结构没有快照分区：整个目录视为当天的快照
+        pending = [None] if not recorded or today_snapshot() > recorded[-1] else []
+    if history.needs_rekey:
+        # 用同一批原始房源的新旧两种键建立映射（优先使用下一个待记录的快照，与已记录的最新状态最接近）
+        raw = read_raw(city.raw_dir, columns=RAW_HISTORY_COLUMNS, snapshot=pending[0] if pending else LATEST)
+        history.rekey(legacy_listing_keys(raw), listing_keys(raw))
+    if not pending:
+        print("没有新的快照需要记录。")
+    for name in pending:
+        raw = read_raw(city.raw_dir, columns=RAW_HISTORY_COLUMNS, snapshot=name)
+        history.record(prepare_snapshot(raw, city.code), name or today_snapshot())
+
+    if prune_raw and snapshots:
+        for name in snapshots[:-1]:
+            if name in history.snapshots:
+                drop_snapshot(city.raw_dir, name)
+                print(f"已删除原始快照 {name}（已记入历史）")
+    return history
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='房源价格历史：记录快照与查询价格变化')
+    arg_parser.add_argument('--city', help='城市代码（默认: cities.json 中的默认城市）')
+    arg_parser.add_argument('--prune-raw', action='store_true', help='删除已记入历史的原始快照（保留最新一个）')
+    arg_parser.add_argument('--change', type=int, metavar='N', help='查询最近 N 个快照各区单价中位数的变化')
+    arg_parser.add_argument('--drops', type=float, metavar='PCT', help='查询总价下降超过 PCT%% 的房源')
+    arg_parser.add_argument('--last', type=int, metavar='N', help='--drops 的查询窗口（最近 N 个快照，默认全部）')
+    arg_parser.add_argument('--district', action='append', help='只查询指定的行政区（标准区名），可重复')
+    args = arg_parser.parse_args()
+
+    try:
+        if args.change is None and args.drops is None:
+            record_raw_snapshots(args.city, prune_raw=args.prune_raw)
+            return
+        history = PriceHistory(get_city(args.city).history_dir)
+        pd.set_option('display.width', 200)
+        if args.change is not None:
+            print(history.district_median_change(args.change, args.district).to_string(index=False))
+        if args.drops is not None:
+            drops = history.price_drops(args.drops / 100, args.last, args.district)
+            print(f"降价超过 {args.drops}% 的房源: {len(drops)} 套")
+            print(drops.head(50).to_string(index=False))
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
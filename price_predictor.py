@@ -0,0 +1,243 @@
+# price_predictor.py
+# ------------------------------------------
+# 本模块提供房价预测的推理功能。
+# 主要功能：
+# 1. PricePredictor: 将原始房源属性按训练时的词表编码为稀疏特征，调用服务模型预测总价
+# 2. MicroBatcher: 把并发到达的单条请求合并成小批量，一次向量化 predict 完成打分
+# 3. score_file: 对 csv / Parquet 文件批量打分，分批读取、分批写出
+# 用法（批量打分）：
+#   python price_predictor.py 输入文件 输出文件 [--batch-size N]
+# 依赖库：pandas, numpy, feature_encoder.py, model_store.py, storage.py
+# ------------------------------------------
+
+import argparse
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from data_cleaner import standardize_districts
+from feature_encoder import CategoryEncoder
+from instrumentation import count, timed
+from model_store import load_artifact
+from storage import TableWriter, iter_table_batches
+
+# 接口参数名 -> 数据列名（批量打分的输入文件直接使用列名）
+INPUT_FIELDS = {
+    'district': 'District',
+    'sub_district': 'SubDistrict',
+    'area': 'Area',
+    'layout': 'Layout',
+    'decoration': 'Decoration',
+    'orientation': 'Orientation',
+    'elevator': 'Elevator',
+    'year': 'YearBuilt',
+}
+PREDICTION_COLUMN = 'PredictedPrice'
+
+
+class PricePredictor:
+    """
+    服务模型的推理封装。
+    artifact 为 machine_learning.train_serving_model 的产物：
+    编码器词表随模型一起保存，推理时的列布局与训练时完全一致。
+    city 为训练数据所属的城市代码，用于区名标准化（默认城市见 cities.json）。
+    """
+
+    def __init__(self, artifact, city=None):
+        self.city = city
+        self.model = artifact['model']
+        # 单条/小批量推理时并行调度的开销远大于计算本身
+        self.model.set_params(n_jobs=1)
+        self.encoder = CategoryEncoder.from_dict(artifact['encoder'])
+        columns = self.encoder.columns
+        self.feature_index = np.array([columns.index(name) for name in artifact['feature_names']])
+        self.fill_values = artifact.get('fill_values', {})
+        self.evaluation = artifact.get('evaluation')
+
+    @classmethod
+    def from_cache(cls, key=None, city=None):
+        """
+        从模型缓存加载服务模型，没有缓存时返回 None。
+        key 为 None 时加载城市 city（默认城市见 cities.json）的流水线最近一次构建的版本。
+        """
+        if key is None:
+            from pipeline import built_artifact_keys
+            key = (built_artifact_keys(city) or {}).get('serving_model')
+            if key is None:
+                return None
+        _, artifact = load_artifact('serving_model', key)
+        return cls(artifact, city) if artifact is not None else None
+
+    def prepare(self, df):
+        """
+        将原始属性整理为编码器所需的列：标准化区名、由户型提取室数，
+        缺失的数值特征用训练集中位数填充；编码器需要但模型不使用的数值列（目标、被排除的特征）填 0。
+        """
+        df = df.copy()
+        if 'District' in df.columns:
+            df['District'] = standardize_districts(df['District'], self.city)
+        if 'RoomCount' not in df.columns and 'Layout' in df.columns:
+            df['RoomCount'] = df['Layout'].astype('string').str.extract(r'(\d)室', expand=False).astype(float)
+        for col in self.encoder.features:
+            if col not in df.columns:
+                df[col] = np.nan
+        for col in self.encoder.numeric_columns:
+            values = pd.to_numeric(df[col], errors='coerce') if col in df.columns else pd.Series(np.nan, index=df.index)
+            df[col] = values.fillna(self.fill_values.get(col, 0.0))
+        return df
+
+    def predict_frame(self, df):
+        """对 DataFrame（列名同清洗后的数据）预测总价（万元）"""
+        with timed('model_inference_seconds', model='serving_model'):
+            matrix, _ = self.encoder.transform(self.prepare(df))
+            predictions = self.model.predict(matrix[:, self.feature_index])
+        count('model_inference_rows_total', len(predictions), model='serving_model')
+        return predictions
+
+    def predict_records(self, records):
+        """对接口参数格式的记录列表预测总价"""
+        rows = [{INPUT_FIELDS[k]: v for k, v in record.items() if k in INPUT_FIELDS} for record in records]
+        return self.predict_frame(pd.DataFrame(rows, columns=list(INPUT_FIELDS.values())))
+
+
+# 取值必须为字符串的字段（可省略或为 null）
+TEXT_FIELDS = ['district', 'sub_district', 'layout', 'decoration', 'orientation', 'elevator']
+
+
+def _finite_number(value):
+    """转换为有限的浮点数，无法转换（含布尔值、inf、nan）时返回 None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def validate_record(record):
+    """校验单条预测请求，返回错误信息（合法时返回 None）"""
+    if not isinstance(record, dict):
+        return '请求体必须是 JSON 对象'
+    for field in TEXT_FIELDS:
+        if record.get(field) is not None and not isinstance(record[field], str):
+            return f'字段 {field} 必须是字符串'
+    if not record.get('district'):
+        return '缺少字段 district'
+    area = _finite_number(record.get('area'))
+    if area is None:
+        return '字段 area 必须是有限的数字'
+    if not area > 0:
+        return '字段 area 必须大于 0'
+    if record.get('year') is not None and _finite_number(record['year']) is None:
+        return '字段 year 必须是有限的数字'
+    return None
+
+
+class MicroBatcher:
+    """
+    微批处理器：后台线程从队列中取出请求，凑满 max_batch 条或等待超过 max_wait 秒后
+    合并为一批调用 predict_fn(records)，再把结果分发给各请求。
+    predict_fn 在每批调用时取值，因此可在不停止服务的情况下切换模型。
+    start 为 False 时需稍后调用 start()（如预加载的多进程服务中，在每个工作进程 fork 之后启动）。
+    """
+
+    def __init__(self, predict_fn, max_batch=32, max_wait=0.002, start=True):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        if start:
+            self.start()
+
+    def start(self):
+        """启动后台批处理线程（已启动时不做任何事）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def submit(self, record):
+        """提交一条记录，返回 Future"""
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    def predict(self, record, timeout=5.0):
+        return self.submit(record).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            records = [record for record, _ in batch]
+            try:
+                predictions = self.predict_fn(records)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), value in zip(batch, predictions):
+                future.set_result(float(value))
+
+
+def score_file(predictor, input_path, output_path, batch_size=100_000):
+    """
+    对 csv / Parquet 文件批量打分，输出原始列 + PredictedPrice 列。
+    分批读取、分批写出，内存占用只与批大小有关。
+    """
+    total = 0
+    writer = TableWriter(output_path) if not output_path.endswith('.csv') else None
+    try:
+        for i, batch in enumerate(iter_table_batches(input_path, batch_size)):
+            batch[PREDICTION_COLUMN] = np.round(predictor.predict_frame(batch), 2)
+            if writer is not None:
+                writer.write(batch)
+            else:
+                batch.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False,
+                             encoding='utf-8-sig' if i == 0 else 'utf-8')
+            total += len(batch)
+            print(f"  已打分 {total} 行")
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='对房源文件批量预测总价')
+    arg_parser.add_argument('input', help='输入文件（csv 或 Parquet，列名同清洗后的数据）')
+    arg_parser.add_argument('output', help='输出文件（.csv 或 .parquet）')
+    arg_parser.add_argument('--batch-size', type=int, default=100_000, help='每批行数')
+    arg_parser.add_argument('--city', default=None, help='城市代码（默认城市见 cities.json），使用该城市的服务模型')
+    args = arg_parser.parse_args()
+
+    predictor = PricePredictor.from_cache(city=args.city)
+    if predictor is None:
+        print("错误: 未找到该城市的服务模型，请先运行 python pipeline.py 完成训练。")
+        return
+    try:
+        total = score_file(predictor, args.input, args.output, args.batch_size)
+    except FileNotFoundError:
+        print(f"错误: 未找到输入文件 '{args.input}'。")
+        return
+    print(f"批量打分完成，共 {total} 行，结果已保存到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
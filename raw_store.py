@@ -0,0 +1,173 @@
+# raw_store.py
+# ------------------------------------------
+# 本模块负责原始爬取数据的流式落盘与读取。
+# 主要功能：
+# 1. PartitionedWriter: 按行政区和快照日期分区、分批写入固定schema的Parquet文件，内存占用与抓取页数无关
+# 2. read_raw / iter_raw_batches: 合并读取为 DataFrame 或按批次流式读取；
+#    可按行政区和快照过滤，只打开需要的分区目录（默认只读最新快照）
+# 3. list_snapshots / latest_snapshot / drop_snapshot: 只扫描目录名，不读取数据文件
+# 目录结构：<城市代码>_raw_data/District=<行政区>/Snapshot=<YYYY-MM-DD>/part-00000.parquet
+#（城市分区即各城市独立的根目录，见 city_config.py）
+# 依赖库：pyarrow, pandas
+# ------------------------------------------
+
+import glob
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# 原始数据的列顺序（与 scraper.parse_page 输出的15个字段一致）
+RAW_COLUMNS = [
+    'Title', 'Community', 'District', 'SubDistrict', 'TotalPrice', 'UnitPrice', 'Area',
+    'Layout', 'Orientation', 'Decoration', 'Floor', 'YearBuilt', 'BuildingType',
+    'Followers', 'Elevator'
+]
+# 房源编号（取自标题链接，见 dedup.py），不属于清洗使用的原始字段，只在需要时单独读取
+ID_COLUMN = 'ListingId'
+PARTITION_COLUMN = 'District'
+SNAPSHOT_COLUMN = 'Snapshot'
+# read_raw 等函数的 snapshot 参数取该值时只读取最新快照
+LATEST = 'latest'
+
+# 文件内的固定schema：原始字段全部为字符串，分区列由目录名提供
+FILE_SCHEMA = pa.schema([(col, pa.string()) for col in RAW_COLUMNS + [ID_COLUMN] if col != PARTITION_COLUMN])
+PARTITION_SCHEMA = pa.schema([(PARTITION_COLUMN, pa.string()), (SNAPSHOT_COLUMN, pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+# 读取时使用固定的完整schema：早期写入、没有房源编号列的文件中该列读为空值
+DATASET_SCHEMA = pa.schema(list(FILE_SCHEMA) + list(PARTITION_SCHEMA))
+
+
+def today_snapshot():
+    """当天的快照名（YYYY-MM-DD）"""
+    return time.strftime('%Y-%m-%d')
+
+
+class PartitionedWriter:
+    """
+    按行政区和快照分区的流式Parquet写入器。
+    参数：
+        root: 输出目录（每个城市一个）
+        snapshot: 快照名，默认为当天日期；该快照已存在时会被覆盖，其他快照保留
+        batch_size: 单个分区缓冲达到该条数时写出一个文件
+    """
+
+    def __init__(self, root='chengdu_raw_data', batch_size=2000, snapshot=None):
+        self.root = root
+        self.snapshot = snapshot or today_snapshot()
+        self.batch_size = batch_size
+        self.total = 0
+        self._buffers = {}
+        self._file_seq = {}
+        for old in glob.glob(os.path.join(root, f'{PARTITION_COLUMN}=*', f'{SNAPSHOT_COLUMN}={self.snapshot}')):
+            shutil.rmtree(old)
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, records):
+        """写入一批房源记录（字典列表），缓冲满时自动落盘"""
+        for record in records:
+            district = record[PARTITION_COLUMN]
+            buffer = self._buffers.setdefault(district, [])
+            buffer.append(record)
+            if len(buffer) >= self.batch_size:
+                self._flush_partition(district)
+        self.total += len(records)
+
+    def _flush_partition(self, district):
+        buffer = self._buffers.get(district)
+        if not buffer:
+            return
+        columns = {
+            field.name: pa.array([r.get(field.name) for r in buffer], type=pa.string())
+            for field in FILE_SCHEMA
+        }
+        table = pa.Table.from_pydict(columns, schema=FILE_SCHEMA)
+        part_dir = os.path.join(self.root, f'{PARTITION_COLUMN}={district}', f'{SNAPSHOT_COLUMN}={self.snapshot}')
+        os.makedirs(part_dir, exist_ok=True)
+        seq = self._file_seq.get(district, 0)
+        pq.write_table(table, os.path.join(part_dir, f'part-{seq:05d}.parquet'))
+        self._file_seq[district] = seq + 1
+        self._buffers[district] = []
+
+    def flush(self):
+        """将所有分区的缓冲写出"""
+        for district in list(self._buffers):
+            self._flush_partition(district)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _dataset(root):
+    return ds.dataset(root, format='parquet', partitioning=PARTITIONING, schema=DATASET_SCHEMA)
+
+
+def list_snapshots(root='chengdu_raw_data'):
+    """按日期顺序列出已有的快照（只扫描目录名）"""
+    pattern = os.path.join(root, f'{PARTITION_COLUMN}=*', f'{SNAPSHOT_COLUMN}=*')
+    return sorted({os.path.basename(path).split('=', 1)[1] for path in glob.glob(pattern)})
+
+
+def latest_snapshot(root='chengdu_raw_data'):
+    """最新的快照名，没有快照分区（旧版目录结构）时返回 None"""
+    snapshots = list_snapshots(root)
+    return snapshots[-1] if snapshots else None
+
+
+def drop_snapshot(root, snapshot):
+    """删除某个快照的全部分区目录（已记入价格历史后可用于回收空间）"""
+    for path in glob.glob(os.path.join(root, f'{PARTITION_COLUMN}=*', f'{SNAPSHOT_COLUMN}={snapshot}')):
+        shutil.rmtree(path)
+
+
+def raw_filter(root, districts=None, snapshot=LATEST):
+    """
+    生成分区过滤表达式：districts 为网站上的区名列表，snapshot 为快照名、LATEST 或 None（全部快照）。
+    过滤条件只涉及分区列，读取时不满足条件的目录不会被打开。
+    """
+    expression = None
+    if snapshot == LATEST:
+        snapshot = latest_snapshot(root)
+    if snapshot is not None:
+        expression = ds.field(SNAPSHOT_COLUMN) == snapshot
+    if districts is not None:
+        condition = ds.field(PARTITION_COLUMN).isin(list(districts))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def is_raw_dataset(path):
+    """判断路径是否为分区原始数据目录"""
+    return os.path.isdir(path)
+
+
+def read_raw(root='chengdu_raw_data', columns=None, districts=None, snapshot=LATEST):
+    """
+    合并读取分区数据，返回列顺序与原始csv一致的 DataFrame。
+    参数：
+        columns: 只读取指定列，默认读取全部
+        districts / snapshot: 分区过滤条件（见 raw_filter），默认读取全部行政区的最新快照
+    """
+    columns = columns or RAW_COLUMNS
+    table = _dataset(root).to_table(columns=columns, filter=raw_filter(root, districts, snapshot))
+    return table.to_pandas()[columns]
+
+
+def iter_raw_batches(root='chengdu_raw_data', batch_size=100_000, columns=None, districts=None, snapshot=LATEST):
+    """按批次流式读取原始数据，每批产出一个 DataFrame（过滤条件同 read_raw）"""
+    columns = columns or RAW_COLUMNS
+    batches = _dataset(root).to_batches(columns=columns, batch_size=batch_size,
+                                        filter=raw_filter(root, districts, snapshot))
+    for batch in batches:
+        if batch.num_rows:
+            yield batch.to_pandas()[columns]
@@ -0,0 +1,71 @@
+# response_cache.py
+# ------------------------------------------
+# 本模块为渲染好的页面提供内存缓存与HTTP条件请求支持。
+# 主要功能：
+# 1. 按“数据/模型版本”缓存渲染结果，版本不变时不再重新渲染图表
+# 2. 预先压缩 gzip 正文，客户端支持时直接返回压缩内容
+# 3. 设置 ETag / Last-Modified，浏览器再次请求时返回 304
+# 依赖库：flask, gzip, hashlib, threading
+# ------------------------------------------
+
+import gzip
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from flask import Response
+
+
+class RenderedPage:
+    """一次渲染的结果：原始正文、gzip 正文、ETag 与生成时间"""
+
+    def __init__(self, version, html):
+        self.version = version
+        self.body = html.encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        # HTTP 日期精确到秒
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class ResponseCache:
+    """
+    按版本号缓存渲染结果。版本号变化（数据或模型更新）时自动重新渲染；
+    同一版本的并发请求只渲染一次。
+    """
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, render):
+        page = self._pages.get(name)
+        if page is not None and page.version == version:
+            return page
+        with self._lock:
+            page = self._pages.get(name)
+            if page is None or page.version != version:
+                page = RenderedPage(version, render())
+                self._pages[name] = page
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+def cached_response(page, request, mimetype='text/html'):
+    """
+    根据请求头构造响应：命中 ETag/Last-Modified 时返回 304，
+    客户端接受 gzip 时返回预压缩的正文。
+    """
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+    response = Response(page.gzip_body if use_gzip else page.body, mimetype=mimetype)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(page.etag + ('-gz' if use_gzip else ''))
+    response.last_modified = page.last_modified
+    # 允许浏览器缓存，但每次使用前需向服务端确认（命中时返回304）
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
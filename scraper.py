@@ -1,52 +1,59 @@
-# 1_scraper.py (最终稳定版 - 硬编码行政区URL)
+# 1_scraper.py
 # ------------------------------------------
-# 本脚本用于爬取链家成都二手房各行政区的房源信息。
+# 本脚本用于爬取链家各城市二手房各行政区的房源信息。
 # 主要流程：
-# 1. 预设各行政区的URL，遍历每个区的多页房源列表。
+# 1. 从 cities.json 读取各城市的行政区URL，遍历每个区的多页房源列表；多个城市并行抓取。
 # 2. 对每一页，解析房源信息，提取结构化数据。
-# 3. 合并所有区的数据，保存为csv文件。
-# 依赖库：requests, BeautifulSoup, pandas, time, random, urllib.parse
+# 3. 逐页按房源编号去重（翻页时列表顺序变化、推广房源跨区重复，见 dedup.py），按区输出去重统计。
+# 4. 按行政区和快照日期分批流式写入各城市的Parquet目录（见 raw_store.py）。
+# 抓取由 fetcher.py 中的并发引擎完成（连接池 + 令牌桶限速 + 退避重试），每个城市使用独立的连接池和限速器。
+# 依赖库：requests, BeautifulSoup, pandas, threading, concurrent.futures
 # ------------------------------------------
 
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
-import time
-import random
-from urllib.parse import urljoin
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+from city_config import enabled_cities, get_city
+from crawl_cache import PageCache
+from fetcher import Fetcher, RateLimiter
+from instrumentation import count, run_report, timed
+from dedup import ListingDeduper
+from listing_parser import listing_id_from_url, parse_page_lxml
+from raw_store import RAW_COLUMNS, PartitionedWriter
 
 # ==================== 配置区 ====================
 MAX_PAGES_PER_DISTRICT = 3 # 调整此处以控制每个区抓取的页数
+CONCURRENCY = 4            # 每个城市的并发抓取线程数（同时也是连接池大小）
+GLOBAL_RATE = 2.0          # 每个城市（子域名）的全局限速：每秒最多请求数
+DISTRICT_RATE = 0.5        # 单个行政区限速：每秒最多请求数
+DISTRICT_RATES = {}        # 个别行政区的单独限速，如 {'锦江': 0.2}
+MAX_RETRIES = 3            # 遇到 429/5xx 时的最大重试次数
+USE_CACHE = True           # 是否使用页面缓存与断点清单（每个城市一个 SQLite 文件，见 city_config.py）
+CACHE_TTL = 24 * 3600      # 缓存有效期（秒），过期页面通过条件请求重新验证
+PARSER_BACKEND = 'lxml'    # 页面解析后端：'lxml'（XPath快速解析）或 'bs4'（BeautifulSoup参考实现）
+PARSE_WORKERS = 0          # 解析进程数，0 表示在抓取线程内直接解析
+WRITE_BATCH_SIZE = 2000    # 每个分区累积多少条记录写出一个文件
+DEDUP = True               # 抓取过程中按房源编号去重（见 dedup.py）
+DEDUP_CAPACITY = 1_000_000 # 去重布隆过滤器的预计房源数
+DEDUP_ERROR_RATE = 0.01    # 去重布隆过滤器的误判率（误判由精确集合兜底，不影响结果）
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Referer': 'https://cd.lianjia.com/ershoufang/',
     'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
 }
 
-# --- 核心修改：硬编码行政区URL，不再从首页动态获取 ---
-DISTRICT_URLS = {
-    '锦江': 'https://cd.lianjia.com/ershoufang/jinjiang/',
-    '青羊': 'https://cd.lianjia.com/ershoufang/qingyang/',
-    '武侯': 'https://cd.lianjia.com/ershoufang/wuhou/',
-    '高新': 'https://cd.lianjia.com/ershoufang/gaoxin7/',
-    '成华': 'https://cd.lianjia.com/ershoufang/chenghua/',
-    '金牛': 'https://cd.lianjia.com/ershoufang/jinniu/',
-    '天府新区': 'https://cd.lianjia.com/ershoufang/tianfuxinqu/',
-    '高新西': 'https://cd.lianjia.com/ershoufang/gaoxinxi/',
-    '双流': 'https://cd.lianjia.com/ershoufang/shuangliu/',
-    '温江': 'https://cd.lianjia.com/ershoufang/wenjiang/',
-    '郫都': 'https://cd.lianjia.com/ershoufang/pidou/',
-    '龙泉驿': 'https://cd.lianjia.com/ershoufang/longquanyi/',
-    '新都': 'https://cd.lianjia.com/ershoufang/xindou/',
-    '都江堰': 'https://cd.lianjia.com/ershoufang/doujiangyan/',
-    '青白江': 'https://cd.lianjia.com/ershoufang/qingbaijiang/',
-}
+# 各城市的行政区URL与区名映射见 cities.json（city_config.py）；默认城市的行政区URL：
+DISTRICT_URLS = get_city().district_urls()
 # ===============================================
 
 
 def parse_page(html, guaranteed_district):
     """
-    解析单个页面的HTML，提取房源信息。
+    解析单个页面的HTML，提取房源信息（BeautifulSoup 参考实现）。
+    快速解析后端见 listing_parser.parse_page_lxml，两者输出应完全一致。
     参数：
         html: 页面HTML源码
         guaranteed_district: 当前行政区名称（用于标注）
@@ -62,8 +69,10 @@ def parse_page(html, guaranteed_district):
     data = []
     for house in house_list:
         try:
-            # 标题
-            title = house.select_one('div.title > a').text.strip()
+            # 标题、房源编号（标题链接中的数字编号）
+            title_link = house.select_one('div.title > a')
+            title = title_link.text.strip()
+            listing_id = listing_id_from_url(title_link.get('href'))
             # 小区名
             community = house.select_one('div.positionInfo > a').text.strip()
             # 子区域
@@ -86,7 +95,8 @@ def parse_page(html, guaranteed_district):
                 'Title': title, 'Community': community, 'District': guaranteed_district, 'SubDistrict': sub_district.strip(),
                 'Layout': layout.strip(), 'Area': area.strip(), 'Orientation': orientation.strip(), 'Decoration': decoration.strip(),
                 'Floor': floor.strip(), 'YearBuilt': year_built.strip(), 'BuildingType': building_type.strip(),
-                'TotalPrice': total_price, 'UnitPrice': unit_price, 'Followers': followers, 'Elevator': elevator
+                'TotalPrice': total_price, 'UnitPrice': unit_price, 'Followers': followers, 'Elevator': elevator,
+                'ListingId': listing_id,
             })
         except Exception as e:
             print(f"解析房源时出错: {e}")
@@ -94,63 +104,272 @@ def parse_page(html, guaranteed_district):
     return data
 
 
-def main():
+PARSERS = {
+    'bs4': parse_page,
+    'lxml': parse_page_lxml,
+}
+
+
+def get_parser(backend=None):
+    """按名称返回解析函数，默认使用 PARSER_BACKEND"""
+    backend = backend or PARSER_BACKEND
+    if backend not in PARSERS:
+        raise ValueError(f"未知的解析后端 '{backend}'，可选: {', '.join(PARSERS)}")
+    return PARSERS[backend]
+
+
+def _fetch_and_parse(fetcher, district_name, page, page_url, stop_pages, lock, cache=None,
+                     parser=parse_page, parse_pool=None, resumed=False):
     """
-    主函数，遍历所有行政区URL，抓取每区多页房源信息，合并保存。
+    抓取并解析单页，返回 (状态, 房源列表)。
+    状态取值：ok / empty / not_found / error / skipped
+    有缓存时：有效期内的页面直接读缓存；过期页面发送条件请求，304 时复用缓存正文。
+    resumed 为 True 表示断点清单中该页已完成，直接使用缓存正文。
+    提供 parse_pool 时，解析交给进程池完成，以利用多核。
     """
-    all_data = []
+    with lock:
+        stop_page = stop_pages.get(district_name)
+    if stop_page is not None and page > stop_page:
+        return 'skipped', None
+
+    entry = cache.get(page_url) if cache is not None else None
+    if entry is not None and (resumed or cache.is_fresh(entry)):
+        count('scraper_cache_hits_total')
+        status_code, html = entry['status'], entry['body']
+    else:
+        try:
+            with timed('scraper_fetch_seconds'):
+                response = fetcher.fetch(page_url, key=district_name, headers=PageCache.conditional_headers(entry))
+            if response.status_code == 304 and entry is not None:
+                cache.touch(page_url)
+                status_code, html = entry['status'], entry['body']
+            else:
+                if response.status_code != 404:
+                    response.raise_for_status()
+                status_code, html = response.status_code, response.text
+                if cache is not None:
+                    cache.put(page_url, status_code, html,
+                              etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get('Last-Modified'))
+        except requests.RequestException as e:
+            print(f"  请求 {district_name} 第 {page} 页失败: {e}")
+            count('scraper_pages_total', status='error')
+            return 'error', None
+
+    if status_code == 404:
+        status, page_data = 'not_found', None
+    else:
+        with timed('scraper_parse_seconds', stage='parse'):
+            if parse_pool is not None:
+                page_data = parse_pool.submit(parser, html, district_name).result()
+            else:
+                page_data = parser(html, district_name)
+        status = 'ok' if page_data else 'empty'
+        count('scraper_listings_total', len(page_data or []))
+    count('scraper_pages_total', status=status)
+    if cache is not None:
+        cache.mark_page(district_name, page, page_url, status, len(page_data or []))
+    return status, page_data
+
+
+def crawl(district_urls=None, max_pages=MAX_PAGES_PER_DISTRICT, concurrency=CONCURRENCY, fetcher=None, cache=None,
+          parser_backend=None, parse_workers=PARSE_WORKERS):
+    """
+    并发抓取各行政区的房源列表页，按 (行政区, 页码) 顺序逐页产出结果。
+    参数：
+        district_urls: {行政区: 列表页URL}，默认使用 DISTRICT_URLS（可指向本地测试服务器）
+        max_pages: 每个行政区最多抓取的页数
+        concurrency: 并发线程数
+        fetcher: 自定义的 Fetcher 实例，默认按配置区参数创建
+        cache: PageCache 实例，提供后已缓存且未过期的页面不再请求；
+               断点清单中有效期内已完成的页面直接使用缓存，已知的404/无数据页之后的页面不再提交
+        parser_backend: 解析后端名称（见 PARSERS），默认 PARSER_BACKEND
+        parse_workers: 解析进程数，大于0时在进程池中解析
+    产出：
+        (district_name, page, page_data)
+    某页返回404、无数据或请求失败时，该区后续页面不再产出（与逐页抓取的行为一致）。
+    """
+    district_urls = district_urls or DISTRICT_URLS
+    parser = get_parser(parser_backend)
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers else None
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        limiter = RateLimiter(global_rate=GLOBAL_RATE, per_key_rate=DISTRICT_RATE, per_key_rates=DISTRICT_RATES)
+        fetcher = Fetcher(headers=HEADERS, concurrency=concurrency, limiter=limiter, max_retries=MAX_RETRIES)
+
+    stop_pages = {}   # 行政区 -> 最后一个有效页的页码
+    resumed = {name: set() for name in district_urls}   # 断点清单中已完成的页面
+    if cache is not None:
+        for district_name in district_urls:
+            resumed[district_name], stop_page = cache.resume_state(district_name)
+            if stop_page is not None:
+                stop_pages[district_name] = stop_page
+        if any(resumed.values()):
+            print(f"  断点续爬：{sum(len(pages) for pages in resumed.values())} 个页面已完成，直接使用缓存。")
+    lock = threading.Lock()
+    pending = {name: {} for name in district_urls}   # 已完成但尚未按顺序产出的页面
+    next_page = {name: 1 for name in district_urls}
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # 按“页码优先”的顺序生成任务，使各区交错抓取，避免单区限速阻塞所有线程
+            def tasks():
+                for page in range(1, max_pages + 1):
+                    for district_name, district_url in district_urls.items():
+                        with lock:
+                            stop_page = stop_pages.get(district_name)
+                        if stop_page is not None and page > stop_page:
+                            continue
+                        yield district_name, page, f"{district_url.rstrip('/')}/pg{page}/"
+
+            # 有界提交：同时在途的任务不超过 window 个，处理完的任务立即释放，
+            # 内存中只保留窗口内的页面，与总页数无关
+            task_iter = tasks()
+            window = concurrency * 2
+            futures = {}
+
+            def submit_next():
+                for district_name, page, page_url in task_iter:
+                    future = executor.submit(_fetch_and_parse, fetcher, district_name, page, page_url,
+                                             stop_pages, lock, cache, parser, parse_pool,
+                                             page in resumed[district_name])
+                    futures[future] = (district_name, page)
+                    return True
+                return False
+
+            while len(futures) < window and submit_next():
+                pass
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    district_name, page = futures.pop(future)
+                    status, page_data = future.result()
+                    if status in ('not_found', 'empty', 'error'):
+                        if status == 'not_found':
+                            print(f"  {district_name} 第 {page} 页不存在 (404)，结束抓取该区。")
+                        elif status == 'empty':
+                            print(f"  {district_name} 第 {page} 页没有数据，结束抓取该区。")
+                        with lock:
+                            stop_pages[district_name] = min(page - 1, stop_pages.get(district_name, page))
+                    if status != 'ok':
+                        page_data = None
+                    pending[district_name][page] = page_data
+                    submit_next()
+
+                    # 按页码顺序产出，丢弃停止页之后的页面
+                    while next_page[district_name] in pending[district_name]:
+                        current = next_page[district_name]
+                        data = pending[district_name].pop(current)
+                        next_page[district_name] += 1
+                        stop_page = stop_pages.get(district_name)
+                        if data and (stop_page is None or current <= stop_page):
+                            yield district_name, current, data
+    finally:
+        if own_fetcher:
+            fetcher.close()
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+
+def reparse_cache(cache_path=None, district=None, parser_backend=None):
+    """
+    离线重新解析缓存中的页面（解析器修改后使用，无需重新抓取）。
+    cache_path 默认为默认城市的页面缓存。
+    产出：(district_name, page, page_data)，与 crawl() 一致
+    """
+    parser = get_parser(parser_backend)
+    cache = PageCache(cache_path or get_city().crawl_cache_path, ttl=None)
+    try:
+        for district_name, page, html in cache.iter_pages(district):
+            page_data = parser(html, district_name)
+            if page_data:
+                yield district_name, page, page_data
+    finally:
+        cache.close()
+
+
+def _make_fetcher(city, concurrency=CONCURRENCY):
+    """为城市创建独立的抓取引擎（连接池与限速器），Referer 指向该城市的列表页"""
+    limiter = RateLimiter(global_rate=GLOBAL_RATE, per_key_rate=DISTRICT_RATE, per_key_rates=DISTRICT_RATES)
+    return Fetcher(headers=dict(HEADERS, Referer=city.base_url), concurrency=concurrency, limiter=limiter,
+                   max_retries=MAX_RETRIES)
+
+
+def crawl_city(city, offline=False, snapshot=None):
+    """
+    抓取单个城市的全部行政区，写入该城市原始数据目录下的当天快照。
+    返回 (抓取条数, 预览记录列表)。
+    """
+    preview = []
+    prefix = f"[{city.name}]"
+    if offline:
+        print(f"{prefix} 离线模式：重新解析缓存 {city.crawl_cache_path} 中的页面")
+        pages = reparse_cache(city.crawl_cache_path)
+        cache = fetcher = None
+    else:
+        cache = PageCache(city.crawl_cache_path, ttl=CACHE_TTL) if USE_CACHE else None
+        fetcher = _make_fetcher(city)
+        pages = crawl(city.district_urls(), fetcher=fetcher, cache=cache)
+
+    writer = PartitionedWriter(city.raw_dir, batch_size=WRITE_BATCH_SIZE, snapshot=snapshot)
+    deduper = ListingDeduper(city.crawl_seen_path, DEDUP_CAPACITY, DEDUP_ERROR_RATE) if DEDUP else None
+    try:
+        for district_name, page, page_data in pages:
+            if deduper is not None:
+                page_data = deduper.filter(page_data, district_name, page)
+            writer.write(page_data)
+            if len(preview) < 5:
+                preview.extend(page_data[:5 - len(preview)])
+            print(f"  {prefix} {district_name} 第 {page} 页成功抓取 {len(page_data)} 条数据。当前总数: {writer.total}")
+    finally:
+        writer.close()
+        if cache is not None:
+            cache.close()
+        if fetcher is not None:
+            fetcher.close()
+        if deduper is not None:
+            deduper.report(prefix)
+            deduper.close()
+    return writer.total, preview
+
+
+def main(offline=False, cities=None):
+    """
+    主函数，并行抓取各城市所有行政区的多页房源信息，按区分批流式写入 Parquet。
+    参数：
+        offline: 为 True 时不联网，仅重新解析页面缓存中的HTML
+        cities: 城市代码列表，默认为 cities.json 中启用的全部城市
+    """
+    cities = [get_city(code) for code in cities] if cities else enabled_cities()
     print("\n" + "="*20 + " 开始基于预设列表进行分区域爬取 " + "="*20)
-    
-    # --- 核心修改：直接遍历硬编码的字典 ---
-    for district_name, district_url in DISTRICT_URLS.items():
-        print(f"\n--- 正在处理行政区: {district_name} ---")
-        for page in range(1, MAX_PAGES_PER_DISTRICT + 1):
-            page_url = f"{district_url.rstrip('/')}/pg{page}/"
-            print(f"  正在抓取第 {page} 页: {page_url}")
-            
+    print(f"城市: {', '.join(city.name for city in cities)}")
+    if not offline:
+        print(f"每个城市并发数: {CONCURRENCY}，全局限速: {GLOBAL_RATE} 次/秒，单区限速: {DISTRICT_RATE} 次/秒")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(cities)) as executor:
+        futures = {executor.submit(crawl_city, city, offline): city for city in cities}
+        for future in as_completed(futures):
+            city = futures[future]
             try:
-                response = requests.get(page_url, headers=HEADERS, timeout=10)
-                if response.status_code == 404:
-                    print(f"  第 {page} 页不存在 (404)，结束抓取 {district_name} 区。")
-                    break
-                response.raise_for_status()
-                
-                page_data = parse_page(response.text, district_name)
-                
-                if not page_data:
-                    print(f"  第 {page} 页没有数据，结束抓取 {district_name} 区。")
-                    break
-                    
-                all_data.extend(page_data)
-                print(f"  成功抓取 {len(page_data)} 条数据。当前总数: {len(all_data)}")
-                
-                # 随机延迟，防止被封禁
-                sleep_time = random.uniform(1.5, 3.5)
-                time.sleep(sleep_time)
-                
-            except requests.RequestException as e:
-                print(f"  请求第 {page} 页失败: {e}")
-                break
-
-    # 保存数据
-    if all_data:
-        df = pd.DataFrame(all_data)
-        cols_order = [
-            'Title', 'Community', 'District', 'SubDistrict', 'TotalPrice', 'UnitPrice', 'Area', 
-            'Layout', 'Orientation', 'Decoration', 'Floor', 'YearBuilt', 'BuildingType', 
-            'Followers', 'Elevator'
-        ]
-        df = df.reindex(columns=cols_order)
-        
-        df.to_csv('chengdu_raw_data.csv', index=False, encoding='utf-8-sig')
-        print(f"\n" + "="*20 + " 全部抓取完成 " + "="*20)
-        print(f"共抓取 {len(df)} 条房源信息。")
-        print("原始数据已保存至 chengdu_raw_data.csv")
-        print("\n数据预览:")
-        print(df.head())
-    else:
-        print("未能抓取到任何数据。")
+                results[city.code] = future.result()
+            except Exception as e:
+                print(f"[{city.name}] 抓取失败: {e}")
+
+    print(f"\n" + "="*20 + " 全部抓取完成 " + "="*20)
+    for city in cities:
+        total, preview = results.get(city.code, (0, []))
+        if total:
+            print(f"{city.name}: 共抓取 {total} 条房源信息，原始数据已按行政区和快照分区保存至 {city.raw_dir}/")
+            print(pd.DataFrame(preview).reindex(columns=RAW_COLUMNS))
+        else:
+            print(f"{city.name}: 未能抓取到任何数据。")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    import sys
+    # 用法：python scraper.py [--offline] [--city=城市代码,城市代码]
+    city_arg = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--city=')), None)
+    with run_report('scrape'):
+        main(offline='--offline' in sys.argv, cities=city_arg.split(',') if city_arg else None)
\ No newline at end of file
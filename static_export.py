@@ -0,0 +1,344 @@
+# static_export.py
+# ------------------------------------------
+# 本脚本把首页的图表和机器学习结果导出为自包含的静态站点，任何静态文件服务器都可以直接托管，
+# 访问时无需 Flask、pandas、pyecharts 或 scikit-learn。
+# 主要功能：
+# 1. 使用与 app.py 相同的 analysis.py 图表函数，每个图表的配置导出为单独的 JSON 文件（charts/<图表>-<哈希>.json）
+# 2. K-Means 散点图的降采样数据导出为 data/kmeans-<哈希>.json（静态服务器忽略查询参数，缩放时不再细化）
+# 3. echarts、地图、词云插件和 bootstrap 下载到 vendor/ 目录（--assets 可指定本地文件目录），页面不再依赖CDN
+# 4. 每个文件按内容哈希命名并生成预压缩的 .gz 版本；导出记录（export.json）保存各图表的输入键，
+#    重新导出时只重新生成输入（聚合立方体、模型产物、相关代码）有变化的图表，并删除不再引用的旧文件
+# 目录结构：static_site/<城市代码>/index.html、dashboard-<哈希>.js、charts/、data/、vendor/、export.json
+# 用法：
+#   python static_export.py [--city=CODE] [--output DIR] [--assets DIR] [--force]
+#   python -m http.server -d static_site/chengdu 8000      # 任意静态服务器均可
+# 依赖库：pyecharts, jinja2, requests, analysis.py, cube.py, model_store.py
+# ------------------------------------------
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+from jinja2 import Environment, FileSystemLoader
+
+from city_config import get_city
+from instrumentation import run_report, timed
+from model_store import load_artifact
+from pipeline import built_artifact_keys, code_fingerprint
+
+EXPORT_DIR = 'static_site'
+EXPORT_MANIFEST = 'export.json'
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_NAME = 'static_index.html'
+# 参与各图表输入键的源代码：修改图表代码后对应图表会重新生成
+CHART_CODE = ['analysis.py', 'cube.py', 'downsample.py', 'static_export.py', 'cities.json']
+# 页面使用的样式表（下载后随站点发布）
+BOOTSTRAP_CSS_URL = 'https://cdn.bootcdn.net/ajax/libs/twitter-bootstrap/5.2.3/css/bootstrap.min.css'
+# 散点图导出的降采样点数
+SCATTER_POINTS = 3000
+# 生成 .gz 预压缩版本的文件类型
+COMPRESSIBLE = ('.html', '.json', '.js', '.css')
+
+# 首页图表，顺序与 app.render_index 一致：(名称, 数据来源)
+CHARTS = [
+    ('price_map', 'cube'),
+    ('district_bar', 'cube'),
+    ('kmeans_scatter', 'kmeans'),
+    ('layout_pie', 'cube'),
+    ('community_wordcloud', 'cube'),
+]
+
+# 页面加载脚本：文档解析完成后按 data-chart 读取各图表配置并初始化；配置中的函数以字符串保存，加载时还原
+_DASHBOARD_JS = """
+(function () {
+    function revive(value) {
+        if (typeof value === 'string' && /^\\s*function\\s*\\(/.test(value)) {
+            return new Function('return ' + value)();
+        }
+        if (Array.isArray(value)) {
+            return value.map(revive);
+        }
+        if (value && typeof value === 'object') {
+            Object.keys(value).forEach(function (k) { value[k] = revive(value[k]); });
+        }
+        return value;
+    }
+    function start() {
+        document.querySelectorAll('[data-chart]').forEach(function (el) {
+            fetch(el.getAttribute('data-chart')).then(function (r) { return r.json(); }).then(function (spec) {
+                var chart = echarts.init(el);
+                chart.setOption(revive(spec.options));
+                (spec.js || []).forEach(function (code) { new Function('chart_' + spec.id, code)(chart); });
+                window.addEventListener('resize', function () { chart.resize(); });
+            });
+        });
+    }
+    // 页面中的脚本带 defer，文档解析完后才执行；未带 defer 时等待 DOMContentLoaded，保证图表容器已存在
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+})();
+"""
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def _write(root, relative_path, data):
+    """写入文件（内容未变化时不改写），可压缩的类型同时写出 .gz 版本（内容未变但 .gz 缺失时补写）"""
+    path = os.path.join(root, relative_path)
+    compressible = path.endswith(COMPRESSIBLE)
+    unchanged = False
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            unchanged = f.read() == data
+    if unchanged and (not compressible or os.path.exists(path + '.gz')):
+        return
+    if not unchanged:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    if compressible:
+        # mtime=0：相同内容的压缩结果逐字节一致
+        with open(path + '.gz.tmp', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        os.replace(path + '.gz.tmp', path + '.gz')
+
+
+def _write_hashed(root, directory, stem, data, ext):
+    """按内容哈希命名写入，返回相对路径"""
+    relative_path = f"{directory}/{stem}-{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    _write(root, relative_path, data)
+    return relative_path
+
+
+def _json_bytes(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def chart_spec(name, chart):
+    """
+    图表 -> 可序列化的配置：options 为 echarts 配置（函数以字符串保存），js 为图表附带的脚本。
+    pyecharts 随机生成的图表编号替换为图表名称，使相同数据的导出结果一致。
+    """
+    options = chart.dump_options_with_quotes().replace(chart.chart_id, name)
+    return {
+        'id': name,
+        'options': json.loads(options),
+        'js': [code.replace(chart.chart_id, name) for code in chart.js_functions.items],
+        'width': chart.width,
+        'height': chart.height,
+        'dependencies': list(chart.js_dependencies.items),
+    }
+
+
+def _dependency_urls(dependencies):
+    """pyecharts 依赖名 -> 下载地址（echarts 排在最前）"""
+    from pyecharts.datasets import FILENAMES, EXTRA
+    from pyecharts.globals import CurrentConfig
+
+    urls = []
+    for dep in sorted(set(dependencies), key=lambda d: d != 'echarts'):
+        if dep in FILENAMES:
+            filename, ext = FILENAMES[dep]
+            urls.append(f'{CurrentConfig.ONLINE_HOST}{filename}.{ext}')
+            continue
+        for host, files in EXTRA.items():
+            if dep in files:
+                filename, ext = files[dep]
+                urls.append(f'{host}{filename}.{ext}')
+                break
+        else:
+            print(f"警告: 未知的前端依赖 '{dep}'，已跳过。")
+    return urls
+
+
+def _vendor(root, url, manifest, assets_dir=None):
+    """下载（或从本地目录复制）一个前端依赖到 vendor/，已导出过的直接复用"""
+    existing = manifest['vendor'].get(url)
+    if existing and os.path.exists(os.path.join(root, existing)):
+        return existing
+    name = url.rsplit('/', 1)[-1]
+    local_path = os.path.join(assets_dir, name) if assets_dir else None
+    if local_path and os.path.exists(local_path):
+        with open(local_path, 'rb') as f:
+            data = f.read()
+    else:
+        print(f"  下载 {url}")
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        data = response.content
+    stem, ext = os.path.splitext(name)
+    manifest['vendor'][url] = _write_hashed(root, 'vendor', stem, data, ext)
+    return manifest['vendor'][url]
+
+
+def _model_keys(city):
+    """城市流水线最近一次构建的模型产物键，没有构建记录时返回 None"""
+    keys = built_artifact_keys(city.code)
+    return keys if keys and keys.get('kmeans') and keys.get('price_model') else None
+
+
+def _load_manifest(root):
+    path = os.path.join(root, EXPORT_MANIFEST)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'charts': {}, 'ml': None, 'vendor': {}}
+
+
+def _remove_unreferenced(root, referenced):
+    """删除 charts/、data/、vendor/ 中不再被引用的文件（含 .gz）及旧版加载脚本"""
+    candidates = [os.path.join(d, name) for d in ('charts', 'data', 'vendor')
+                  if os.path.isdir(os.path.join(root, d)) for name in os.listdir(os.path.join(root, d))]
+    candidates += [name for name in os.listdir(root) if name.startswith('dashboard-')]
+    for relative_path in candidates:
+        base = relative_path[:-3] if relative_path.endswith('.gz') else relative_path
+        if base.replace(os.sep, '/') not in referenced:
+            os.remove(os.path.join(root, relative_path))
+
+
+def export_site(city=None, output_dir=None, assets_dir=None, force=False):
+    """
+    导出城市首页的静态站点，返回 {图表: 'built' / 'skipped'}；缺少数据或模型时返回 None。
+    force 为 True 时忽略导出记录，重新生成全部图表。
+    """
+    from cube import cube_key, load_or_build_cube
+
+    city = get_city(city)
+    root = output_dir or os.path.join(EXPORT_DIR, city.code)
+    if not os.path.exists(city.viz_path):
+        print(f"错误: 未找到清洗后的数据 '{city.viz_path}'。请先运行 pipeline.py。")
+        return None
+    keys = _model_keys(city)
+    if keys is None:
+        print("错误: 没有可用的模型结果。请先运行 pipeline.py。")
+        return None
+
+    os.makedirs(root, exist_ok=True)
+    manifest = {'charts': {}, 'ml': None, 'vendor': {}} if force else _load_manifest(root)
+    code = code_fingerprint(CHART_CODE)
+    sources = {'cube': cube_key(city.viz_path), 'kmeans': keys['kmeans']}
+    loaded = {}
+
+    def resource(name):
+        # 只有需要重新生成的图表才加载立方体或聚类结果
+        if name not in loaded:
+            with timed('export_stage_seconds', stage=f'load_{name}'):
+                if name == 'cube':
+                    loaded[name] = load_or_build_cube(city.viz_path)
+                else:
+                    loaded[name] = load_artifact('kmeans', keys['kmeans'], mmap_mode='r')[1]
+        return loaded[name]
+
+    status = {}
+    charts = {}
+    for name, source in CHARTS:
+        key = _digest(name, sources[source], code, city.code)
+        entry = manifest['charts'].get(name)
+        if entry and entry['key'] == key and all(os.path.exists(os.path.join(root, p)) for p in entry['files']):
+            charts[name] = entry
+            status[name] = 'skipped'
+            continue
+        with timed('export_stage_seconds', stage=name):
+            charts[name] = _build_chart(root, name, key, resource, city)
+        status[name] = 'built'
+    manifest['charts'] = charts
+
+    # 机器学习结果表格直接渲染进页面，内容保存在导出记录中，模型未变化时无需重新加载
+    ml_key = _digest(keys['kmeans'], keys['price_model'])
+    if force or not manifest['ml'] or manifest['ml']['key'] != ml_key:
+        kmeans = resource('kmeans')
+        price = load_artifact('price_model', keys['price_model'])[1]
+        manifest['ml'] = {'key': ml_key, 'content': {
+            'cluster_summary_html': kmeans['cluster_summary'].to_html(classes='table table-striped text-center'),
+            'model_eval': {k: float(v) for k, v in price['evaluation'].items()},
+            'feature_imp_html': price['feature_importances'].to_frame(name='Importance').to_html(
+                classes='table table-striped text-center'),
+        }}
+        status['ml_tables'] = 'built'
+    else:
+        status['ml_tables'] = 'skipped'
+
+    # 前端依赖与加载脚本
+    dependencies = [dep for entry in charts.values() for dep in entry['dependencies']]
+    scripts = [_vendor(root, url, manifest, assets_dir) for url in _dependency_urls(dependencies)]
+    stylesheets = [_vendor(root, BOOTSTRAP_CSS_URL, manifest, assets_dir)]
+    dashboard = _write_hashed(root, '.', 'dashboard', _DASHBOARD_JS.encode('utf-8'), '.js')[2:]
+    scripts.append(dashboard)
+    manifest['vendor'] = {url: path for url, path in manifest['vendor'].items() if path in scripts + stylesheets}
+
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+    html = env.get_template(TEMPLATE_NAME).render(
+        city_name=city.name, scripts=scripts, stylesheets=stylesheets, ml=manifest['ml']['content'],
+        charts=[{'file': charts[name]['files'][0], 'width': charts[name]['width'], 'height': charts[name]['height']}
+                for name, _ in CHARTS],
+        generated_at=time.strftime('%Y-%m-%d %H:%M', time.localtime(os.path.getmtime(city.viz_path))),
+    )
+    _write(root, 'index.html', html.encode('utf-8'))
+
+    referenced = {p for entry in charts.values() for p in entry['files']} | set(scripts) | set(stylesheets)
+    _remove_unreferenced(root, referenced)
+    with open(os.path.join(root, EXPORT_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    built = [name for name, s in status.items() if s == 'built']
+    print(f"静态站点已导出至: {root}/（重新生成 {len(built)} 项: {', '.join(built) or '无'}）")
+    return status
+
+
+def _build_chart(root, name, key, resource, city):
+    """生成一个图表的配置文件（散点图另有降采样数据文件），返回导出记录项"""
+    import analysis
+    from downsample import grid_downsample
+    from machine_learning import clustered_frame
+
+    files = []
+    if name == 'kmeans_scatter':
+        df = clustered_frame(resource('kmeans'))
+        data = grid_downsample(df['Area'].to_numpy(), df['TotalPrice'].to_numpy(), SCATTER_POINTS,
+                               groups=df['Cluster'].to_numpy())
+        data_file = _write_hashed(root, 'data', 'kmeans', _json_bytes(data), '.json')
+        files.append(data_file)
+        # 页面位于站点根目录，数据地址使用相对路径
+        chart = analysis.create_kmeans_scatter(df, data_url=data_file, max_points=SCATTER_POINTS)
+    elif name == 'price_map':
+        chart = analysis.create_price_map(resource('cube'), city.code)
+    else:
+        chart = getattr(analysis, f'create_{name}')(resource('cube'))
+
+    spec = chart_spec(name, chart)
+    chart_file = _write_hashed(root, 'charts', name, _json_bytes(
+        {k: spec[k] for k in ('id', 'options', 'js')}), '.json')
+    return {'key': key, 'files': [chart_file] + files, 'width': spec['width'], 'height': spec['height'],
+            'dependencies': spec['dependencies']}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='导出首页为静态站点')
+    arg_parser.add_argument('--city', help='城市代码（默认: cities.json 中的默认城市）')
+    arg_parser.add_argument('--output', help=f'输出目录（默认: {EXPORT_DIR}/<城市代码>）')
+    arg_parser.add_argument('--assets', help='前端依赖文件所在的本地目录（按文件名查找，找不到时从CDN下载）')
+    arg_parser.add_argument('--force', action='store_true', help='忽略导出记录，重新生成全部图表')
+    args = arg_parser.parse_args()
+    try:
+        with run_report('static_export', save=False):
+            status = export_site(args.city, args.output, args.assets, args.force)
+    except (ValueError, requests.RequestException) as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+    if status is None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# storage.py
+# ------------------------------------------
+# 本模块为清洗后的数据集提供列式、强类型的存储层。
+# 主要功能：
+# 1. save_table: 按固定的紧凑类型（类别、小整数、float32）写入 Parquet
+# 2. load_table: 只读取需要的列，类别列直接还原为 pandas Categorical；
+#    数据按行政区排序写入、分成较小的行组，按区查询时借助行组统计信息跳过无关的行组
+# 3. iter_table_batches: 分批流式读取，用于分块处理
+# 4. load_mapped_table: 将数据集导出为未压缩的 Arrow IPC 文件并以内存映射方式读取，
+#    数值列直接引用映射的文件页，多个 Web 进程共享同一份物理内存
+# 5. 运行本脚本可生成100万行模拟数据，对比 csv 与 Parquet 的加载耗时和内存占用
+# 依赖库：pandas, pyarrow, synthetic_data.py（仅基准测试）
+# ------------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from model_store import CACHE_DIR, file_fingerprint
+
+# 低基数的重复文本列，存储为字典编码、读取为类别类型
+CATEGORICAL_COLUMNS = [
+    'District', 'SubDistrict', 'Community', 'Layout', 'Orientation', 'Decoration',
+    'Floor', 'BuildingType', 'Elevator', 'Change',
+]
+
+# 已知列的存储类型，未列出的列按数据自动推断
+COLUMN_TYPES = {
+    'Title': pa.string(),
+    'TotalPrice': pa.float32(),
+    'UnitPrice': pa.float32(),
+    'PrevTotalPrice': pa.float32(),
+    'PrevUnitPrice': pa.float32(),
+    'Area': pa.float32(),
+    'YearBuilt': pa.int16(),
+    'Followers': pa.int32(),
+    'RoomCount': pa.int8(),
+    'Cluster': pa.int8(),
+}
+COLUMN_TYPES.update({col: pa.string() for col in CATEGORICAL_COLUMNS})
+# 每个行组的行数：越小按区过滤时跳过得越精确，过小会增加元数据开销
+ROW_GROUP_SIZE = 50_000
+
+
+def _to_arrow(df):
+    """按 COLUMN_TYPES 将 DataFrame 转为 Arrow 表，保证各批次 schema 一致"""
+    arrays, fields = [], []
+    for col in df.columns:
+        series = df[col]
+        pa_type = COLUMN_TYPES.get(col)
+        if pa_type is None:
+            array = pa.array(series, from_pandas=True)
+        elif pa.types.is_string(pa_type):
+            array = pa.array(series.astype(object), type=pa_type, from_pandas=True)
+        else:
+            array = pa.array(series.to_numpy(dtype=pa_type.to_pandas_dtype()), type=pa_type)
+        arrays.append(array)
+        fields.append(pa.field(col, array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def save_table(df, path):
+    """以紧凑类型写入 Parquet 文件（调用方按 District 排序后，每个行组只覆盖少数几个区）"""
+    pq.write_table(_to_arrow(df), path, row_group_size=ROW_GROUP_SIZE)
+
+
+class TableWriter:
+    """分批追加写入同一个 Parquet 文件（分块清洗时使用）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def write(self, df):
+        table = _to_arrow(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_table(path, columns=None, districts=None):
+    """
+    读取数据集，只加载 columns 指定的列。
+    districts 不为空时只返回这些行政区（标准区名）的行，不含这些区的行组不会被读取。
+    Parquet 中的类别列直接读为 Categorical；同时兼容旧版的 csv 文件。
+    """
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, usecols=columns)
+        return df if districts is None else df[df['District'].isin(districts)]
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    available = pq.read_schema(path).names
+    wanted = columns or available
+    dictionary_cols = [c for c in wanted if c in CATEGORICAL_COLUMNS and c in available]
+    filters = [('District', 'in', list(districts))] if districts is not None else None
+    table = pq.read_table(path, columns=columns, read_dictionary=dictionary_cols, filters=filters)
+    return table.to_pandas()
+
+
+def iter_table_batches(path, batch_size=100_000, columns=None):
+    """分批流式读取 Parquet 数据集，每批产出一个 DataFrame"""
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size)
+        return
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def export_ipc(path, cache_dir=CACHE_DIR):
+    """
+    将 Parquet 数据集导出为未压缩的 Arrow IPC 文件（按内容哈希命名，已存在时直接返回路径），
+    同时删除该数据集旧版本的导出文件。多个进程可以同时调用。
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    ipc_path = os.path.join(cache_dir, f'{stem}-{file_fingerprint(path)[:16]}.arrow')
+    if os.path.exists(ipc_path):
+        return ipc_path
+    os.makedirs(cache_dir, exist_ok=True)
+    dictionary_cols = [c for c in pq.read_schema(path).names if c in CATEGORICAL_COLUMNS]
+    table = pq.read_table(path, read_dictionary=dictionary_cols)
+    # 多个工作进程可能同时导出：各自写入唯一的临时文件，内容相同，谁最后替换都可以
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(ipc_path) + '.', suffix='.tmp', dir=cache_dir)
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, ipc_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    for name in os.listdir(cache_dir):
+        if name.startswith(stem + '-') and name.endswith('.arrow') and name != os.path.basename(ipc_path):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass  # 已被其他进程删除
+    return ipc_path
+
+
+def load_mapped_table(path, columns=None):
+    """
+    以内存映射方式读取数据集（首次调用时导出 Arrow IPC 文件，见 export_ipc）。
+    无缺失值的数值列直接引用映射的文件页（只读），由操作系统页缓存在进程间共享；
+    类别列只复制编码，文本列仍会复制为 Python 字符串。csv 文件退回 load_table。
+    """
+    if path.endswith('.csv'):
+        return load_table(path, columns)
+    try:
+        source = pa.memory_map(export_ipc(path), 'r')
+    except FileNotFoundError:
+        # 数据文件刚被更新时，其他进程可能已删除旧版本的导出文件，按当前内容重新导出一次
+        source = pa.memory_map(export_ipc(path), 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.schema.names])
+    # split_blocks 为每列生成独立的块，避免合并数值列时复制映射的数据
+    return table.to_pandas(split_blocks=True)
+
+
+# ==================== 加载性能对比 ====================
+
+def _measure_in_subprocess(path, columns):
+    """在独立子进程中加载数据集，返回耗时、进程常驻内存峰值和 DataFrame 内存占用"""
+    code = (
+        "import json, resource, sys, time\n"
+        "from storage import load_table\n"
+        "path, columns = sys.argv[1], json.loads(sys.argv[2])\n"
+        "start = time.perf_counter()\n"
+        "df = load_table(path, columns)\n"
+        "elapsed = time.perf_counter() - start\n"
+        "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024\n"
+        "mem = df.memory_usage(deep=True).sum() / 1024 ** 2\n"
+        "print(json.dumps({'seconds': elapsed, 'peak_rss_mb': rss, 'frame_mb': mem}))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code, path, json.dumps(columns)],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def storage_report(n_rows=1_000_000):
+    """
+    对比 csv 与 Parquet 在全列读取和列裁剪读取下的加载耗时与内存。
+    返回报告行的列表，每行为字典。
+    """
+    from synthetic_data import generate_cleaned
+
+    df = generate_cleaned(n_rows)
+    projections = {
+        '全部列': None,
+        '分析图表列': ['District', 'UnitPrice', 'TotalPrice', 'Layout', 'Community'],
+        '聚类特征列': ['Area', 'TotalPrice', 'UnitPrice'],
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'cleaned.csv')
+        parquet_path = os.path.join(tmp, 'cleaned.parquet')
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        save_table(df, parquet_path)
+        sizes = {'csv': os.path.getsize(csv_path), 'parquet': os.path.getsize(parquet_path)}
+        for fmt, path in (('csv', csv_path), ('parquet', parquet_path)):
+            for name, columns in projections.items():
+                stats = _measure_in_subprocess(path, columns)
+                stats.update({'format': fmt, 'columns': name, 'file_mb': sizes[fmt] / 1024 ** 2})
+                rows.append(stats)
+    return rows
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"正在生成 {n} 行模拟数据并对比加载性能...")
+    report = pd.DataFrame(storage_report(n))
+    report = report[['format', 'columns', 'file_mb', 'seconds', 'peak_rss_mb', 'frame_mb']].round(2)
+    print(report.to_string(index=False))
@@ -0,0 +1,171 @@
+# synthetic_data.py
+# ------------------------------------------
+# 本模块用于生成逼真的模拟房源数据，供基准测试使用。
+# 主要功能：
+# 1. generate_raw: 生成与 scraper.parse_page 输出格式一致的原始字符串记录
+#    （如 '123.5万'、'单价15234元/平米'、'89.5平米'、'12人关注'），包含少量缺失年份和面积异常值
+# 2. iter_listing_pages: 将记录渲染为链家列表页结构的HTML，可直接交给各解析后端
+# 3. write_raw_dataset: 分块生成并写入按区分区的原始数据目录，支持千万行规模
+# 4. generate_cleaned: 直接生成清洗后结构的数据（storage.py、listing_bench.py 的基准测试使用）
+# 相同的 seed 与行数总是生成相同的数据。
+# 依赖库：pandas, numpy, raw_store.py, scraper.py
+# ------------------------------------------
+
+import html as html_lib
+
+import numpy as np
+import pandas as pd
+
+from raw_store import RAW_COLUMNS, PartitionedWriter
+from scraper import DISTRICT_URLS
+
+# 各区（网站上的原始区名）单价的大致水平（元/平米）
+DISTRICT_BASE_PRICE = {
+    '锦江': 21000, '青羊': 20000, '武侯': 19000, '高新': 24000, '成华': 16000,
+    '金牛': 15500, '天府新区': 17000, '高新西': 13000, '双流': 12000, '温江': 11000,
+    '郫都': 10500, '龙泉驿': 10000, '新都': 9500, '都江堰': 8000, '青白江': 7000,
+}
+SUB_DISTRICTS_PER_DISTRICT = 20
+COMMUNITIES_PER_SUB_DISTRICT = 40
+ORIENTATIONS = ['南', '南 北', '东南', '东', '西', '西南', '北']
+DECORATIONS = ['精装', '简装', '毛坯', '其他']
+BUILDING_TYPES = ['板楼', '塔楼', '板塔结合', '暂无数据']
+FLOOR_LEVELS = ['低楼层', '中楼层', '高楼层']
+# 每页房源数（与网站一致）
+LISTINGS_PER_PAGE = 30
+
+
+def generate_raw(n_rows, seed=42, start=0):
+    """
+    生成 n_rows 条原始格式的房源记录（DataFrame，列为 RAW_COLUMNS）。
+    start 为记录编号的起点，分块生成时用于保证标题唯一。
+    """
+    rng = np.random.default_rng([seed, start])
+    districts = np.array(list(DISTRICT_URLS))
+    district_idx = rng.integers(0, len(districts), n_rows)
+    district = districts[district_idx]
+    sub_idx = rng.integers(0, SUB_DISTRICTS_PER_DISTRICT, n_rows)
+    community_idx = rng.integers(0, COMMUNITIES_PER_SUB_DISTRICT, n_rows)
+
+    rooms = rng.choice([1, 2, 3, 4, 5], n_rows, p=[0.1, 0.3, 0.4, 0.15, 0.05])
+    halls = np.minimum(rng.integers(1, 3, n_rows), rooms)
+    area = np.clip(rng.normal(30 + 28 * rooms, 12), 18, None)
+    # 约 1% 的面积异常值（别墅、车位等），用于覆盖清洗中的 IQR 过滤
+    outliers = rng.random(n_rows) < 0.01
+    area[outliers] *= rng.uniform(3, 8, outliers.sum())
+    area = area.round(2)
+
+    base = np.array([DISTRICT_BASE_PRICE.get(d, 12000) for d in districts])[district_idx]
+    unit_price = np.maximum(base * rng.lognormal(0, 0.25, n_rows), 3000).astype(np.int64)
+    total_price = (area * unit_price / 10000).round(1)
+
+    total_floors = rng.choice([6, 7, 11, 18, 26, 32, 33], n_rows)
+    year = rng.integers(1985, 2024, n_rows)
+    year_missing = rng.random(n_rows) < 0.05
+    followers = rng.geometric(0.08, n_rows) - 1
+
+    ids = np.arange(start, start + n_rows).astype(str)
+    sub_district = pd.Series(district).str.cat(pd.Series(sub_idx).astype(str), sep='板块')
+    community = sub_district.str.cat(pd.Series(community_idx).astype(str), sep='小区')
+    layout = pd.Series(rooms).astype(str) + '室' + pd.Series(halls).astype(str) + '厅'
+
+    df = pd.DataFrame({
+        'Title': community + ' ' + layout + ' 房源编号' + ids,
+        'Community': community,
+        'District': district,
+        'SubDistrict': sub_district,
+        'TotalPrice': pd.Series(total_price).astype(str) + '万',
+        'UnitPrice': '单价' + pd.Series(unit_price).astype(str) + '元/平米',
+        'Area': pd.Series(area).astype(str) + '平米',
+        'Layout': layout,
+        'Orientation': np.array(ORIENTATIONS)[rng.integers(0, len(ORIENTATIONS), n_rows)],
+        'Decoration': np.array(DECORATIONS)[rng.integers(0, len(DECORATIONS), n_rows)],
+        'Floor': pd.Series(np.array(FLOOR_LEVELS)[rng.integers(0, 3, n_rows)])
+                 + '(共' + pd.Series(total_floors).astype(str) + '层)',
+        'YearBuilt': np.where(year_missing, '暂无数据', pd.Series(year).astype(str) + '年建'),
+        'BuildingType': np.array(BUILDING_TYPES)[rng.integers(0, len(BUILDING_TYPES), n_rows)],
+        'Followers': pd.Series(followers).astype(str) + '人关注',
+        'Elevator': np.where((total_floors > 7) | (rng.random(n_rows) < 0.1), '有电梯', '无电梯'),
+    })
+    return df[RAW_COLUMNS]
+
+
+def iter_raw_chunks(n_rows, chunk_size=100_000, seed=42):
+    """分块生成原始记录，内存占用只与块大小有关"""
+    for start in range(0, n_rows, chunk_size):
+        yield generate_raw(min(chunk_size, n_rows - start), seed, start)
+
+
+def _render_listing(row):
+    e = html_lib.escape
+    house_info = ' | '.join([row.Layout, row.Area, row.Orientation, row.Decoration, row.Floor,
+                             row.YearBuilt, row.BuildingType])
+    elevator = '<span class="elevator">近地铁 有电梯</span>' if row.Elevator == '有电梯' else ''
+    return (
+        '<li class="clear LOGCLICKDATA">'
+        '<div class="info clear">'
+        f'<div class="title"><a href="https://cd.lianjia.com/ershoufang/0.html">{e(row.Title)}</a></div>'
+        '<div class="flood"><div class="positionInfo">'
+        f'<a href="#">{e(row.Community)}</a> - <a href="#">{e(row.SubDistrict)}</a></div></div>'
+        f'<div class="address"><div class="houseInfo">{e(house_info)}</div></div>'
+        f'<div class="followInfo">{e(row.Followers)} / 1个月以前发布</div>'
+        f'<div class="tag">{elevator}<span class="taxfree">房本满五年</span></div>'
+        '<div class="priceInfo">'
+        f'<div class="totalPrice totalPrice2"><span>{e(row.TotalPrice[:-1])}</span><i>万</i></div>'
+        f'<div class="unitPrice"><span>{e(row.UnitPrice)}</span></div>'
+        '</div></div></li>'
+    )
+
+
+def render_listing_page(df):
+    """将若干条记录渲染为一个列表页的HTML"""
+    items = ''.join(_render_listing(row) for row in df.itertuples(index=False))
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>成都二手房</title></head><body>'
+        f'<div class="content"><ul class="sellListContent" log-mod="list">{items}</ul></div>'
+        '</body></html>'
+    )
+
+
+def iter_listing_pages(df, per_page=LISTINGS_PER_PAGE):
+    """按区、每页 per_page 条渲染列表页，产出 (html, 区名)"""
+    for district, group in df.groupby('District', sort=False):
+        for start in range(0, len(group), per_page):
+            yield render_listing_page(group.iloc[start:start + per_page]), district
+
+
+def write_raw_dataset(root, n_rows, chunk_size=100_000, seed=42):
+    """分块生成 n_rows 条记录并写入按区分区的原始数据目录（同 scraper 的输出）"""
+    with PartitionedWriter(root, batch_size=10_000) as writer:
+        for chunk in iter_raw_chunks(n_rows, chunk_size, seed):
+            writer.write(chunk.to_dict(orient='records'))
+    return writer.total
+
+
+def generate_cleaned(n_rows, seed=42):
+    """直接生成与清洗后数据结构一致的模拟数据（供存储与查询的基准测试使用，无需经过清洗）"""
+    rng = np.random.default_rng(seed)
+    districts = ['锦江区', '青羊区', '武侯区', '高新区', '成华区', '金牛区', '四川天府新区', '双流区',
+                 '温江区', '郫都区', '龙泉驿区', '新都区', '都江堰市', '青白江区']
+    layouts = ['1室1厅', '2室1厅', '2室2厅', '3室1厅', '3室2厅', '4室2厅', '5室2厅']
+    area = rng.uniform(30, 200, n_rows).round(2)
+    unit_price = rng.integers(8000, 40000, n_rows).astype(float)
+    layout_idx = rng.integers(0, len(layouts), n_rows)
+    return pd.DataFrame({
+        'Title': [f'房源{i}' for i in range(n_rows)],
+        'Community': [f'小区{i}' for i in rng.integers(0, 5000, n_rows)],
+        'District': np.array(districts)[rng.integers(0, len(districts), n_rows)],
+        'SubDistrict': [f'板块{i}' for i in rng.integers(0, 300, n_rows)],
+        'TotalPrice': (area * unit_price / 10000).round(1),
+        'UnitPrice': unit_price,
+        'Area': area,
+        'Layout': np.array(layouts)[layout_idx],
+        'Orientation': np.array(['南', '南 北', '东南', '西'])[rng.integers(0, 4, n_rows)],
+        'Decoration': np.array(['精装', '简装', '毛坯', '其他'])[rng.integers(0, 4, n_rows)],
+        'Floor': np.array(['低楼层(共18层)', '中楼层(共32层)', '高楼层(共6层)'])[rng.integers(0, 3, n_rows)],
+        'YearBuilt': rng.integers(1990, 2023, n_rows),
+        'BuildingType': np.array(['板楼', '塔楼', '板塔结合'])[rng.integers(0, 3, n_rows)],
+        'Followers': rng.integers(0, 500, n_rows),
+        'Elevator': np.array(['有电梯', '无电梯'])[rng.integers(0, 2, n_rows)],
+        'RoomCount': layout_idx // 2 + 1,
+    })
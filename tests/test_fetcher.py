@@ -0,0 +1,150 @@
+# tests/test_fetcher.py
+# ------------------------------------------
+# 抓取引擎与分页抓取测试：在本地临时端口启动 http.server 桩服务器，按路径返回预设的响应序列，
+# 校验 5xx 退避重试、429 按 Retry-After 等待、全局限速、404 停止翻页以及缓存命中时不再发请求。
+# 用法：python -m pytest -q tests
+# 依赖库：pytest, requests, fetcher.py, scraper.py, crawl_cache.py
+# ------------------------------------------
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawl_cache import PageCache
+from fetcher import Fetcher, RateLimiter
+from scraper import crawl
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'parser_corpus')
+
+with open(os.path.join(CORPUS_DIR, 'normal.html'), encoding='utf-8') as f:
+    LISTING_HTML = f.read()
+
+
+class StubServer:
+    """按路径返回预设响应序列的桩服务器（序列用完后重复最后一个响应），并记录每个请求的路径和时间"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append((self.path, time.monotonic()))
+                    responses = stub.routes.get(self.path, [(404, {}, '')])
+                    status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def route(self, path, *responses):
+        self.routes[path] = list(responses)
+
+    def hits(self, path=None):
+        return [t for p, t in self.requests if path is None or p == path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = Fetcher(concurrency=2, max_retries=3, backoff=0.01, timeout=5)
+    yield fetcher
+    fetcher.close()
+
+
+def _listing_district(stub, pages):
+    """在 /d/ 下配置 pages 页正常列表页，之后的页码返回 404"""
+    for page in range(1, pages + 1):
+        stub.route(f'/d/pg{page}/', (200, {}, LISTING_HTML))
+    return {'锦江': f'{stub.base_url}/d/'}
+
+
+def test_retries_5xx_with_backoff(stub, fetcher):
+    stub.route('/flaky', (503, {}, ''), (502, {}, ''), (200, {}, 'ok'))
+    response = fetcher.fetch(f'{stub.base_url}/flaky')
+    assert response.status_code == 200
+    assert response.text == 'ok'
+    assert len(stub.hits('/flaky')) == 3
+
+
+def test_gives_up_after_max_retries(stub, fetcher):
+    stub.route('/down', (500, {}, ''))
+    response = fetcher.fetch(f'{stub.base_url}/down')
+    assert response.status_code == 500
+    assert len(stub.hits('/down')) == fetcher.max_retries + 1
+
+
+def test_429_waits_for_retry_after(stub, fetcher):
+    stub.route('/limited', (429, {'Retry-After': '1'}, ''), (200, {}, 'ok'))
+    response = fetcher.fetch(f'{stub.base_url}/limited')
+    assert response.status_code == 200
+    first, second = stub.hits('/limited')
+    # 退避时间只有几十毫秒，间隔达到 1 秒说明遵守了 Retry-After
+    assert second - first >= 0.9
+
+
+def test_global_rate_limit(stub):
+    stub.route('/page', (200, {}, 'ok'))
+    fetcher = Fetcher(concurrency=4, limiter=RateLimiter(global_rate=10), timeout=5)
+    try:
+        for _ in range(6):
+            assert fetcher.fetch(f'{stub.base_url}/page').status_code == 200
+    finally:
+        fetcher.close()
+    hits = stub.hits('/page')
+    # 令牌桶容量为 1：第一个请求立即发出，之后每 0.1 秒一个
+    assert len(hits) == 6
+    assert hits[-1] - hits[0] >= 0.45
+
+
+def test_404_stops_pagination(stub, fetcher):
+    district_urls = _listing_district(stub, pages=2)
+    results = list(crawl(district_urls, max_pages=10, concurrency=1, fetcher=fetcher, parse_workers=0))
+    assert [page for _, page, _ in results] == [1, 2]
+    assert all(data for _, _, data in results)
+    requested = {path for path, _ in stub.requests}
+    # 预取窗口内可能多请求一两页，但不会一直翻到 max_pages
+    assert '/d/pg10/' not in requested
+
+
+def test_cache_hits_skip_network(stub, fetcher, tmp_path):
+    district_urls = _listing_district(stub, pages=2)
+    cache = PageCache(str(tmp_path / 'crawl_cache.sqlite'), ttl=3600)
+    try:
+        first = list(crawl(district_urls, max_pages=5, concurrency=1, fetcher=fetcher, cache=cache, parse_workers=0))
+        requests_after_first = len(stub.requests)
+        assert requests_after_first > 0
+
+        second = list(crawl(district_urls, max_pages=5, concurrency=1, fetcher=fetcher, cache=cache, parse_workers=0))
+    finally:
+        cache.close()
+    assert len(stub.requests) == requests_after_first
+    assert [(d, p, data) for d, p, data in second] == [(d, p, data) for d, p, data in first]
@@ -0,0 +1,62 @@
+# tests/test_incremental_cleaner.py
+# ------------------------------------------
+# 增量清洗与全量清洗的一致性测试：在临时目录中生成模拟原始数据，
+# 先在空状态上做首次增量清洗，再写入包含新增、调价和下架房源的新快照做一次增量清洗，
+# 每次都与对最新快照的全量清洗（data_cleaner.clean_data）结果比较。
+# 用法：python -m pytest -q tests
+# 依赖库：pytest, pandas, data_cleaner.py, incremental_cleaner.py, raw_store.py, synthetic_data.py
+# ------------------------------------------
+
+import pandas as pd
+import pytest
+
+from data_cleaner import clean_data
+from raw_store import PartitionedWriter
+from storage import load_table
+from synthetic_data import generate_raw
+
+N_ROWS = 2000
+
+
+def _write_snapshot(root, raw, snapshot):
+    with PartitionedWriter(root, batch_size=500, snapshot=snapshot) as writer:
+        writer.write(raw.to_dict(orient='records'))
+
+
+def _clean_both(root):
+    """对最新快照分别做增量清洗与全量清洗，返回两份可视化数据（按全部列排序，消除行顺序差异）"""
+    clean_data(root, 'incremental.parquet', 'incremental.npz', 'incremental_vocab.json',
+               refit_vocab=True, incremental=True)
+    clean_data(root, 'full.parquet', 'full.npz', 'full_vocab.json', refit_vocab=True)
+    frames = []
+    for path in ('incremental.parquet', 'full.parquet'):
+        df = load_table(path)
+        df = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        frames.append(df.sort_values(list(df.columns), kind='stable').reset_index(drop=True))
+    return frames
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # 模型缓存（立方体）和清洗状态都写在工作目录下
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_first_run_on_empty_state_then_delta_matches_full_clean(workdir):
+    root = 'chengdu_raw_data'
+    raw = generate_raw(N_ROWS, seed=3)
+    _write_snapshot(root, raw, '2024-01-01')
+
+    incremental, full = _clean_both(root)
+    assert len(incremental) > 0
+    pd.testing.assert_frame_equal(incremental, full)
+
+    # 新快照：下架前 100 条，调价 100 条，新增 200 条
+    changed = raw.iloc[100:].copy()
+    changed.iloc[:100, changed.columns.get_loc('TotalPrice')] = '999万'
+    added = generate_raw(200, seed=4, start=N_ROWS)
+    _write_snapshot(root, pd.concat([changed, added], ignore_index=True), '2024-01-02')
+
+    incremental, full = _clean_both(root)
+    pd.testing.assert_frame_equal(incremental, full)
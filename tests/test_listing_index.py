@@ -0,0 +1,38 @@
+# tests/test_listing_index.py
+# ------------------------------------------
+# 房源查询索引测试：float32 存储的数值列在闭区间边界上的匹配结果与布尔掩码扫描一致。
+# 用法：python -m pytest -q tests
+# 依赖库：pytest, numpy, pandas, listing_index.py, listing_bench.py, synthetic_data.py
+# ------------------------------------------
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from listing_bench import TYPICAL_QUERIES, boundary_queries, check_counts, mask_scan
+from listing_index import ListingIndex
+from synthetic_data import generate_cleaned
+
+
+@pytest.fixture
+def prices():
+    return pd.DataFrame({
+        'District': ['锦江区', '武侯区', '锦江区', '青羊区'],
+        'TotalPrice': np.array([96.9, 96.9, 96.9, 120.5], dtype=np.float32),
+        'Area': np.array([60.1, 88.8, 70.0, 95.3], dtype=np.float32),
+    })
+
+
+def test_inclusive_bounds_match_float32_values(prices):
+    index = ListingIndex(prices)
+    ranges = {'TotalPrice': (96.9, 96.9)}
+    assert index.query(ranges=ranges)['total'] == 3
+    assert mask_scan(prices, ranges=ranges) == 3
+    assert index.query(ranges={'TotalPrice': (None, 96.9)})['total'] == 3
+    assert index.query(ranges={'TotalPrice': (96.9, None)})['total'] == 4
+    assert index.query(ranges={'Area': (88.8, 95.3)})['total'] == 2
+
+
+def test_index_counts_match_mask_scan():
+    df = generate_cleaned(5000)
+    assert check_counts(ListingIndex(df), df, TYPICAL_QUERIES + boundary_queries(df)) == 0
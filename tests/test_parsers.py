@@ -0,0 +1,80 @@
+# tests/test_parsers.py
+# ------------------------------------------
+# 页面解析后端一致性测试：在 tests/parser_corpus 的小型HTML语料上比较
+# lxml 快速解析器与 BeautifulSoup 参考实现的输出，并校验关键字段。
+# 语料覆盖：普通房源、缺失字段、推广位与推广房源、无电梯标签、空列表页。
+# 用法：python -m pytest -q tests
+# 依赖库：pytest, scraper.py, listing_parser.py, parser_bench.py
+# ------------------------------------------
+
+import os
+
+import pytest
+
+from parser_bench import check_equivalence, load_corpus
+from scraper import PARSERS
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'parser_corpus')
+DISTRICT = '锦江'
+
+
+def _read(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name', sorted(n for n in os.listdir(CORPUS_DIR) if n.endswith('.html')))
+@pytest.mark.parametrize('backend', [b for b in PARSERS if b != 'bs4'])
+def test_backend_matches_reference(name, backend):
+    html = _read(name)
+    assert PARSERS[backend](html, DISTRICT) == PARSERS['bs4'](html, DISTRICT)
+
+
+def test_corpus_check_passes():
+    pages = load_corpus(CORPUS_DIR)
+    assert len(pages) == 5
+    assert check_equivalence(pages) == 0
+
+
+@pytest.mark.parametrize('backend', sorted(PARSERS))
+def test_normal_page(backend):
+    data = PARSERS[backend](_read('normal.html'), DISTRICT)
+    assert len(data) == 2
+    first = data[0]
+    assert first['Title'] == '南北通透 三室两厅'
+    assert first['Community'] == '锦江花园'
+    assert first['District'] == DISTRICT
+    assert (first['Layout'], first['Area'], first['BuildingType']) == ('3室2厅', '98.5平米', '板楼')
+    assert (first['TotalPrice'], first['UnitPrice']) == ('185万', '18,782元/平')
+    assert first['Followers'] == '12人关注'
+    assert first['Elevator'] == '有电梯'
+    assert first['ListingId'] == '106112345678'
+    assert data[1]['Elevator'] == '有电梯'
+
+
+@pytest.mark.parametrize('backend', sorted(PARSERS))
+def test_missing_tags_skip_listing(backend):
+    data = PARSERS[backend](_read('missing_tags.html'), DISTRICT)
+    # 只有“信息不全的别墅”保留下来：缺失的房屋信息字段补为“未知”，没有房源编号
+    assert [row['Title'] for row in data] == ['信息不全的别墅']
+    assert data[0]['Decoration'] == '未知'
+    assert data[0]['ListingId'] is None
+
+
+@pytest.mark.parametrize('backend', sorted(PARSERS))
+def test_promoted_listing(backend):
+    data = PARSERS[backend](_read('promoted.html'), DISTRICT)
+    assert len(data) == 1
+    assert data[0]['ListingId'] == '106199999999'
+    assert data[0]['Elevator'] == '有电梯'
+
+
+@pytest.mark.parametrize('backend', sorted(PARSERS))
+def test_no_elevator_tag(backend):
+    data = PARSERS[backend](_read('no_elevator.html'), DISTRICT)
+    assert [row['Elevator'] for row in data] == ['无电梯', '无电梯']
+
+
+@pytest.mark.parametrize('backend', sorted(PARSERS))
+def test_empty_page(backend):
+    assert PARSERS[backend](_read('empty.html'), DISTRICT) == []
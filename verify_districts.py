@@ -2,36 +2,52 @@
 # ------------------------------------------
 # 本脚本用于检查清洗后数据中的行政区名称标准化情况。
 # 主要功能：
-# 1. 读取清洗后数据，打印所有唯一行政区名称
-# 2. 提示用户是否存在未标准化的区名
-# 依赖库：pandas
+# 1. 读取清洗后数据（只读 District 一列），打印所有唯一行政区名称及行数
+# 2. 对照城市配置（cities.json）自动找出未标准化的区名，存在时以退出码 1 结束
+# 完整的数据质量检查见 data_validator.py。
+# 依赖库：pandas, storage.py, data_validator.py
 # ------------------------------------------
 
-import pandas as pd
+import sys
 
-def check_district_names(filepath='chengdu_cleaned_data.csv'):
+from city_config import get_city
+from data_validator import KnownDistricts, known_districts
+from storage import load_table
+
+def check_district_names(filepath=None, city=None):
     """
-    读取清洗后的数据文件，并打印出所有唯一的区县名称。
+    读取清洗后的数据文件，打印所有唯一的区县名称，返回未标准化的区名 {区名: 行数}。
+    只读取 District 一列。文件不存在或缺少该列时返回 None。
     """
+    city = get_city(city)
+    filepath = filepath or city.viz_path
     try:
-        df = pd.read_csv(filepath)
-        unique_districts = df['District'].unique()
-        
-        print("-" * 50)
-        print(f"在文件 '{filepath}' 中找到的唯一区县名称如下：")
-        print("-" * 50)
-        
-        for district in sorted(unique_districts):
-            print(district)
-            
-        print("-" * 50)
-        print("请检查以上列表，是否存在未被标准化的名称（如 '武侯', '高新' 等）。")
-        print("如果存在，说明您需要重新运行 2_data_cleaner.py 脚本。")
-        
+        df = load_table(filepath, columns=['District'])
     except FileNotFoundError:
         print(f"错误: 找不到文件 '{filepath}'。请先运行 2_data_cleaner.py。")
+        return None
     except KeyError:
         print(f"错误: 文件 '{filepath}' 中找不到 'District' 列。")
+        return None
+
+    counts = df['District'].value_counts()
+    print("-" * 50)
+    print(f"在文件 '{filepath}' 中找到的唯一区县名称如下：")
+    print("-" * 50)
+    for district in sorted(counts.index[counts > 0]):
+        print(f"{district}  {counts[district]}")
+    print("-" * 50)
+
+    rule = KnownDistricts(known_districts(city))
+    rule.update(df)
+    if rule.unknown:
+        print(f"以下区名不在 {city.name} 的城市配置中，可能未被标准化: {', '.join(rule.unknown)}")
+        print("请在 cities.json 的 district_names 中补充映射后重新运行 2_data_cleaner.py。")
+    else:
+        print("所有区名均已标准化。")
+    return rule.unknown
 
 if __name__ == '__main__':
-    check_district_names()
\ No newline at end of file
+    city_arg = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--city=')), None)
+    unknown = check_district_names(city=city_arg)
+    sys.exit(0 if unknown == {} else 1)